@@ -0,0 +1,92 @@
+"""
+Transactions.de_json benchmark on a synthetic payload.
+
+Compares the current single-pass decoding with the previous path
+(json.dumps round-trip per item, setattr copy and datetime.strptime).
+
+Run: python benchmarks/bench_deserialize.py [rows]
+"""
+import json
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, ".")
+from pyPayokAPI.payok_types import Transaction, Transactions, PayoutMethod, PaymentStatus
+
+
+def make_payload(rows):
+    payload = {"status": "success"}
+    for i in range(1, rows + 1):
+        payload[str(i)] = {
+            "transaction": str(1000000 + i),
+            "email": "user{}@example.com".format(i),
+            "amount": "{}.50".format(i % 5000),
+            "currency": "RUB",
+            "currency_amount": "{}.50".format(i % 5000),
+            "comission_percent": "3.5",
+            "comission_fixed": "0",
+            "amount_profit": "{}.00".format(i % 4800),
+            "method": ["card", "qiwi", "yoomoney", "bitcoin"][i % 4],
+            "payment_id": "order-{}".format(i),
+            "description": "Order number {}".format(i),
+            "date": "2024-03-{:02d} 12:{:02d}:{:02d}".format(i % 28 + 1, i % 60, i % 60),
+            "pay_date": "2024-03-{:02d} 12:{:02d}:{:02d}".format(i % 28 + 1, i % 60, i % 60),
+            "transaction_status": str(i % 3),
+            "custom_fields": "",
+            "webhook_status": "1",
+            "webhook_amount": "1",
+        }
+    return payload
+
+
+def legacy_de_json(data):
+    items = []
+    for key, value in data.items():
+        if not key.isdigit(): continue
+        fields = json.loads(json.dumps(value))
+        instance = Transaction()
+        for k, v in fields.items():
+            if k.isdigit(): continue
+            setattr(instance, k, v)
+        instance.num = int(key)
+        instance.transaction = int(instance.transaction)
+        instance.amount = float(instance.amount)
+        instance.currency_amount = float(instance.currency_amount)
+        instance.comission_percent = float(instance.comission_percent)
+        instance.comission_fixed = float(instance.comission_fixed)
+        instance.amount_profit = float(instance.amount_profit)
+        try:
+            instance.method = PayoutMethod[instance.method.lower()]
+        except:
+            instance.method = PayoutMethod.unknown
+        instance.date = datetime.strptime(instance.date, "%Y-%m-%d %H:%M:%S")
+        instance.pay_date = datetime.strptime(instance.pay_date, "%Y-%m-%d %H:%M:%S")
+        try:
+            instance.transaction_status = PaymentStatus(int(instance.transaction_status))
+        except:
+            instance.transaction_status = PaymentStatus.unknown
+        instance.webhook_status = int(instance.webhook_status)
+        instance.webhook_amount = int(instance.webhook_amount)
+        items.append(instance)
+    return items
+
+
+def measure(name, func, payload):
+    start = time.perf_counter()
+    func(payload)
+    elapsed = time.perf_counter() - start
+    print("{:<8} {:.3f}s".format(name, elapsed))
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payload = make_payload(rows)
+    legacy = measure("legacy", legacy_de_json, payload)
+    current = measure("current", Transactions.de_json, payload)
+    print("speedup  {:.1f}x".format(legacy / current))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Import time of pyPayokAPI for short-lived workers (payment link and notification handlers).
+
+Every scenario runs in a fresh interpreter with "python -X importtime". Reported time is the sum of
+modules imported by the scenario (interpreter startup is excluded). Light scenarios should not load
+HTTP transport (requests, httpx).
+
+Run:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --max-ms 50    # fail if a scenario is slower
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSPORT = ("requests", "httpx")
+
+# name, code, transport allowed
+SCENARIOS = [
+    ("package", "import pyPayokAPI", False),
+    ("client + types", "from pyPayokAPI import pyPayokAPI, PaymentMethod", False),
+    ("payment link", "from pyPayokAPI import pyPayokAPI\n"
+                     "pyPayokAPI(1, 'key', secret_key='secret').payment_link_create(100, 'order', 1, 'Order', 'RUB')", False),
+    ("notification", "from pyPayokAPI.webhook import parse_notification", False),
+    ("first request", "from pyPayokAPI import pyPayokAPI\n"
+                      "from pyPayokAPI.transport import create_transport\n"
+                      "create_transport()", True),
+]
+
+CHECK = "\nimport sys\nprint('LOADED', ' '.join(m for m in {!r} if m in sys.modules))".format(TRANSPORT)
+
+
+def imported(code):
+    """
+    Returns (dict module -> self import time in us, stdout) for code run in a fresh interpreter
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            modules[name.strip()] = int(self_us)
+    return modules, result.stdout
+
+
+def run(code, startup):
+    """
+    Returns (import time in ms, loaded transport modules)
+
+    :param startup: Modules imported on interpreter startup (not counted)
+    """
+    modules, stdout = imported(code + CHECK)
+    total = sum(us for name, us in modules.items() if name not in startup)
+    return total / 1000, stdout.rsplit("LOADED", 1)[-1].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyPayokAPI import time")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario (median is reported)")
+    parser.add_argument("--max-ms", type=float, help="Fail if a light scenario imports longer")
+    args = parser.parse_args()
+
+    startup = set(imported("pass")[0])
+    failed = False
+    for name, code, transport in SCENARIOS:
+        timings = []
+        loaded = []
+        for _ in range(args.repeat):
+            ms, loaded = run(code, startup)
+            timings.append(ms)
+        ms = statistics.median(timings)
+        status = "ok"
+        if not transport and loaded:
+            status = "FAIL (loaded {})".format(", ".join(loaded))
+            failed = True
+        elif not transport and args.max_ms is not None and ms > args.max_ms:
+            status = "FAIL (over {} ms)".format(args.max_ms)
+            failed = True
+        print("{:<16} {:>8.1f} ms  {}".format(name, ms, status))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Payment links benchmark: payment_link_create() per order vs batch API.
+
+Run: python benchmarks/bench_links.py [orders]
+"""
+import sys
+import time
+
+sys.path.insert(0, ".")
+from pyPayokAPI import pyPayokAPI, PaymentMethod
+
+
+def make_orders(count):
+    return [{
+        "amount": 100 + i % 50,
+        "payment": "campaign-{}".format(i),
+        "shop": 1234,
+        "desc": "Spring campaign invoice" if i % 2 else "Подписка",
+        "currency": "RUB",
+        "email": "user{}@example.com".format(i) if i % 3 else None,
+        "method": PaymentMethod.cd if i % 5 == 0 else None,
+    } for i in range(count)]
+
+
+def measure(name, func):
+    start = time.perf_counter()
+    result = func()
+    print("{:<12} {:.3f}s".format(name, time.perf_counter() - start))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    client = pyPayokAPI(1, "key", secret_key="secret")
+    orders = make_orders(count)
+    single = measure("single", lambda: [client.payment_link_create(**order) for order in orders])
+    batch = measure("batch", lambda: client.payment_links_create_many(orders))
+    parallel = measure("processes=4", lambda: client.payment_links_create_many(orders, processes=4))
+    assert single == batch == parallel
+
+
+if __name__ == "__main__":
+    main()
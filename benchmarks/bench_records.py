@@ -0,0 +1,55 @@
+"""
+Transaction record memory and creation time benchmark.
+
+Compares slotted Transaction with the previous __dict__ based record.
+
+Run: python benchmarks/bench_records.py [rows]
+"""
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, ".")
+from pyPayokAPI.payok_types import Transaction
+from bench_deserialize import make_payload
+
+
+class DictTransaction:
+    """
+    Previous Transaction layout: plain instance __dict__ with all response keys
+    """
+
+    @classmethod
+    def de_json(cls, data, num):
+        instance = cls()
+        fields = instance.__dict__
+        fields.update(data)
+        for key, converter in Transaction.schema:
+            if converter:
+                fields[key] = converter(fields[key])
+        instance.num = num
+        return instance
+
+
+def measure(name, cls, items):
+    start = time.perf_counter()
+    records = [cls.de_json(value, num) for num, value in enumerate(items, 1)]
+    elapsed = time.perf_counter() - start
+    del records
+    tracemalloc.start()
+    records = [cls.de_json(value, num) for num, value in enumerate(items, 1)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<8} {:.3f}s {:.1f} MB ({} bytes/record)".format(name, elapsed, size / 2 ** 20, size // len(records)))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payload = make_payload(rows)
+    items = [value for key, value in payload.items() if key.isdigit()]
+    measure("dict", DictTransaction, items)
+    measure("slots", Transaction, items)
+
+
+if __name__ == "__main__":
+    main()
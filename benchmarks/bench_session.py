@@ -0,0 +1,75 @@
+"""
+Pooled session benchmark against a local stub server.
+
+Compares one-off requests.post() calls (a new connection per call, as before)
+with the pooled session owned by pyPayokAPI.
+
+Run: python benchmarks/bench_session.py [calls]
+"""
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, ".")
+from pyPayokAPI import pyPayokAPI
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"balance": "10.5", "ref_balance": "0"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(name, call, calls):
+    StubHandler.connections = 0
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    print("{:<10} connections={:<6} p50={:.3f}ms p99={:.3f}ms".format(
+        name, StubHandler.connections, percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000))
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = "http://127.0.0.1:{}/api/".format(server.server_port)
+
+    measure("unpooled", lambda: requests.post(api_url + "balance", data={"API_ID": 1, "API_KEY": "x"}).json(), calls)
+    with pyPayokAPI(1, "x", api_url=api_url) as client:
+        measure("pooled", client.balance, calls)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Transports under high concurrency against one host: HTTP/1.1 (requests, urllib3) against the PayOK simulator
+and HTTP/2 (httpx) against a local h2 stub (cleartext, prior knowledge) serving the same simulator data.
+
+Many threads share one client and call the same method. Reported: throughput, per-call p50/p99 latency
+and number of TCP connections opened by the client. Requires httpx and h2.
+
+Run:
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py --threads 64 --calls 20 --latency 0.02 --method transaction
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import urllib.parse
+
+import h2.config
+import h2.connection
+import h2.events
+
+sys.path.insert(0, ".")
+from pyPayokAPI import pyPayokAPI
+from pyPayokAPI.simulator import PayokSimulator
+from pyPayokAPI.transport import HttpxTransport, RequestsTransport, Urllib3Transport
+
+
+class H2Stub:
+    """
+    HTTP/2 server (h2c with prior knowledge) answering API requests with PayokSimulator.handle.
+    Streams of one connection are answered concurrently after "latency" seconds.
+    """
+
+    def __init__(self, simulator, latency = 0.0):
+        self.simulator = simulator
+        self.latency = latency
+        self.connections = 0
+        self.port = None
+        self.loop = None
+        self.ready = threading.Event()
+
+    @property
+    def api_url(self):
+        return "http://127.0.0.1:{}/api/".format(self.port)
+
+    def start(self):
+        threading.Thread(target=self.__run, daemon=True).start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def __run(self):
+        self.loop = asyncio.new_event_loop()
+        server = self.loop.run_until_complete(asyncio.start_server(self.__serve, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def __serve(self, reader, writer):
+        self.connections += 1
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        requests = {}
+        pending = {}
+
+        def flush(stream_id):
+            data = pending.get(stream_id)
+            if data is None:
+                return
+            size = min(len(data), conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+            while size > 0:
+                conn.send_data(stream_id, data[:size])
+                data = data[size:]
+                size = min(len(data), conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+            if data:
+                pending[stream_id] = data
+            else:
+                del pending[stream_id]
+                conn.end_stream(stream_id)
+
+        async def respond(stream_id, path, body):
+            await asyncio.sleep(self.latency)
+            form = dict(urllib.parse.parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+            status, resp = self.simulator.handle(path.rstrip("/").rsplit("/", 1)[-1], form)
+            data = json.dumps(resp).encode("utf-8")
+            conn.send_headers(stream_id, [(":status", str(status)), ("content-type", "application/json"),
+                                          ("content-length", str(len(data)))])
+            pending[stream_id] = data
+            flush(stream_id)
+            writer.write(conn.data_to_send())
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    headers = dict((bytes(k), bytes(v)) if isinstance(k, bytes) else (k.encode(), v.encode())
+                                   for k, v in event.headers)
+                    requests[event.stream_id] = [headers[b":path"].decode(), b""]
+                elif isinstance(event, h2.events.DataReceived):
+                    requests[event.stream_id][1] += event.data
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    path, body = requests.pop(event.stream_id)
+                    asyncio.ensure_future(respond(event.stream_id, path, body))
+                elif isinstance(event, h2.events.WindowUpdated):
+                    for stream_id in list(pending) if event.stream_id == 0 else [event.stream_id]:
+                        flush(stream_id)
+            writer.write(conn.data_to_send())
+        writer.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(client, call, threads, calls):
+    """
+    Returns (ops/s, p50 ms, p99 ms) of calls made from many threads sharing one client
+    """
+    timings = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker():
+        local = []
+        start_barrier.wait()
+        for _ in range(calls):
+            start = time.perf_counter()
+            call(client)
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(timings) / elapsed, percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyPayokAPI transports under concurrency")
+    parser.add_argument("--threads", type=int, default=64, help="Number of concurrent threads")
+    parser.add_argument("--calls", type=int, default=20, help="Calls per thread")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated API latency (seconds)")
+    parser.add_argument("--pool", type=int, default=10, help="HTTP/1.1 connection pool size")
+    parser.add_argument("--method", choices=("balance", "transaction"), default="balance")
+    args = parser.parse_args()
+
+    sim = PayokSimulator(transactions=1000, latency=args.latency).start()
+    stub = H2Stub(PayokSimulator(transactions=1000), latency=args.latency).start()
+    if args.method == "balance":
+        call = lambda client: client.balance()
+    else:
+        call = lambda client: client.transaction(sim.shop, offset=100)
+
+    cases = [
+        ("requests pool={} (block)".format(args.pool), sim,
+         lambda: RequestsTransport(pool_maxsize=args.pool, pool_block=True)),
+        ("requests pool={}".format(args.threads), sim, lambda: RequestsTransport(pool_maxsize=args.threads)),
+        ("urllib3 pool={} (block)".format(args.pool), sim,
+         lambda: Urllib3Transport(pool_maxsize=args.pool, pool_block=True)),
+        ("httpx http2", stub, lambda: HttpxTransport(http1=False, pool_maxsize=args.pool)),
+    ]
+    print("{} threads x {} calls of {}, latency {} s".format(args.threads, args.calls, args.method, args.latency))
+    print("{:<28} {:>9} {:>9} {:>9} {:>12}".format("transport", "ops/s", "p50 ms", "p99 ms", "connections"))
+    for name, server, create in cases:
+        transport = create()
+        client = pyPayokAPI(1, "key", api_url=server.api_url, transport=transport, rate_limit=None)
+        call(client)
+        connections = server.connections
+        ops, p50, p99 = run(client, call, args.threads, args.calls)
+        connections = server.connections - connections + 1
+        transport.close()
+        print("{:<28} {:>9.1f} {:>9.2f} {:>9.2f} {:>12}".format(name, ops, p50, p99, connections))
+    sim.stop()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
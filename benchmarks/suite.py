@@ -0,0 +1,141 @@
+"""
+Offline benchmark suite: client methods against the local PayOK simulator, deserializers and payment links.
+
+Results are compared with saved baseline (benchmarks/baseline.json): benchmark fails if its throughput
+dropped by more than the threshold. Baselines are machine specific, save them on the machine that runs checks.
+
+Run:
+    python benchmarks/suite.py                  # run and compare with baseline
+    python benchmarks/suite.py --save           # run and save results as new baseline
+    python benchmarks/suite.py -k transaction   # run only benchmarks with "transaction" in name
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, ".")
+from pyPayokAPI import pyPayokAPI, PayoutMethod, PaymentCommissionType, PaymentMethod
+from pyPayokAPI.payok_types import Transactions, Payouts
+from pyPayokAPI.simulator import PayokSimulator
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.3
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(func, samples, calls_per_sample = 1):
+    """
+    Call func calls_per_sample times per sample. Returns dict with ops/s and per-call p50/p99 (ms).
+    """
+    func()
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(calls_per_sample):
+            func()
+        timings.append((time.perf_counter() - start) / calls_per_sample)
+    return {
+        "ops": round(len(timings) / sum(timings), 1),
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 4),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 4),
+    }
+
+
+def benchmarks(sim, quick):
+    scale = 0.2 if quick else 1
+    samples = lambda count: max(5, int(count * scale))
+    client = pyPayokAPI(1, "key", secret_key="secret", api_url=sim.api_url, rate_limit=None)
+    shop = sim.shop
+    transaction_page = sim.handle("transaction", {"shop": shop})[1]
+    payout_page = sim.handle("payout", {})[1]
+    order = {"amount": 150, "payment": "order-1", "shop": 1234, "desc": "Order invoice", "currency": "RUB",
+             "email": "user@example.com", "method": PaymentMethod.cd}
+
+    yield "client.balance", lambda: measure(client.balance, samples(300))
+    yield "client.transaction_page", lambda: measure(lambda: client.transaction(shop, offset=100), samples(200))
+    yield "client.transaction_by_payment", lambda: measure(
+        lambda: client.transaction(shop, payment="order-500"), samples(200))
+    yield "client.transactions_1000", lambda: measure(
+        lambda: client.transactions(shop, max_results=1000, prefetch=2), samples(20))
+    yield "client.payout_page", lambda: measure(client.payout, samples(200))
+    yield "client.payout_create", lambda: measure(
+        lambda: client.payout_create(10, PayoutMethod.card, "4111111111111111", PaymentCommissionType.balance),
+        samples(200))
+    yield "deserialize.transactions_100", lambda: measure(
+        lambda: Transactions.de_json(transaction_page), samples(200), 10)
+    yield "deserialize.payouts_100", lambda: measure(lambda: Payouts.de_json(payout_page), samples(200), 10)
+    yield "payment_link_create", lambda: measure(lambda: client.payment_link_create(**order), samples(200), 100)
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns list of regression descriptions
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print("{:<32} no baseline".format(name))
+            continue
+        change = result["ops"] / base["ops"] - 1
+        limit = baseline.get("thresholds", {}).get(name, threshold)
+        status = "REGRESSION" if change < -limit else "ok"
+        print("{:<32} {:>+7.1%} vs baseline {:.1f} ops/s  {}".format(name, change, base["ops"], status))
+        if status != "ok":
+            regressions.append("{}: {:.1f} ops/s, baseline {:.1f} ops/s".format(name, result["ops"], base["ops"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyPayokAPI offline benchmark suite")
+    parser.add_argument("-k", dest="filter", help="Run only benchmarks containing this string")
+    parser.add_argument("--save", action="store_true", help="Save results as baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--threshold", type=float, help="Allowed throughput drop (default from baseline or 0.3)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API latency (seconds)")
+    parser.add_argument("--quick", action="store_true", help="Fewer samples")
+    args = parser.parse_args()
+
+    results = {}
+    with PayokSimulator(transactions=2000, payouts=300, latency=args.latency) as sim:
+        for name, run in benchmarks(sim, args.quick):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = run()
+            print("{:<32} {:>10.1f} ops/s  p50={:.3f}ms  p99={:.3f}ms".format(
+                name, results[name]["ops"], results[name]["p50_ms"], results[name]["p99_ms"]))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.setdefault("threshold", DEFAULT_THRESHOLD)
+        baseline.setdefault("thresholds", {})
+        baseline.setdefault("results", {}).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Baseline saved to {}".format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline, run with --save")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print()
+    regressions = compare(results, baseline, args.threshold or baseline.get("threshold", DEFAULT_THRESHOLD))
+    if regressions:
+        print("\n".join(["", "Regressions:"] + regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,49 @@
-from .api import *
+# Names are imported on first access (PEP 562), so importing the package does not load
+# HTTP transport and modules that are not used (e.g. by payment link or notification handlers).
+from importlib import import_module
+
+_LAZY = {
+    "pyPayokAPI": ".api",
+    "pyPayokAPIException": ".api",
+    "PaymentLinkBuilder": ".api",
+    "API_URL": ".api",
+    "AsyncPayokAPI": ".async_api",
+    "gather_limited": ".async_api",
+    "TokenBucket": ".pagination",
+    "TTLCache": ".ttl_cache",
+    "RetryPolicy": ".retry",
+    "CircuitBreaker": ".retry",
+    "Dictionaryable": ".payok_types",
+    "JsonSerializable": ".payok_types",
+    "JsonDeserializable": ".payok_types",
+    "Record": ".payok_types",
+    "DATETIME_FORMAT": ".payok_types",
+    "parse_datetime": ".payok_types",
+    "Balance": ".payok_types",
+    "Transaction": ".payok_types",
+    "Transactions": ".payok_types",
+    "PayoutMethod": ".payok_types",
+    "PaymentStatus": ".payok_types",
+    "FINAL_STATUSES": ".payok_types",
+    "PaymentCommissionType": ".payok_types",
+    "Payout": ".payok_types",
+    "Payouts": ".payok_types",
+    "PaymentMethod": ".payok_types",
+    "payout_method": ".payok_types",
+    "payment_status": ".payok_types",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,370 @@
+import math
+from calendar import timegm
+from threading import Lock
+
+from .payok_types import Transaction, Payout, PaymentStatus, PayoutMethod, payment_status, payout_method
+
+# Counter fields of a series (per time bucket and in total)
+FIELDS = ("count", "amount", "profit", "commission")
+
+TRANSACTION = "transaction"
+PAYOUT = "payout"
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative error guarantee (DDSketch-style logarithmic buckets).
+    Values are counted in buckets [gamma^(i-1), gamma^i), so any quantile is estimated with relative error
+    below relative_accuracy. Number of buckets is bounded by max_buckets: the lowest buckets are collapsed
+    when it is exceeded (only low quantiles lose accuracy).
+    """
+
+    def __init__(self, relative_accuracy = 0.01, max_buckets = 2048):
+        """
+        :param relative_accuracy: (Float, Optional, default=0.01) Max relative error of quantiles
+        :param max_buckets: (Int, Optional, default=2048) Max number of buckets (memory bound)
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy should be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count = 1):
+        """
+        Add value (non-positive values are counted as zero)
+
+        :param value: (Float) Value
+        :param count: (Int, Optional, default=1) Number of occurrences
+        """
+        if value > 0:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_buckets:
+                self.__collapse()
+        else:
+            value = 0.0
+            self.zero += count
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def __collapse(self):
+        indexes = sorted(self.bins)
+        extra = len(indexes) - self.max_buckets
+        target = indexes[extra]
+        for index in indexes[:extra]:
+            self.bins[target] += self.bins.pop(index)
+
+    def quantile(self, q):
+        """
+        Returns estimated q-quantile (None if sketch is empty)
+
+        :param q: (Float) Quantile between 0 and 1
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Add counts of other sketch (with the same relative accuracy)
+
+        :param other: QuantileSketch
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Sketches with different relative accuracy can not be merged")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_buckets:
+            self.__collapse()
+        self.zero += other.zero
+        self.count += other.count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def to_dict(self):
+        """
+        Returns a JSON-serializable DICT (can be passed to from_dict)
+        """
+        return {"relative_accuracy": self.relative_accuracy, "max_buckets": self.max_buckets,
+                "bins": {str(index): count for index, count in self.bins.items()},
+                "zero": self.zero, "count": self.count, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["max_buckets"])
+        sketch.bins = {int(index): count for index, count in data["bins"].items()}
+        sketch.zero = data["zero"]
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        return sketch
+
+
+class _Series:
+    # Counters of one (kind, shop, method, status) key
+    __slots__ = ("total", "buckets", "sketch")
+
+    def __init__(self, sketch):
+        self.total = [0, 0.0, 0.0, 0.0]
+        self.buckets = {}
+        self.sketch = sketch
+
+
+def _add_counters(target, source):
+    for i in range(len(FIELDS)):
+        target[i] += source[i]
+
+
+def _timestamp(value):
+    # API dates are naive (server time), they are used as is
+    return timegm(value.timetuple()) if value is not None else None
+
+
+def _values(record):
+    """
+    Returns (kind, method, status, date, amount, profit, commission) of a record
+    """
+    if isinstance(record, Transaction):
+        kind, date, status, profit = TRANSACTION, record.date, record.transaction_status, record.amount_profit
+    elif isinstance(record, Payout):
+        kind, date, status, profit = PAYOUT, record.date_create, record.status, record.amount_profit
+    else:
+        # Payment notification: sent for successful payments only
+        kind, date, status, profit = TRANSACTION, record.date, PaymentStatus.success, getattr(record, "profit", None)
+    method = record.method if isinstance(record.method, PayoutMethod) else payout_method(record.method)
+    if not isinstance(status, PaymentStatus):
+        status = payment_status(status)
+    amount = record.amount or 0.0
+    if profit is not None:
+        commission = amount - profit
+    else:
+        commission = amount * (getattr(record, "comission_percent", None) or 0) / 100 + \
+            (getattr(record, "comission_fixed", None) or 0)
+        profit = amount - commission
+    return kind, method, status, date, amount, profit, commission
+
+
+class StreamingAggregator:
+    """
+    Incremental revenue and commission metrics of Transaction / Payout records and payment notifications.
+    For every (kind, shop, method, status) key it keeps totals, rolling counters in time buckets
+    (by record date, the last "buckets" buckets are kept) and a quantile sketch of amounts, so memory per key
+    does not depend on the number of records. Snapshots of aggregators from different processes can be merged.
+
+    Each record should be added once: records from pages and notifications of the same payment are not deduplicated.
+    """
+
+    def __init__(self, bucket_seconds = 60, buckets = 60, relative_accuracy = 0.01, max_sketch_buckets = 2048):
+        """
+        :param bucket_seconds: (Int, Optional, default=60) Time bucket size (seconds)
+        :param buckets: (Int, Optional, default=60) Number of kept time buckets (window length)
+        :param relative_accuracy: (Float, Optional, default=0.01) Max relative error of amount quantiles
+        :param max_sketch_buckets: (Int, Optional, default=2048) Max number of buckets of each quantile sketch
+        """
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.relative_accuracy = relative_accuracy
+        self.max_sketch_buckets = max_sketch_buckets
+        self.series = {}
+        self.latest = None
+        self.lock = Lock()
+
+    def add(self, record, shop = None):
+        """
+        Add record
+
+        :param record: Transaction, Payout or Notification
+        :param shop: (Optional) Shop ID of transaction (default - record "shop" field, if any)
+        """
+        kind, method, status, date, amount, profit, commission = _values(record)
+        if shop is None:
+            shop = getattr(record, "shop", None) if kind == TRANSACTION else None
+        key = (kind, str(shop) if shop is not None else None, method, status)
+        counters = (1, amount, profit, commission)
+        timestamp = _timestamp(date)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(self.__sketch())
+            _add_counters(series.total, counters)
+            series.sketch.add(amount)
+            if timestamp is not None:
+                bucket = timestamp // self.bucket_seconds
+                if self.latest is None or bucket > self.latest:
+                    self.latest = bucket
+                if bucket > self.latest - self.buckets:
+                    current = series.buckets.get(bucket)
+                    if current is None:
+                        current = series.buckets[bucket] = [0, 0.0, 0.0, 0.0]
+                        self.__trim(series)
+                    _add_counters(current, counters)
+
+    def add_many(self, records, shop = None):
+        """
+        Add records (e.g. client.iter_transactions(shop))
+
+        :param records: Iterable of records
+        :param shop: (Optional) Shop ID of transactions
+        :return: Number of added records
+        """
+        added = 0
+        for record in records:
+            self.add(record, shop)
+            added += 1
+        return added
+
+    def __sketch(self):
+        return QuantileSketch(self.relative_accuracy, self.max_sketch_buckets)
+
+    def __trim(self, series):
+        # Drop buckets that left the window
+        if len(series.buckets) > self.buckets:
+            oldest = self.latest - self.buckets
+            for bucket in [bucket for bucket in series.buckets if bucket <= oldest]:
+                del series.buckets[bucket]
+
+    def __matching(self, kind, shop, method, status):
+        if method is not None and not isinstance(method, PayoutMethod):
+            method = payout_method(method)
+        shop = str(shop) if shop is not None else None
+        for (series_kind, series_shop, series_method, series_status), series in self.series.items():
+            if series_kind != kind or (shop is not None and series_shop != shop) or \
+                    (method is not None and series_method != method) or \
+                    (status is not None and series_status != status):
+                continue
+            yield series
+
+    def totals(self, shop = None, method = None, status = None, kind = TRANSACTION, window = None):
+        """
+        Returns dict with "count", "amount", "profit" and "commission" of matching records
+
+        :param shop: (Optional) Shop ID (None - all shops)
+        :param method: (PayoutMethod, Optional) Method (None - all methods)
+        :param status: (PaymentStatus, Optional) Status (None - all statuses)
+        :param kind: (Optional, default="transaction") "transaction" or "payout"
+        :param window: (Int, Optional) Only records of the last "window" seconds (by record date,
+            rounded to buckets and limited by kept buckets; None - all time)
+        """
+        result = [0, 0.0, 0.0, 0.0]
+        with self.lock:
+            first = None
+            if window is not None and self.latest is not None:
+                first = max(self.latest - math.ceil(window / self.bucket_seconds),
+                            self.latest - self.buckets) + 1
+            for series in self.__matching(kind, shop, method, status):
+                if window is None:
+                    _add_counters(result, series.total)
+                elif first is not None:
+                    for bucket, counters in series.buckets.items():
+                        if bucket >= first:
+                            _add_counters(result, counters)
+        return dict(zip(FIELDS, result))
+
+    def success_rate(self, shop = None, method = None, window = None):
+        """
+        Returns share of successful transactions among finished ones (None if there are none)
+
+        :param shop: (Optional) Shop ID (None - all shops)
+        :param method: (PayoutMethod, Optional) Method (None - all methods)
+        :param window: (Int, Optional) Only transactions of the last "window" seconds
+        """
+        success = self.totals(shop, method, PaymentStatus.success, window=window)["count"]
+        fail = self.totals(shop, method, PaymentStatus.fail, window=window)["count"]
+        return success / (success + fail) if success + fail else None
+
+    def quantile(self, q, shop = None, method = None, status = None, kind = TRANSACTION):
+        """
+        Returns estimated q-quantile of amounts of matching records (all time, None if there are none)
+
+        :param q: (Float) Quantile between 0 and 1
+        :param shop: (Optional) Shop ID (None - all shops)
+        :param method: (PayoutMethod, Optional) Method (None - all methods)
+        :param status: (PaymentStatus, Optional) Status (None - all statuses)
+        :param kind: (Optional, default="transaction") "transaction" or "payout"
+        """
+        sketch = self.__sketch()
+        with self.lock:
+            for series in self.__matching(kind, shop, method, status):
+                sketch.merge(series.sketch)
+        return sketch.quantile(q)
+
+    def keys(self):
+        """
+        Returns list of (kind, shop, method, status) keys
+        """
+        with self.lock:
+            return list(self.series)
+
+    def snapshot(self):
+        """
+        Returns JSON-serializable DICT with aggregator state (can be passed to merge() or from_snapshot())
+        """
+        with self.lock:
+            series = [
+                [kind, shop, method.name, status.value, list(item.total),
+                 {str(bucket): counters for bucket, counters in item.buckets.items()}, item.sketch.to_dict()]
+                for (kind, shop, method, status), item in self.series.items()]
+            return {"bucket_seconds": self.bucket_seconds, "buckets": self.buckets,
+                    "relative_accuracy": self.relative_accuracy, "max_sketch_buckets": self.max_sketch_buckets,
+                    "latest": self.latest, "series": series}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Create aggregator from snapshot
+
+        :param snapshot: DICT returned by snapshot()
+        """
+        aggregator = cls(snapshot["bucket_seconds"], snapshot["buckets"], snapshot["relative_accuracy"],
+                         snapshot["max_sketch_buckets"])
+        aggregator.merge(snapshot)
+        return aggregator
+
+    def merge(self, other):
+        """
+        Add state of other aggregator (e.g. of another worker process)
+
+        :param other: StreamingAggregator or its snapshot (with the same bucket_seconds and relative_accuracy)
+        """
+        snapshot = other.snapshot() if isinstance(other, StreamingAggregator) else other
+        if snapshot["bucket_seconds"] != self.bucket_seconds or \
+                snapshot["relative_accuracy"] != self.relative_accuracy:
+            raise ValueError("Aggregators with different bucket_seconds or relative_accuracy can not be merged")
+        with self.lock:
+            if snapshot["latest"] is not None and (self.latest is None or snapshot["latest"] > self.latest):
+                self.latest = snapshot["latest"]
+            for kind, shop, method, status, total, buckets, sketch in snapshot["series"]:
+                key = (kind, shop, PayoutMethod[method], PaymentStatus(status))
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = _Series(self.__sketch())
+                _add_counters(series.total, total)
+                series.sketch.merge(QuantileSketch.from_dict(sketch))
+                for bucket, counters in buckets.items():
+                    bucket = int(bucket)
+                    if bucket > self.latest - self.buckets:
+                        current = series.buckets.setdefault(bucket, [0, 0.0, 0.0, 0.0])
+                        _add_counters(current, counters)
+            for series in self.series.values():
+                self.__trim(series)
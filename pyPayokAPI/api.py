@@ -1,23 +1,246 @@
-import requests
 import hashlib
 import urllib
 import urllib.parse
-from time import sleep
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from threading import Lock
+from time import sleep, perf_counter
 
 from .payok_types import *
+from .pagination import TokenBucket, iterate, collect, window_filter, window_pager
+from .ttl_cache import TTLCache
+from .retry import RetryPolicy, CircuitBreaker
+from .json_decoder import get_decoder
+from .transport import RequestsTransport, create_transport
+from .deadline import to_deadline
 
 API_URL = "https://payok.io/api/"
 
 
 # noinspection PyPep8Naming
 class pyPayokAPIException(Exception):
-    def __init__(self, code, message, full_error = ""):
+    def __init__(self, code, message, full_error = "", api_error = False):
         self.code = code
         self.message = message
         self.full_error = full_error
+        # Error was returned by API (request was processed and rejected)
+        self.api_error = api_error
         super().__init__(self.message)
 
 
+def _request_data(api_id, api_key, kwargs):
+    """
+    Build API request form data (shared by sync and async clients)
+
+    :param api_id: API id for access
+    :param api_key: API key for access
+    :param kwargs: request data
+    """
+    if kwargs:
+        data = dict(kwargs)
+    else:
+        data = {}
+    data["API_ID"] = api_id
+    data["API_KEY"] = api_key
+    return data
+
+
+def _decode_error(status_code, error, print_errors = False):
+    """
+    Build exception for the response that can not be decoded
+
+    :param status_code: HTTP status code of successful response or None
+    :param error: Original exception
+    :param print_errors: Print error message
+    """
+    message = "Response decode failed: {}".format(error)
+    if print_errors:
+        print(message)
+    return pyPayokAPIException(status_code or -2, message)
+
+
+def _request_error(status_code, error, print_errors = False):
+    """
+    Build exception for the failed request
+
+    :param status_code: HTTP status code of successful response or None
+    :param error: Original exception
+    :param print_errors: Print error message
+    """
+    message = "Request unknown exception: {}".format(error)
+    if print_errors:
+        print(message)
+    return pyPayokAPIException(status_code or -3, message)
+
+
+def _check_response(resp, status_code, print_errors = False):
+    """
+    Check decoded API response and raise pyPayokAPIException on API errors
+
+    :param resp: Decoded response
+    :param status_code: HTTP status code of successful response or None
+    :param print_errors: Print dumps on errors
+    """
+    if not resp:
+        code = status_code or -4
+        message = "None request response"
+        if print_errors:
+            print(message)
+        raise pyPayokAPIException(code, message)
+    elif not isinstance(resp, dict):
+        message = "Unexpected response: {}".format(resp)
+        if print_errors:
+            print(message)
+        raise pyPayokAPIException(-2, message)
+    elif resp.get("status", "") == "error":
+        code = resp["error_code"]
+        if isinstance(code, str):
+            if code.isdigit():
+                code = int(code)
+        if "text" in resp:
+            message = resp["text"]
+        elif "error_text" in resp:
+            message = resp["error_text"]
+        else:
+            message = "No error info provided"
+        if print_errors:
+            print("Response: {}".format(resp))
+        raise pyPayokAPIException(code, message, api_error=True)
+    # elif not resp.get("status"):
+    #     if resp.get("error_code"):
+    #         code = resp["error_code"]
+    #     elif status_code:
+    #         code = status_code
+    #     else:
+    #         code = -5
+    #     if resp.get("text"):
+    #         message = resp["text"]
+    #     else:
+    #         message = "No error info provided"
+    #     if print_errors:
+    #         print("Response: {}".format(resp))
+    #     raise pyPayokAPIException(code, message)
+    # code -6 is used above
+    else:
+        return resp
+
+
+def _transaction_params(shop, payment = None, offset = None):
+    """
+    Build "transaction" method parameters
+    """
+    params = {
+        "shop": shop,
+    }
+    if payment:
+        params["payment"] = payment
+    if offset:
+        params["offset"] = offset
+    return params
+
+
+def _payout_params(payout_id = None, offset = None):
+    """
+    Build "payout" method parameters
+    """
+    params = {}
+    if payout_id:
+        params["payout_id"] = payout_id
+    if offset:
+        params["offset"] = offset
+    return params
+
+
+def _payout_create_params(amount, method, reciever, comission_type, webhook_url = None):
+    """
+    Build "payout_create" method parameters
+    """
+    params = {
+        "amount": amount,
+        "method": method.name if isinstance(method, PayoutMethod) else method,
+        "reciever": reciever,
+        "comission_type": comission_type.name if isinstance(comission_type, PaymentCommissionType) else comission_type,
+    }
+    if webhook_url:
+        params["webhook_url"] = webhook_url
+    return params
+
+
+class PaymentLinkBuilder:
+    """
+    Payment links (invoices) builder.
+    Secret key check, signature suffix and per-shop/currency URL parts are prepared once and reused between links.
+    """
+
+    def __init__(self, secret_key):
+        """
+        :param secret_key: Secret key for payment links
+        """
+        if not secret_key:
+            raise pyPayokAPIException(-7, "No secret key provided when creating pyPayokAPI")
+        self.secret_key = secret_key
+        self.sign_suffix = "|" + str(secret_key)
+        self.shop_parts = {}
+
+    def __shop_part(self, shop, currency):
+        # (signature middle part, url part after desc) for shop/currency pair
+        key = (shop, currency)
+        part = self.shop_parts.get(key)
+        if part is None:
+            part = self.shop_parts[key] = ("|{}|{}|".format(shop, currency), "&currency={}&sign=".format(currency))
+        return part
+
+    def build(self, amount, payment, shop, desc, currency,
+              email = None, success_url = None, method = None, lang = None, custom = None):
+        """
+        Build signed payment link (see pyPayokAPI.payment_link_create for parameters)
+        """
+        sign_middle, url_currency = self.__shop_part(shop, currency)
+        desc = desc if desc else ""
+        sign = hashlib.md5("{}|{}{}{}{}".format(
+            amount, payment, sign_middle, desc, self.sign_suffix).encode("utf-8")).hexdigest()
+
+        url = "https://payok.io/pay?amount={}&payment={}&shop={}&desc={}{}{}".format(
+            amount, urllib.parse.quote(payment), shop, _quote_desc(desc), url_currency, sign)
+        if email:
+            url += f"&email={email}"
+        if success_url:
+            success_url = urllib.parse.quote_plus(success_url)
+            url += f"&success_url={success_url}"
+        if method:
+            if isinstance(method, PaymentMethod):
+                url += f"&method={method.name}"
+            else:
+                url += f"&method={method}"
+        if lang:
+            url += f"&lang={lang}"
+        if custom:
+            url += f"&customparam={custom}"
+        return url
+
+    def build_many(self, orders):
+        """
+        Build payment links for orders
+
+        :param orders: Iterable of orders: dicts of build() keyword arguments or tuples of positional arguments
+        :return: list of links
+        """
+        build = self.build
+        return [build(**order) if isinstance(order, dict) else build(*order) for order in orders]
+
+
+@lru_cache(maxsize=1024)
+def _quote_desc(desc):
+    # Campaigns usually share few descriptions
+    return urllib.parse.quote(desc)
+
+
+def _build_links(secret_key, orders):
+    # Process pool worker
+    return PaymentLinkBuilder(secret_key).build_many(orders)
+
+
 # noinspection PyPep8Naming
 class pyPayokAPI:
     """
@@ -26,7 +249,13 @@ class pyPayokAPI:
 
     def __init__(self, api_id, api_key,
                  secret_key = None,
-                 print_errors = False, timeout = None):
+                 print_errors = False, timeout = None,
+                 pool_connections = 10, pool_maxsize = 10, pool_block = False,
+                 keep_alive = True, session = None, api_url = None,
+                 rate_limit = 1, rate_burst = 1,
+                 cache_ttl = None, cache_size = 1024,
+                 retry_policy = None, circuit_breaker = None, instrumentation = None,
+                 json_decoder = None, transport = None, hedge_policy = None):
         """
         Create the pyPayokAPI instance.
 
@@ -34,95 +263,354 @@ class pyPayokAPI:
         :param api_key: API key for access
         :param secret_key: (Optional) Secret key for payment links
         :param print_errors: (Optional) Print dumps on request errors
-        :param timeout: (Optional) Request timeout
+        :param timeout: (Optional) Request timeout (seconds or (connect, read) tuple), see also "deadline" of methods
+        :param pool_connections: (Int, Optional, default=10) Number of host pools to cache
+        :param pool_maxsize: (Int, Optional, default=10) Max connections kept per host
+        :param pool_block: (Bool, Optional, default=False) Wait for a free connection instead of opening an extra one
+        :param keep_alive: (Bool, Optional, default=True) Reuse connections between requests
+        :param session: (Optional) External requests.Session to use (it is not closed by close())
+        :param api_url: (Optional) API base url (for tests and local simulators)
+        :param rate_limit: (Float, Optional, default=1) Paginated requests per second (None - no limit)
+        :param rate_burst: (Int, Optional, default=1) Max number of paginated requests made at once
+        :param cache_ttl: (Dict, Optional) In-memory cache TTL (seconds) of read-only calls by method,
+            e.g. {"balance": 5, "transaction": 30} ("transaction" caches lookups by payment ID only)
+        :param cache_size: (Int, Optional, default=1024) Max number of cached responses
+        :param retry_policy: (RetryPolicy, Optional) Retry policy for failed requests of read-only methods
+        :param circuit_breaker: (CircuitBreaker, Optional) Fail fast while API is down
+        :param instrumentation: (Metrics, Optional) Collect request timings, counters and tracing spans
+        :param json_decoder: (Optional) JSON backend: "orjson", "msgspec", "json" (default - the fastest installed)
+        :param transport: (Optional) HTTP transport: "requests" (default), "urllib3", "httpx" (HTTP/2)
+            or transport instance (e.g. FakeTransport, it is not closed by close())
+        :param hedge_policy: (HedgePolicy, Optional) Send second request of slow idempotent reads
         """
         self.api_id = api_id
         self.api_key = api_key
         self.secret_key = secret_key
         self.print_errors = print_errors
         self.timeout = timeout
+        self.api_url = api_url or API_URL
+        # Own transport is created on the first request
+        if session is not None:
+            transport = RequestsTransport(session=session)
+        if transport is None or isinstance(transport, str):
+            self.transport = None
+            self.own_transport = True
+            self.transport_args = (transport or "requests", pool_connections, pool_maxsize, pool_block, keep_alive)
+        else:
+            self.transport = transport
+            self.own_transport = False
+        self.transport_lock = Lock()
+        self.closed = False
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.cache_ttl = dict(cache_ttl) if cache_ttl else {}
+        self.response_cache = TTLCache(cache_size) if self.cache_ttl else None
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.instrumentation = instrumentation
+        self.json_loads = get_decoder(json_decoder)
+        self.hedge_policy = hedge_policy
+        self.hedge_executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close pooled connections (only if transport is owned by the client)
+        """
+        with self.transport_lock:
+            if self.own_transport and self.transport is not None:
+                self.transport.close()
+            self.transport = None
+            self.closed = True
+            if self.hedge_executor is not None:
+                self.hedge_executor.shutdown(wait=False)
+                self.hedge_executor = None
+
+    def __get_transport(self):
+        """
+        Returns HTTP transport (creating own transport on the first call)
+        """
+        transport = self.transport
+        if transport is None:
+            with self.transport_lock:
+                if self.closed:
+                    raise pyPayokAPIException(-8, "Client is closed")
+                if self.transport is None:
+                    self.transport = create_transport(*self.transport_args)
+                transport = self.transport
+        return transport
+
+    def __request(self, method_url, deadline = None, **kwargs):
+        """
+        Send request to API (with retries and circuit breaker if configured)
 
+        :param method_url: (String) API method url (part)
+        :param deadline: (Deadline, Optional) Deadline of the call
+        :param kwargs: request data
+        """
+        data = _request_data(self.api_id, self.api_key, kwargs)
+        if self.instrumentation is not None:
+            with self.instrumentation.span(method_url):
+                return self.__attempts(method_url, data, deadline)
+        return self.__attempts(method_url, data, deadline)
 
-    def __request(self, method_url, **kwargs):
+    def __attempts(self, method_url, data, deadline):
         """
-        Send request to API
+        Send request with retries and circuit breaker (if configured)
 
         :param method_url: (String) API method url (part)
-        :param kwargs: request data
+        :param data: request data
+        :param deadline: (Deadline, Optional) Deadline of the call
         """
-        if kwargs:
-            data = dict(kwargs)
-        else:
-            data = {}
-        data["API_ID"] = self.api_id
-        data["API_KEY"] = self.api_key
+        if self.retry_policy is None and self.circuit_breaker is None:
+            return self.__send_once(method_url, data, deadline)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.circuit_breaker and not self.circuit_breaker.allow():
+                raise pyPayokAPIException(-10, "API is unavailable (circuit breaker is open)")
+            try:
+                resp = self.__send_once(method_url, data, deadline)
+            except pyPayokAPIException as pe:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record(pe)
+                if self.retry_policy and self.retry_policy.should_retry(method_url, pe, attempt):
+                    delay = self.retry_policy.delay(pe, attempt)
+                    if deadline is not None:
+                        # No time left for another attempt
+                        deadline.check(delay, pe)
+                    if self.instrumentation is not None:
+                        self.instrumentation.observe_retry(method_url, pe)
+                    sleep(delay)
+                    continue
+                raise pe
+            except Exception as e:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record(e)
+                raise
+            except BaseException:
+                # Interrupted
+                if self.circuit_breaker:
+                    self.circuit_breaker.cancel()
+                raise
+            if self.circuit_breaker:
+                self.circuit_breaker.record()
+            return resp
+
+    def __send_once(self, method_url, data, deadline):
+        """
+        Send request to API (hedged if configured), failed requests after deadline raise DEADLINE_EXCEEDED
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        :param deadline: (Deadline, Optional) Deadline of the call
+        """
+        try:
+            if self.hedge_policy is not None and method_url in self.hedge_policy.methods:
+                return self.__send_hedged(method_url, data, deadline)
+            return self.__send(method_url, data, deadline)
+        except pyPayokAPIException as pe:
+            if deadline is not None and deadline.expired:
+                deadline.check(0, pe)
+            raise pe
+
+    def __send_hedged(self, method_url, data, deadline):
+        """
+        Send request and, if it is not answered within hedge delay, the same request again.
+        The first successful response is returned, the other request is abandoned.
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        :param deadline: (Deadline, Optional) Deadline of the call
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        policy = self.hedge_policy
+
+        def timed_send():
+            start = perf_counter()
+            resp = self.__send(method_url, data, deadline)
+            policy.observe(method_url, perf_counter() - start)
+            return resp
+
+        def submit():
+            with self.transport_lock:
+                if self.closed:
+                    raise pyPayokAPIException(-8, "Client is closed")
+                if self.hedge_executor is None:
+                    self.hedge_executor = ThreadPoolExecutor(max_workers=policy.max_workers)
+                return self.hedge_executor.submit(timed_send)
+
+        def remaining():
+            # Requests may wait for a free worker, so waiting is limited by deadline too
+            if deadline is None:
+                return None
+            deadline.check()
+            return deadline.remaining()
+
+        delay = policy.delay(method_url)
+        futures = [submit()]
+        try:
+            if deadline is not None and delay >= deadline.remaining():
+                # Hedge could not be answered before deadline
+                done, _ = wait(futures, timeout=remaining())
+                if not done:
+                    raise deadline.exceeded()
+                return futures[0].result()
+            done, _ = wait(futures, timeout=delay)
+            if done:
+                return futures[0].result()
+            futures.append(submit())
+            pending = set(futures)
+            error = None
+            while pending:
+                done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise deadline.exceeded()
+                for future in done:
+                    try:
+                        resp = future.result()
+                    except pyPayokAPIException as pe:
+                        error = error or pe
+                        continue
+                    policy.record(future is futures[1])
+                    return resp
+            policy.record(False)
+            raise error
+        finally:
+            # Requests still waiting for a worker are not sent
+            for future in futures:
+                future.cancel()
+
+    def __send(self, method_url, data, deadline = None):
+        """
+        Send one request to API
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        :param deadline: (Deadline, Optional) Deadline of the call (limits request timeouts)
+        """
+        transport = self.__get_transport()
+        timeout = self.timeout if deadline is None else deadline.request_timeout(self.timeout)
+        if self.instrumentation is not None:
+            return self.__send_instrumented(transport, method_url, data, timeout)
 
         base_resp = None
         try:
-            base_resp = requests.post(API_URL + method_url, data=data, timeout=self.timeout)
-            resp = base_resp.json()
+            base_resp = transport.post(self.api_url + method_url, data, timeout)
+            resp = self.json_loads(base_resp.content)
         except ValueError as ve:
-            code = base_resp.status_code if base_resp else -2
-            message = "Response decode failed: {}".format(ve)
-            if self.print_errors:
-                print(message)
-            raise pyPayokAPIException(code, message)
+            raise _decode_error(base_resp.status_code if base_resp else None, ve, self.print_errors)
         except Exception as e:
-            code = base_resp.status_code if base_resp else -3
-            message = "Request unknown exception: {}".format(e)
-            if self.print_errors:
-                print(message)
-            raise pyPayokAPIException(code, message)
-        if not resp:
-            code = base_resp.status_code if base_resp else -4
-            message = "None request response"
-            if self.print_errors:
-                print(message)
-            raise pyPayokAPIException(code, message)
-        elif resp.get("status", "") == "error":
-            code = resp["error_code"]
-            if isinstance(code, str):
-                if code.isdigit():
-                    code = int(code)
-            if "text" in resp:
-                message = resp["text"]
-            elif "error_text" in resp:
-                message = resp["error_text"]
-            else:
-                message = "No error info provided"
-            if self.print_errors:
-                print("Response: {}".format(resp))
-            raise pyPayokAPIException(code, message)
-        # elif not resp.get("status"):
-        #     if resp.get("error_code"):
-        #         code = resp["error_code"]
-        #     elif base_resp:
-        #         code = base_resp.status_code
-        #     else:
-        #         code = -5
-        #     if resp.get("text"):
-        #         message = resp["text"]
-        #     else:
-        #         message = "No error info provided"
-        #     if self.print_errors:
-        #         print("Response: {}".format(resp))
-        #     raise pyPayokAPIException(code, message)
-        # code -6 is used above
-        else:
-            return resp
+            raise _request_error(base_resp.status_code if base_resp else None, e, self.print_errors)
+        return _check_response(resp, base_resp.status_code if base_resp else None, self.print_errors)
+
+    def __send_instrumented(self, transport, method_url, data, timeout):
+        """
+        Send one request to API, measuring phases and sizes
+
+        :param transport: HTTP transport
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        :param timeout: Request timeout
+        """
+        timings = {}
+        received = 0
+        error = None
+        base_resp = None
+        try:
+            try:
+                start = perf_counter()
+                base_resp = transport.post(self.api_url + method_url, data, timeout, timed=True)
+                body_at = perf_counter()
+                received = len(base_resp.content)
+                timings["wait"] = base_resp.wait
+                timings["transfer"] = body_at - start - base_resp.wait
+                resp = self.json_loads(base_resp.content)
+                timings["decode"] = perf_counter() - body_at
+            except ValueError as ve:
+                raise _decode_error(base_resp.status_code if base_resp else None, ve, self.print_errors)
+            except Exception as e:
+                raise _request_error(base_resp.status_code if base_resp else None, e, self.print_errors)
+            return _check_response(resp, base_resp.status_code if base_resp else None, self.print_errors)
+        except pyPayokAPIException as pe:
+            error = pe
+            raise pe
+        finally:
+            self.instrumentation.observe_request(
+                method_url, timings, len(urllib.parse.urlencode(data)), received, error)
 
+    def __deserialize(self, method_url, de_json, resp, *args):
+        """
+        Convert response with de_json (measured if instrumentation is set)
+
+        :param method_url: (String) API method url (part)
+        :param de_json: Deserialization function
+        :param resp: Decoded response
+        """
+        if self.instrumentation is None:
+            return de_json(resp, *args)
+        start = perf_counter()
+        result = de_json(resp, *args)
+        records = len(result.items) if hasattr(result, "items") else 1
+        self.instrumentation.observe_deserialize(method_url, perf_counter() - start, records)
+        return result
+
+    def __cached(self, key, loader, deadline = None):
+        """
+        Return cached response of read-only call or load it (concurrent identical calls share one request)
+
+        :param key: Cache key, key[0] is method name
+        :param loader: Function() making the call
+        :param deadline: (Deadline, Optional) Deadline of the call (limits waiting for identical call)
+        """
+        ttl = self.cache_ttl.get(key[0])
+        if not ttl:
+            return loader()
+        if deadline is None:
+            return self.response_cache.get(key, loader, ttl)
+        from concurrent.futures import TimeoutError as FutureTimeout
+
+        try:
+            return self.response_cache.get(key, loader, ttl, deadline.remaining())
+        except FutureTimeout:
+            raise deadline.exceeded()
 
-    def balance(self):
+    def invalidate_cache(self, method = None):
+        """
+        Drop cached responses
+
+        :param method: (Optional) Method name ("balance", "transaction"), None - all methods
+        """
+        if self.response_cache:
+            self.response_cache.invalidate(None if method is None else (lambda key: key[0] == method))
+
+    def cache_stats(self):
+        """
+        Returns response cache counters (hits, misses, coalesced, size) or None if cache is disabled
+        """
+        return self.response_cache.stats() if self.response_cache else None
+
+
+    def balance(self, deadline = None):
         """
         Get balance of account
         https://payok.io/cabinet/documentation/doc_api_balance
+
+        :param deadline: (Deadline or seconds, Optional) Deadline of the call (including retries)
         """
         method = "balance"
-        resp = self.__request(method)
-        return Balance.de_json(resp)
+        deadline = to_deadline(deadline)
+        return self.__cached((method,), lambda: self.__deserialize(
+            method, Balance.de_json, self.__request(method, deadline)), deadline)
 
 
-    def transaction(self, shop, payment = None, offset = None):
+    def transaction(self, shop, payment = None, offset = None, deadline = None):
         """
         Get transactions list.
         Max 100 records, use offset to get more.
@@ -131,68 +619,79 @@ class pyPayokAPI:
         :param shop: Shop ID
         :param payment: (Optional) Payment ID (only one record with this payment will be returned)
         :param offset: (Optional) Offset (skip given number of transactions)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the call (including retries)
         """
+        deadline = to_deadline(deadline)
+        if payment and not offset:
+            return self.__cached(("transaction", shop, payment),
+                                 lambda: self.__transaction(shop, payment, offset, deadline), deadline)
+        return self.__transaction(shop, payment, offset, deadline)
+
+    def __transaction(self, shop, payment, offset, deadline):
         _method = "transaction"
-        params = {
-            "shop": shop,
-        }
-        if payment:
-            params["payment"] = payment
-        if offset:
-            params["offset"] = offset
+        params = _transaction_params(shop, payment, offset)
         try:
-            resp = self.__request(_method, **params)
+            resp = self.__request(_method, deadline, **params)
         except pyPayokAPIException as pe:
             if pe.code == 10:
                 # Error "No transactions"
                 return Transactions()
             else:
                 raise pe
-        return Transactions.de_json(resp)
+        return self.__deserialize(_method, Transactions.de_json, resp)
 
-    def transactions(self, shop, max_results = 15, max_pages = 10, status = None):
+    def transactions(self, shop, max_results = 15, max_pages = 10, status = None, prefetch = 1,
+                     since = None, until = None, method = None, deadline = None):
         """
         Get transactions list (advanced method for "transaction").
+        Pages are requested under client rate limit and fetching stops at the end of data.
+        API has no filter parameters, so filters are applied to fetched pages. History is ordered by date:
+        fetching starts at the page containing "until" (found by binary search) and stops at "since".
 
         :param shop: Shop ID
         :param max_results: (Int, Optional, default=15) Max number of results to collect
         :param max_pages: (Int, Optional, default=10) Max number of pages to process
-        :param status: (PaymentStatus, Optional) Filter by status
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param prefetch: (Int, Optional, default=1) Max number of pages fetched in parallel
+            (limited by the number of pages needed at the observed match rate)
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the whole call (all pages)
         """
+        deadline = to_deadline(deadline)
+        pages = window_pager(
+            lambda offset: self.transaction(shop, offset=offset, deadline=deadline).items, "date", until,
+            max_pages=max_pages, prefetch=prefetch, rate_limiter=self.rate_limiter, deadline=deadline)
+        match, stop = window_filter("date", "transaction_status", status, method, since, until)
+        return collect(pages, Transactions(), max_results, match, stop)
 
-        result = Transactions()
-
-        page_number = 0
-        page_size = 100
-        offset = 0
-        while page_number < max_pages:
-            if page_number > 0: sleep(1)
-            resp = self.transaction(shop, offset = offset)
 
-            if not resp.items:
-                # No (more) transactions
-                break
-
-            for transaction in resp.items:
-                if transaction.transaction_status != status:
-                    continue
-                result.items.append(transaction)
-
-                if len(result.items) >= max_results:
-                    # Enough results collected
-                    break
-
-            if len(result.items) >= max_results:
-                # Enough results collected
-                break
-
-            offset += page_size
-            page_number += 1
+    def iter_transactions(self, shop, status = None, since = None, max_pages = None, prefetch = 2,
+                          until = None, method = None, deadline = None):
+        """
+        Iterate over transactions lazily (newest first).
+        Records are yielded page by page, next page is fetched in background.
+        Fetching stops when iteration is stopped (generator is closed or collected).
 
-        return result
+        :param shop: Shop ID
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param since: (datetime, Optional) Stop on transactions created before this date
+        :param max_pages: (Int, Optional) Max number of pages to process (None - all)
+        :param prefetch: (Int, Optional, default=2) Number of pages fetched in parallel
+        :param until: (datetime, Optional) Skip transactions created at or after this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the whole call (all pages)
+        """
+        deadline = to_deadline(deadline)
+        pages = window_pager(
+            lambda offset: self.transaction(shop, offset=offset, deadline=deadline).items, "date", until,
+            max_pages=max_pages, prefetch=prefetch, rate_limiter=self.rate_limiter, deadline=deadline)
+        match, stop = window_filter("date", "transaction_status", status, method, since, until)
+        return iterate(pages, match, stop)
 
 
-    def payout(self, payout_id = None, offset = None):
+    def payout(self, payout_id = None, offset = None, deadline = None):
         """
         Get payouts list.
         Max 100 records, use offset to get more.
@@ -200,28 +699,70 @@ class pyPayokAPI:
 
         :param payout_id: (Optional) Payment ID (only one record with this payout will be returned)
         :param offset: (Optional) Offset (skip given number of payouts)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the call (including retries)
         """
         _method = "payout"
-        params = {}
-        if payout_id:
-            params["payout_id"] = payout_id
-        if offset:
-            params["offset"] = offset
+        params = _payout_params(payout_id, offset)
         try:
-            if params:
-                resp = self.__request(_method, **params)
-            else:
-                resp = self.__request(_method)
+            resp = self.__request(_method, to_deadline(deadline), **params)
         except pyPayokAPIException as pe:
             if pe.code == 7:
                 # Error "No payouts"
                 return Payouts()
             else:
                 raise pe
-        return Payouts.de_json(resp)
+        return self.__deserialize(_method, Payouts.de_json, resp)
+
+
+    def payouts(self, max_results = 15, max_pages = 10, status = None, prefetch = 1,
+                since = None, until = None, method = None, deadline = None):
+        """
+        Get payouts list (advanced method for "payout").
+        Pages are requested under client rate limit and fetching stops at the end of data.
+        Date window is handled as in transactions().
+
+        :param max_results: (Int, Optional, default=15) Max number of results to collect
+        :param max_pages: (Int, Optional, default=10) Max number of pages to process
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param prefetch: (Int, Optional, default=1) Max number of pages fetched in parallel
+            (limited by the number of pages needed at the observed match rate)
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the whole call (all pages)
+        """
+        deadline = to_deadline(deadline)
+        pages = window_pager(
+            lambda offset: self.payout(offset=offset, deadline=deadline).items, "date_create", until,
+            max_pages=max_pages, prefetch=prefetch, rate_limiter=self.rate_limiter, deadline=deadline)
+        match, stop = window_filter("date_create", "status", status, method, since, until)
+        return collect(pages, Payouts(), max_results, match, stop)
 
 
-    def payout_create(self, amount, method, reciever, comission_type, webhook_url = None):
+    def iter_payouts(self, status = None, since = None, max_pages = None, prefetch = 2,
+                     until = None, method = None, deadline = None):
+        """
+        Iterate over payouts lazily (newest first).
+        Records are yielded page by page, next page is fetched in background.
+        Fetching stops when iteration is stopped (generator is closed or collected).
+
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param since: (datetime, Optional) Stop on payouts created before this date
+        :param max_pages: (Int, Optional) Max number of pages to process (None - all)
+        :param prefetch: (Int, Optional, default=2) Number of pages fetched in parallel
+        :param until: (datetime, Optional) Skip payouts created at or after this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        :param deadline: (Deadline or seconds, Optional) Deadline of the whole call (all pages)
+        """
+        deadline = to_deadline(deadline)
+        pages = window_pager(
+            lambda offset: self.payout(offset=offset, deadline=deadline).items, "date_create", until,
+            max_pages=max_pages, prefetch=prefetch, rate_limiter=self.rate_limiter, deadline=deadline)
+        match, stop = window_filter("date_create", "status", status, method, since, until)
+        return iterate(pages, match, stop)
+
+
+    def payout_create(self, amount, method, reciever, comission_type, webhook_url = None, deadline = None):
         """
         Create payout.
         https://payok.io/cabinet/documentation/doc_api_payout_create
@@ -231,18 +772,17 @@ class pyPayokAPI:
         :param reciever: Reciever credentials
         :param comission_type: Comission type (see PayoutCommissionType)
         :param webhook_url: (Optional) Webhook URL to call when payout status changes
+        :param deadline: (Deadline or seconds, Optional) Deadline of the call (payout is never hedged or retried;
+            the payout may still be created if the deadline is exceeded)
         """
         _method = "payout_create"
-        params = {
-            "amount": amount,
-            "method": method.name if isinstance(method, PayoutMethod) else method,
-            "reciever": reciever,
-            "comission_type": comission_type.name if isinstance(comission_type, PaymentCommissionType) else comission_type,
-        }
-        if webhook_url:
-            params["webhook_url"] = webhook_url
-        resp = self.__request(_method, **params)
-        return Payout.de_json(resp, 1)
+        params = _payout_create_params(amount, method, reciever, comission_type, webhook_url)
+        try:
+            resp = self.__request(_method, to_deadline(deadline), **params)
+        finally:
+            # Balance is changed by payout (it may be created even if the request failed)
+            self.invalidate_cache("balance")
+        return self.__deserialize(_method, Payout.de_json, resp, 1)
 
 
     def payment_link_create(
@@ -262,39 +802,46 @@ class pyPayokAPI:
         :param lang: (Optional) Interface language (RU or EN)
         :param custom: (Optional) Your custom parameter to pass in notification
         """
-        if not self.secret_key:
-            raise pyPayokAPIException(-7, "No secret key provided when creating pyPayokAPI")
+        return PaymentLinkBuilder(self.secret_key).build(
+            amount, payment, shop, desc, currency,
+            email=email, success_url=success_url, method=method, lang=lang, custom=custom)
 
-        sign_data = [
-            amount,
-            payment,
-            shop,
-            currency,
-            desc if desc else "",
-            self.secret_key,
-        ]
-        sign = hashlib.md5("|".join(map(str, sign_data)).encode("utf-8")).hexdigest()
-
-        url = "https://payok.io/pay?amount={amount}&payment={payment}&shop={shop}&desc={desc}&currency={currency}&sign={sign}".format(
-            amount=amount,
-            payment=urllib.parse.quote(payment),
-            shop=shop,
-            desc=urllib.parse.quote(desc if desc else ""),
-            currency=currency,
-            sign=sign,
-        )
-        if email:
-            url += f"&email={email}"
-        if success_url:
-            success_url = urllib.parse.quote_plus(success_url)
-            url += f"&success_url={success_url}"
-        if method:
-            if isinstance(method, PaymentMethod):
-                url += f"&method={method.name}"
-            else:
-                url += f"&method={method}"
-        if lang:
-            url += f"&lang={lang}"
-        if custom:
-            url += f"&customparam={custom}"
-        return url
+    def iter_payment_links(self, orders, processes = None, chunk_size = 1000):
+        """
+        Create payment links for many orders (generator).
+        Links are yielded in the order of orders and match payment_link_create output.
+
+        :param orders: Iterable of orders: dicts of payment_link_create keyword arguments or tuples of positional arguments
+        :param processes: (Int, Optional) Number of worker processes for signing (None - sign in current process)
+        :param chunk_size: (Int, Optional, default=1000) Number of orders passed to worker process at once
+        """
+        builder = PaymentLinkBuilder(self.secret_key)
+        if not processes:
+            return (builder.build(**order) if isinstance(order, dict) else builder.build(*order) for order in orders)
+        return self.__iter_payment_links_parallel(orders, processes, chunk_size)
+
+    def __iter_payment_links_parallel(self, orders, processes, chunk_size):
+        from concurrent.futures import ProcessPoolExecutor
+
+        orders = iter(orders)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = deque()
+            while True:
+                # Keep bounded number of chunks in flight
+                while len(futures) < processes * 2:
+                    chunk = list(islice(orders, chunk_size))
+                    if not chunk:
+                        break
+                    futures.append(executor.submit(_build_links, self.secret_key, chunk))
+                if not futures:
+                    return
+                yield from futures.popleft().result()
+
+    def payment_links_create_many(self, orders, processes = None, chunk_size = 1000):
+        """
+        Create payment links for many orders.
+        See iter_payment_links for parameters.
+
+        :return: list of links
+        """
+        return list(self.iter_payment_links(orders, processes=processes, chunk_size=chunk_size))
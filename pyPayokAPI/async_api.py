@@ -0,0 +1,421 @@
+import asyncio
+import urllib.parse
+from time import perf_counter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .api import API_URL, pyPayokAPIException, _request_data, _decode_error, _request_error, _check_response, \
+    _transaction_params, _payout_params, _payout_create_params, PaymentLinkBuilder
+from .payok_types import *
+from .pagination import PAGE_SIZE, TokenBucket, window_filter
+from .json_decoder import get_decoder
+
+
+async def gather_limited(aws, concurrency = 50, return_exceptions = False):
+    """
+    asyncio.gather with limited number of simultaneously running awaitables.
+    Results are returned in the order of input.
+
+    :param aws: Iterable of awaitables
+    :param concurrency: (Int, Optional, default=50) Max number of awaitables running at once
+    :param return_exceptions: (Bool, Optional, default=False) Return exceptions as results instead of raising
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[run(aw) for aw in aws], return_exceptions=return_exceptions)
+
+
+# noinspection PyPep8Naming
+class AsyncPayokAPI:
+    """
+    pyPayokAPI asyncio API Client (core API methods, without iter_* generators, response cache, deadlines,
+    hedging and batch payment links)
+    Requires httpx (pip install httpx)
+    """
+
+    def __init__(self, api_id, api_key,
+                 secret_key = None,
+                 print_errors = False, timeout = None,
+                 max_connections = 100, max_keepalive_connections = 20, keepalive_expiry = 5.0,
+                 client = None, api_url = None,
+                 rate_limit = 1, rate_burst = 1,
+                 retry_policy = None, circuit_breaker = None, instrumentation = None,
+                 json_decoder = None, http2 = False):
+        """
+        Create the AsyncPayokAPI instance.
+
+        :param api_id: API id for access
+        :param api_key: API key for access
+        :param secret_key: (Optional) Secret key for payment links
+        :param print_errors: (Optional) Print dumps on request errors
+        :param timeout: (Optional) Request timeout
+        :param max_connections: (Int, Optional, default=100) Max number of simultaneous connections
+        :param max_keepalive_connections: (Int, Optional, default=20) Max number of idle connections kept in pool
+        :param keepalive_expiry: (Float, Optional, default=5.0) Idle connection expiry time (seconds)
+        :param client: (Optional) External httpx.AsyncClient to use (it is not closed by aclose())
+        :param api_url: (Optional) API base url (for tests and local simulators)
+        :param rate_limit: (Float, Optional, default=1) Paginated requests per second (None - no limit)
+        :param rate_burst: (Int, Optional, default=1) Max number of paginated requests made at once
+        :param retry_policy: (RetryPolicy, Optional) Retry policy for failed requests of read-only methods
+        :param circuit_breaker: (CircuitBreaker, Optional) Fail fast while API is down
+        :param instrumentation: (Metrics, Optional) Collect request timings, counters and tracing spans
+        :param json_decoder: (Optional) JSON backend: "orjson", "msgspec", "json" (default - the fastest installed)
+        :param http2: (Bool, Optional, default=False) Multiplex concurrent requests over one HTTP/2 connection
+            (requires httpx[http2])
+        """
+        if httpx is None:
+            raise ImportError("AsyncPayokAPI requires httpx: pip install httpx")
+        self.api_id = api_id
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.print_errors = print_errors
+        self.timeout = timeout
+        self.api_url = api_url or API_URL
+        if client is None:
+            self.client = httpx.AsyncClient(
+                timeout=timeout, http2=http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry))
+            self.own_client = True
+        else:
+            self.client = client
+            self.own_client = False
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.instrumentation = instrumentation
+        self.json_loads = get_decoder(json_decoder)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """
+        Close pooled connections (only if client is owned by the instance)
+        """
+        if self.own_client and self.client is not None:
+            await self.client.aclose()
+        self.client = None
+
+    async def __request(self, method_url, **kwargs):
+        """
+        Send request to API (with retries and circuit breaker if configured)
+
+        :param method_url: (String) API method url (part)
+        :param kwargs: request data
+        """
+        data = _request_data(self.api_id, self.api_key, kwargs)
+        if self.instrumentation is not None:
+            with self.instrumentation.span(method_url):
+                return await self.__attempts(method_url, data)
+        return await self.__attempts(method_url, data)
+
+    async def __attempts(self, method_url, data):
+        """
+        Send request with retries and circuit breaker (if configured)
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        """
+        if self.retry_policy is None and self.circuit_breaker is None:
+            return await self.__send(method_url, data)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.circuit_breaker and not self.circuit_breaker.allow():
+                raise pyPayokAPIException(-10, "API is unavailable (circuit breaker is open)")
+            try:
+                resp = await self.__send(method_url, data)
+            except pyPayokAPIException as pe:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record(pe)
+                if self.retry_policy and self.retry_policy.should_retry(method_url, pe, attempt):
+                    if self.instrumentation is not None:
+                        self.instrumentation.observe_retry(method_url, pe)
+                    await asyncio.sleep(self.retry_policy.delay(pe, attempt))
+                    continue
+                raise pe
+            except Exception as e:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record(e)
+                raise
+            except BaseException:
+                # Cancelled
+                if self.circuit_breaker:
+                    self.circuit_breaker.cancel()
+                raise
+            if self.circuit_breaker:
+                self.circuit_breaker.record()
+            return resp
+
+    async def __send(self, method_url, data):
+        """
+        Send one request to API
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        """
+        if self.client is None:
+            raise pyPayokAPIException(-8, "Client is closed")
+        if self.instrumentation is not None:
+            return await self.__send_instrumented(method_url, data)
+
+        base_resp = None
+        status_code = None
+        try:
+            base_resp = await self.client.post(self.api_url + method_url, data=data, timeout=self.timeout)
+            status_code = base_resp.status_code if base_resp.is_success else None
+            resp = self.json_loads(base_resp.content)
+        except ValueError as ve:
+            raise _decode_error(status_code, ve, self.print_errors)
+        except Exception as e:
+            raise _request_error(status_code, e, self.print_errors)
+        return _check_response(resp, status_code, self.print_errors)
+
+    async def __send_instrumented(self, method_url, data):
+        """
+        Send one request to API, measuring phases and sizes
+
+        :param method_url: (String) API method url (part)
+        :param data: request data
+        """
+        timings = {}
+        received = 0
+        error = None
+        base_resp = None
+        status_code = None
+        try:
+            try:
+                start = perf_counter()
+                # Body is read separately to split waiting and transfer time
+                request = self.client.build_request("POST", self.api_url + method_url, data=data, timeout=self.timeout)
+                base_resp = await self.client.send(request, stream=True)
+                headers_at = perf_counter()
+                try:
+                    received = len(await base_resp.aread())
+                finally:
+                    await base_resp.aclose()
+                body_at = perf_counter()
+                timings["wait"] = headers_at - start
+                timings["transfer"] = body_at - headers_at
+                status_code = base_resp.status_code if base_resp.is_success else None
+                resp = self.json_loads(base_resp.content)
+                timings["decode"] = perf_counter() - body_at
+            except ValueError as ve:
+                raise _decode_error(status_code, ve, self.print_errors)
+            except Exception as e:
+                raise _request_error(status_code, e, self.print_errors)
+            return _check_response(resp, status_code, self.print_errors)
+        except pyPayokAPIException as pe:
+            error = pe
+            raise pe
+        finally:
+            self.instrumentation.observe_request(
+                method_url, timings, len(urllib.parse.urlencode(data)), received, error)
+
+    def __deserialize(self, method_url, de_json, resp, *args):
+        """
+        Convert response with de_json (measured if instrumentation is set)
+
+        :param method_url: (String) API method url (part)
+        :param de_json: Deserialization function
+        :param resp: Decoded response
+        """
+        if self.instrumentation is None:
+            return de_json(resp, *args)
+        start = perf_counter()
+        result = de_json(resp, *args)
+        records = len(result.items) if hasattr(result, "items") else 1
+        self.instrumentation.observe_deserialize(method_url, perf_counter() - start, records)
+        return result
+
+
+    async def balance(self):
+        """
+        Get balance of account
+        https://payok.io/cabinet/documentation/doc_api_balance
+        """
+        method = "balance"
+        resp = await self.__request(method)
+        return self.__deserialize(method, Balance.de_json, resp)
+
+
+    async def transaction(self, shop, payment = None, offset = None):
+        """
+        Get transactions list.
+        Max 100 records, use offset to get more.
+        https://payok.io/cabinet/documentation/doc_api_transaction
+
+        :param shop: Shop ID
+        :param payment: (Optional) Payment ID (only one record with this payment will be returned)
+        :param offset: (Optional) Offset (skip given number of transactions)
+        """
+        _method = "transaction"
+        params = _transaction_params(shop, payment, offset)
+        try:
+            resp = await self.__request(_method, **params)
+        except pyPayokAPIException as pe:
+            if pe.code == 10:
+                # Error "No transactions"
+                return Transactions()
+            else:
+                raise pe
+        return self.__deserialize(_method, Transactions.de_json, resp)
+
+    async def transactions(self, shop, max_results = 15, max_pages = 10, status = None,
+                           since = None, until = None, method = None):
+        """
+        Get transactions list (advanced method for "transaction").
+        Fetching stops at the first transaction created before "since".
+
+        :param shop: Shop ID
+        :param max_results: (Int, Optional, default=15) Max number of results to collect
+        :param max_pages: (Int, Optional, default=10) Max number of pages to process
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        """
+        match, stop = window_filter("date", "transaction_status", status, method, since, until)
+        return await self.__collect(
+            lambda offset: self.transaction(shop, offset=offset), Transactions(), max_results, max_pages, match, stop)
+
+    async def __collect(self, fetch_page, result, max_results, max_pages, match, stop = None):
+        """
+        Collect items of sequentially fetched pages under client rate limit
+
+        :param fetch_page: Coroutine function(offset) returning Transactions or Payouts
+        :param result: Container to collect items into
+        :param max_results: Max number of results to collect
+        :param max_pages: Max number of pages to process
+        :param match: Function(item) returning True for items to collect or None
+        :param stop: (Optional) Function(item) returning True when collecting should stop
+        """
+        for page_number in range(max_pages):
+            if self.rate_limiter:
+                await asyncio.sleep(self.rate_limiter.reserve())
+            items = (await fetch_page(page_number * PAGE_SIZE)).items
+            for item in items:
+                if stop and stop(item):
+                    return result
+                if match and not match(item):
+                    continue
+                result.items.append(item)
+                if len(result.items) >= max_results:
+                    # Enough results collected
+                    return result
+            if len(items) < PAGE_SIZE:
+                # No more items
+                break
+        return result
+
+
+    async def payout(self, payout_id = None, offset = None):
+        """
+        Get payouts list.
+        Max 100 records, use offset to get more.
+        https://payok.io/cabinet/documentation/doc_api_payout
+
+        :param payout_id: (Optional) Payment ID (only one record with this payout will be returned)
+        :param offset: (Optional) Offset (skip given number of payouts)
+        """
+        _method = "payout"
+        params = _payout_params(payout_id, offset)
+        try:
+            resp = await self.__request(_method, **params)
+        except pyPayokAPIException as pe:
+            if pe.code == 7:
+                # Error "No payouts"
+                return Payouts()
+            else:
+                raise pe
+        return self.__deserialize(_method, Payouts.de_json, resp)
+
+
+    async def payouts(self, max_results = 15, max_pages = 10, status = None,
+                      since = None, until = None, method = None):
+        """
+        Get payouts list (advanced method for "payout").
+        Fetching stops at the first payout created before "since".
+
+        :param max_results: (Int, Optional, default=15) Max number of results to collect
+        :param max_pages: (Int, Optional, default=10) Max number of pages to process
+        :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+        """
+        match, stop = window_filter("date_create", "status", status, method, since, until)
+        return await self.__collect(
+            lambda offset: self.payout(offset=offset), Payouts(), max_results, max_pages, match, stop)
+
+
+    async def payout_create(self, amount, method, reciever, comission_type, webhook_url = None):
+        """
+        Create payout.
+        https://payok.io/cabinet/documentation/doc_api_payout_create
+
+        :param amount: Amount to payout
+        :param method: Payout method (see PayoutMethod)
+        :param reciever: Reciever credentials
+        :param comission_type: Comission type (see PayoutCommissionType)
+        :param webhook_url: (Optional) Webhook URL to call when payout status changes
+        """
+        _method = "payout_create"
+        params = _payout_create_params(amount, method, reciever, comission_type, webhook_url)
+        resp = await self.__request(_method, **params)
+        return self.__deserialize(_method, Payout.de_json, resp, 1)
+
+
+    def payment_link_create(
+            self, amount, payment, shop, desc, currency,
+            email = None, success_url = None, method = None, lang = None, custom = None):
+        """
+        Create payment link (invoice). No request is made, so method is not a coroutine.
+        See pyPayokAPI.payment_link_create for parameters.
+        """
+        return PaymentLinkBuilder(self.secret_key).build(
+            amount, payment, shop, desc, currency,
+            email=email, success_url=success_url, method=method, lang=lang, custom=custom)
+
+
+    async def transaction_many(self, shops, payment = None, offset = None, concurrency = 50, return_exceptions = False):
+        """
+        Get transactions lists of several shops concurrently.
+        Results are returned in the order of shops.
+
+        :param shops: Iterable of shop IDs
+        :param payment: (Optional) Payment ID
+        :param offset: (Optional) Offset
+        :param concurrency: (Int, Optional, default=50) Max number of simultaneous requests
+        :param return_exceptions: (Bool, Optional, default=False) Return pyPayokAPIException as result instead of raising
+        """
+        return await gather_limited(
+            [self.transaction(shop, payment=payment, offset=offset) for shop in shops],
+            concurrency=concurrency, return_exceptions=return_exceptions)
+
+    async def payout_many(self, payout_ids, concurrency = 50, return_exceptions = False):
+        """
+        Get several payouts concurrently.
+        Results (Payouts) are returned in the order of payout_ids.
+
+        :param payout_ids: Iterable of payout IDs
+        :param concurrency: (Int, Optional, default=50) Max number of simultaneous requests
+        :param return_exceptions: (Bool, Optional, default=False) Return pyPayokAPIException as result instead of raising
+        """
+        return await gather_limited(
+            [self.payout(payout_id=payout_id) for payout_id in payout_ids],
+            concurrency=concurrency, return_exceptions=return_exceptions)
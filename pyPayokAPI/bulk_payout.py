@@ -0,0 +1,322 @@
+import json
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import sleep, time
+
+from .api import pyPayokAPIException
+from .pagination import TokenBucket, PAGE_SIZE
+from .payok_types import PayoutMethod, PaymentCommissionType
+
+# Journal states
+PENDING = "pending"
+CREATED = "created"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+_AMBIGUOUS = object()
+
+
+class PayoutResult:
+    """
+    Result of bulk payout item
+    """
+
+    def __init__(self, key, state, payout_id = None, error = None, duplicate = False):
+        """
+        :param key: Idempotency key of item
+        :param state: "created", "failed" or "unknown" (payout may exist, manual check needed)
+        :param payout_id: (Optional) ID of created payout
+        :param error: (Optional) pyPayokAPIException of failed item
+        :param duplicate: (Bool) Item was already processed before (by key)
+        """
+        self.key = key
+        self.state = state
+        self.payout_id = payout_id
+        self.error = error
+        self.duplicate = duplicate
+
+    def __str__(self):
+        return str(self.__dict__)
+
+
+class BulkPayoutExecutor:
+    """
+    Idempotent bulk payout submission.
+    Every item has client-side idempotency key and is recorded in local SQLite journal before it is sent.
+    Items are sent with bounded concurrency under rate limit. After ambiguous failure (anything but API error:
+    timeout, broken response) payout list is checked for the payout before any retry, so the same item is never
+    paid twice.
+
+    PayOK does not accept idempotency keys, so payout is recognized in the list by amount and method among payouts
+    created after the item was sent and not claimed by other journal items. While another item with the same amount
+    and method has ambiguous result too, the payout can not be attributed and the item is left "unknown"
+    (check it manually and record the result with resolve()).
+    """
+
+    def __init__(self, client, journal_path = "payok_payouts.sqlite3",
+                 max_workers = 4, rate_limit = 2, rate_burst = 1,
+                 max_attempts = 3, reconcile_delay = 2.0, reconcile_pages = 3):
+        """
+        :param client: pyPayokAPI instance
+        :param journal_path: (Optional, default="payok_payouts.sqlite3") SQLite journal path
+        :param max_workers: (Int, Optional, default=4) Max number of simultaneous payout_create calls
+        :param rate_limit: (Float, Optional, default=2) payout_create calls per second
+        :param rate_burst: (Int, Optional, default=1) Max number of calls made at once
+        :param max_attempts: (Int, Optional, default=3) Max number of attempts per item
+        :param reconcile_delay: (Float, Optional, default=2.0) Delay before checking payout list after failure (seconds)
+        :param reconcile_pages: (Int, Optional, default=3) Max number of payout list pages checked (if more payouts
+            were created since the item was sent, its result is "unknown")
+        """
+        self.client = client
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.max_attempts = max_attempts
+        self.reconcile_delay = reconcile_delay
+        self.reconcile_pages = reconcile_pages
+        self.lock = threading.RLock()
+        self.in_flight = threading.Condition(self.lock)
+        self.sending = {}
+        # Results of items processed now (by key) and keys of items with ambiguous result (by signature)
+        self.claims = {}
+        self.unresolved = {}
+        self.db = sqlite3.connect(journal_path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS payout_journal ("
+                "key TEXT PRIMARY KEY, params TEXT NOT NULL, state TEXT NOT NULL, payout_id INTEGER, "
+                "baseline_payout_id INTEGER NOT NULL, attempts INTEGER NOT NULL, error TEXT, updated REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS payout_journal_payout ON payout_journal (payout_id)")
+
+    def close(self):
+        """
+        Close journal
+        """
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def entry(self, key):
+        """
+        Returns journal entry of item as dict (None if item is unknown)
+
+        :param key: Idempotency key
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT key, params, state, payout_id, baseline_payout_id, attempts, error FROM payout_journal "
+                "WHERE key = ?", (str(key),)).fetchone()
+        if row is None:
+            return None
+        return {
+            "key": row[0], "params": json.loads(row[1]), "state": row[2], "payout_id": row[3],
+            "baseline_payout_id": row[4], "attempts": row[5], "error": row[6],
+        }
+
+    def __save(self, key, params, state, baseline, attempts, payout_id = None, error = None):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO payout_journal VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(key), json.dumps(params), state, payout_id, baseline, attempts, error, time()))
+
+    def __newest_payout_id(self):
+        items = self.client.payout().items
+        return max((item.payout_id for item in items), default=0)
+
+    def submit(self, orders):
+        """
+        Submit payouts. Results are yielded as items finish (not in the order of orders).
+
+        :param orders: Iterable of dicts: "key" (unique idempotency key) and payout_create arguments
+            ("amount", "method", "reciever", "comission_type", optional "webhook_url")
+        :return: generator of PayoutResult
+        """
+        # Payouts created by this batch will have greater IDs
+        baseline = self.__newest_payout_id()
+        orders = iter(orders)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = set()
+            while True:
+                while len(futures) < self.max_workers * 2:
+                    order = next(orders, None)
+                    if order is None:
+                        break
+                    futures.add(executor.submit(self.__process, order, baseline))
+                if not futures:
+                    return
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+    def __process(self, order, baseline):
+        claim_key = str(order["key"])
+        with self.lock:
+            claim = self.claims.get(claim_key)
+            owner = claim is None
+            if owner:
+                claim = self.claims[claim_key] = Future()
+        if not owner:
+            # Item with the same key is processed by another worker
+            result = claim.result()
+            return PayoutResult(order["key"], result.state, result.payout_id, result.error, duplicate=True)
+        try:
+            result = self.__process_claimed(order, baseline)
+        except BaseException as e:
+            claim.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.claims[claim_key]
+        claim.set_result(result)
+        return result
+
+    def __process_claimed(self, order, baseline):
+        key = order["key"]
+        params = {
+            "amount": order["amount"],
+            "method": order["method"].name if isinstance(order["method"], PayoutMethod) else order["method"],
+            "reciever": order["reciever"],
+            "comission_type": order["comission_type"].name
+                if isinstance(order["comission_type"], PaymentCommissionType) else order["comission_type"],
+            "webhook_url": order.get("webhook_url"),
+        }
+        attempts = 0
+        entry = self.entry(key)
+        if entry is not None:
+            if entry["state"] in (CREATED, FAILED):
+                return PayoutResult(key, entry["state"], entry["payout_id"], duplicate=True)
+            # Previous run was interrupted or ended with ambiguous result
+            params = entry["params"]
+            baseline = entry["baseline_payout_id"]
+            attempts = entry["attempts"]
+        signature = _signature(params)
+        if entry is not None:
+            with self.lock:
+                self.unresolved.setdefault(signature, set()).add(key)
+        try:
+            if entry is not None:
+                found = self.__reconcile(key, params, signature, baseline, attempts)
+                if found is _AMBIGUOUS:
+                    return PayoutResult(key, UNKNOWN, duplicate=True)
+                if found is not None:
+                    return PayoutResult(key, CREATED, found, duplicate=True)
+
+            error = None
+            while attempts < self.max_attempts:
+                attempts += 1
+                self.__save(key, params, PENDING, baseline, attempts)
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                with self.lock:
+                    self.sending[signature] = self.sending.get(signature, 0) + 1
+                try:
+                    try:
+                        payout = self.client.payout_create(**params)
+                    except pyPayokAPIException as pe:
+                        error = pe
+                    except Exception as e:
+                        # Request was answered, but response is unusable
+                        error = pyPayokAPIException(-2, "Response decode failed: {}".format(e))
+                    else:
+                        self.__save(key, params, CREATED, baseline, attempts, payout_id=payout.payout_id)
+                        return PayoutResult(key, CREATED, payout.payout_id)
+                    if error.api_error:
+                        # API rejected payout
+                        self.__save(key, params, FAILED, baseline, attempts, error=error.message)
+                        return PayoutResult(key, FAILED, error=error)
+                    # Ambiguous failure (timeout, broken or unexpected response): payout may be created
+                    with self.lock:
+                        self.unresolved.setdefault(signature, set()).add(key)
+                finally:
+                    # Outcome is journaled before identical payouts are reconciled
+                    with self.lock:
+                        self.sending[signature] -= 1
+                        self.in_flight.notify_all()
+
+                sleep(self.reconcile_delay)
+                found = self.__reconcile(key, params, signature, baseline, attempts, error)
+                if found is _AMBIGUOUS:
+                    return PayoutResult(key, UNKNOWN, error=error)
+                if found is not None:
+                    return PayoutResult(key, CREATED, found)
+
+            self.__save(key, params, FAILED, baseline, attempts, error=error.message if error else None)
+            return PayoutResult(key, FAILED, error=error)
+        finally:
+            with self.lock:
+                self.unresolved.get(signature, set()).discard(key)
+
+    def __outstanding(self, key, signature):
+        """
+        Returns keys of other items with the same signature whose payout may exist but is not matched
+        """
+        keys = self.unresolved.get(signature, set()) - {key}
+        # Interrupted and unknown items of previous runs
+        rows = self.db.execute("SELECT key, params FROM payout_journal WHERE state IN (?, ?)", (PENDING, UNKNOWN))
+        for other, params in rows:
+            if other != key and other not in self.claims and _signature(json.loads(params)) == signature:
+                keys.add(other)
+        return keys
+
+    def __reconcile(self, key, params, signature, baseline, attempts, error = None):
+        """
+        Find unclaimed payout of item among payouts created after baseline and journal the result.
+        Returns payout ID, None (not created) or _AMBIGUOUS (item is journaled as unknown).
+        """
+        amount, method = signature
+        with self.in_flight:
+            # Payouts of identical in-flight requests are not journaled yet
+            while self.sending.get(signature):
+                self.in_flight.wait()
+            candidates = []
+            complete = False
+            for page in range(self.reconcile_pages):
+                items = self.client.payout(offset=page * PAGE_SIZE).items
+                for item in items:
+                    if item.payout_id <= baseline:
+                        continue
+                    if abs(item.amount - amount) < 0.005 and item.method.name == method:
+                        candidates.append(item.payout_id)
+                if len(items) < PAGE_SIZE or any(item.payout_id <= baseline for item in items):
+                    complete = True
+                    break
+            unclaimed = [payout_id for payout_id in candidates if not self.db.execute(
+                "SELECT 1 FROM payout_journal WHERE payout_id = ?", (payout_id,)).fetchone()]
+            if not unclaimed and complete:
+                self.unresolved.get(signature, set()).discard(key)
+                return None
+            # Payout was not looked for among older payouts (more than reconcile_pages were created since baseline),
+            # or can not be told apart from payouts of other ambiguous items with the same amount and method
+            if not complete or len(unclaimed) > 1 or self.__outstanding(key, signature):
+                self.__save(key, params, UNKNOWN, baseline, attempts, error=error.message if error else None)
+                return _AMBIGUOUS
+            # Claimed in the same critical section, so no other item can match this payout
+            self.__save(key, params, CREATED, baseline, attempts, payout_id=unclaimed[0])
+            self.unresolved[signature].discard(key)
+            return unclaimed[0]
+
+    def resolve(self, key, payout_id = None):
+        """
+        Record result of manual check of unknown (or interrupted) item
+
+        :param key: Idempotency key
+        :param payout_id: (Optional) ID of payout created for item (None - payout was not created, item is failed)
+        """
+        with self.lock:
+            entry = self.entry(key)
+            if entry is None:
+                raise KeyError(key)
+            self.__save(key, entry["params"], CREATED if payout_id else FAILED, entry["baseline_payout_id"],
+                        entry["attempts"], payout_id=payout_id, error=None if payout_id else "Not created")
+
+
+def _signature(params):
+    """
+    Returns (amount, method) by which payout of item is recognized in payout list
+    """
+    return round(float(params["amount"]), 2), params["method"]
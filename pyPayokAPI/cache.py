@@ -0,0 +1,244 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from threading import RLock
+from time import time
+
+from .payok_types import Transaction, Transactions, PaymentStatus, FINAL_STATUSES, DATETIME_FORMAT
+
+
+class TransactionCache:
+    """
+    Local incremental transaction cache (SQLite).
+    Records are stored by transaction id. Sync downloads only transactions newer than the shop high-water mark
+    and re-checks records that are still waiting until they reach a final status (least recently checked first,
+    records older than recheck_max_age are not re-checked anymore).
+    """
+
+    def __init__(self, client, path = "payok_cache.sqlite3", recheck_limit = 100, recheck_max_age = 7 * 86400):
+        """
+        :param client: pyPayokAPI instance used for sync
+        :param path: (Optional, default="payok_cache.sqlite3") SQLite database path (":memory:" for in-memory cache)
+        :param recheck_limit: (Int, Optional, default=100) Max number of waiting transactions re-checked per sync
+        :param recheck_max_age: (Float, Optional, default=7 days) Waiting transactions created earlier (seconds ago)
+            are not re-checked (None - no limit)
+        """
+        self.client = client
+        self.recheck_limit = recheck_limit
+        self.recheck_max_age = recheck_max_age
+        self.lock = RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS transactions ("
+                "shop TEXT NOT NULL, transaction_id INTEGER NOT NULL, payment_id TEXT, status INTEGER, date TEXT, "
+                "data TEXT NOT NULL, checked REAL, PRIMARY KEY (shop, transaction_id))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS transactions_payment ON transactions (shop, payment_id)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS transactions_status ON transactions (shop, status)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS transactions_date ON transactions (shop, date)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state (shop TEXT PRIMARY KEY, high_water_mark INTEGER NOT NULL)")
+
+    def close(self):
+        """
+        Close database
+        """
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def high_water_mark(self, shop):
+        """
+        Returns the newest synced transaction id of shop (None if shop was never synced)
+
+        :param shop: Shop ID
+        """
+        with self.lock:
+            row = self.db.execute("SELECT high_water_mark FROM sync_state WHERE shop = ?", (str(shop),)).fetchone()
+        return row[0] if row else None
+
+    def store(self, shop, transactions):
+        """
+        Insert or update transactions in cache (re-check time of existing records is kept)
+
+        :param shop: Shop ID
+        :param transactions: Iterable of Transaction
+        """
+        rows = [(
+            str(shop),
+            transaction.transaction,
+            str(transaction.payment_id),
+            transaction.transaction_status.value,
+            transaction.date.strftime(DATETIME_FORMAT),
+            json.dumps(transaction.to_dict()),
+        ) for transaction in transactions]
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO transactions (shop, transaction_id, payment_id, status, date, data) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (shop, transaction_id) DO UPDATE SET "
+                "payment_id = excluded.payment_id, status = excluded.status, date = excluded.date, data = excluded.data",
+                rows)
+        return len(rows)
+
+    def sync(self, shop):
+        """
+        Download new transactions of shop and re-check waiting ones.
+
+        :param shop: Shop ID
+        :return: tuple (number of new transactions, number of re-checked transactions)
+        """
+        high_water_mark = self.high_water_mark(shop)
+
+        new_count = 0
+        newest = high_water_mark
+        batch = []
+        for transaction in self.__iter_new(shop, high_water_mark):
+            batch.append(transaction)
+            if newest is None or transaction.transaction > newest:
+                newest = transaction.transaction
+            if len(batch) >= 500:
+                new_count += self.store(shop, batch)
+                batch = []
+        new_count += self.store(shop, batch)
+
+        rechecked = self.__recheck_waiting(shop, high_water_mark)
+
+        if newest is not None:
+            with self.lock, self.db:
+                self.db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (str(shop), newest))
+        return new_count, rechecked
+
+    def __iter_new(self, shop, high_water_mark):
+        # History is returned newest first, so iteration stops at the first already synced record
+        transactions = self.client.iter_transactions(shop)
+        try:
+            for transaction in transactions:
+                if high_water_mark is not None and transaction.transaction <= high_water_mark:
+                    return
+                yield transaction
+        finally:
+            transactions.close()
+
+    def __recheck_waiting(self, shop, high_water_mark):
+        if high_water_mark is None:
+            return 0
+        query = "SELECT transaction_id, payment_id FROM transactions WHERE shop = ? AND status = ? AND transaction_id <= ?"
+        params = [str(shop), PaymentStatus.waiting.value, high_water_mark]
+        if self.recheck_max_age is not None:
+            # Abandoned payments stay waiting forever
+            query += " AND date >= ?"
+            params.append((datetime.now() - timedelta(seconds=self.recheck_max_age)).strftime(DATETIME_FORMAT))
+        # Never checked first, then least recently checked, so all waiting records are rotated through
+        query += " ORDER BY checked IS NOT NULL, checked, transaction_id DESC LIMIT ?"
+        params.append(self.recheck_limit)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        updated = []
+        for _, payment in rows:
+            updated.extend(self.client.transaction(shop, payment=payment).items)
+        checked = time()
+        with self.lock, self.db:
+            self.store(shop, updated)
+            self.db.executemany("UPDATE transactions SET checked = ? WHERE shop = ? AND transaction_id = ?",
+                                [(checked, str(shop), transaction_id) for transaction_id, _ in rows])
+        return len(updated)
+
+    @staticmethod
+    def __decode(rows):
+        return [Transaction.de_json(json.loads(data), num) for num, (data,) in enumerate(rows, 1)]
+
+    def transaction(self, shop, payment, refresh = True):
+        """
+        Get transaction by payment ID.
+        Final transactions are answered from cache, others are requested from API (if refresh is True) and cached.
+
+        :param shop: Shop ID
+        :param payment: Payment ID
+        :param refresh: (Bool, Optional, default=True) Request API when transaction is missing or not final
+        :return: Transaction or None
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT data FROM transactions WHERE shop = ? AND payment_id = ? ORDER BY transaction_id DESC LIMIT 1",
+                (str(shop), str(payment))).fetchall()
+        cached = self.__decode(rows)
+        if cached and (cached[0].transaction_status in FINAL_STATUSES or not refresh):
+            return cached[0]
+        if not refresh:
+            return None
+        items = self.client.transaction(shop, payment=payment).items
+        self.store(shop, items)
+        return items[0] if items else None
+
+    def transactions(self, shop, status = None, since = None, until = None, limit = None):
+        """
+        Query cached transactions (newest first).
+
+        :param shop: Shop ID
+        :param status: (PaymentStatus, Optional) Filter by status
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param limit: (Int, Optional) Max number of results
+        :return: Transactions
+        """
+        query, params = self.__query(shop, status, since, until)
+        query += " ORDER BY transaction_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        result = Transactions()
+        result.items = self.__decode(rows)
+        return result
+
+    def iter_transactions(self, shop, status = None, since = None, until = None, before = None, batch_size = 1000):
+        """
+        Iterate over cached transactions (newest first) reading database in batches (constant memory).
+
+        :param shop: Shop ID
+        :param status: (PaymentStatus, Optional) Filter by status
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        :param before: (Int, Optional) Only transactions with smaller transaction id
+        :param batch_size: (Int, Optional, default=1000) Number of rows read at once
+        """
+        num = 0
+        while True:
+            query, params = self.__query(shop, status, since, until, "transaction_id, data")
+            if before is not None:
+                query += " AND transaction_id < ?"
+                params.append(before)
+            query += " ORDER BY transaction_id DESC LIMIT ?"
+            params.append(batch_size)
+            with self.lock:
+                rows = self.db.execute(query, params).fetchall()
+            for transaction_id, data in rows:
+                num += 1
+                yield Transaction.de_json(json.loads(data), num)
+            if len(rows) < batch_size:
+                return
+            before = rows[-1][0]
+
+    @staticmethod
+    def __query(shop, status, since, until, columns = "data"):
+        """
+        Returns (query, params) selecting columns of matching transactions
+        """
+        query = "SELECT {} FROM transactions WHERE shop = ?".format(columns)
+        params = [str(shop)]
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status.value)
+        if since is not None:
+            query += " AND date >= ?"
+            params.append(since.strftime(DATETIME_FORMAT))
+        if until is not None:
+            query += " AND date < ?"
+            params.append(until.strftime(DATETIME_FORMAT))
+        return query, params
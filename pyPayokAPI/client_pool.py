@@ -0,0 +1,242 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .api import pyPayokAPI, pyPayokAPIException
+from .pagination import TokenBucket
+from .transport import create_transport
+
+# Task priorities
+INTERACTIVE = 0
+BULK = 1
+
+# Methods charging account rate limit for each page themselves
+PAGINATED_METHODS = ("transactions", "iter_transactions", "payouts", "iter_payouts")
+
+
+class _Account:
+    __slots__ = ("name", "client", "rate_limiter", "queues", "bulk_running")
+
+    def __init__(self, name, client, rate_limiter):
+        self.name = name
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.queues = (deque(), deque())
+        self.bulk_running = 0
+
+
+class PayokClientPool:
+    """
+    Pool of clients of many merchant accounts sharing one connection pool and one set of worker threads.
+    Calls are queued per account and scheduled round-robin between accounts under per-account rate limits,
+    so a busy account does not delay calls of the others. Interactive calls of an account go before its
+    bulk calls, and bulk calls (e.g. history sync) can use only part of the workers.
+    Each scheduled call takes one token of its account limit, paginated methods take one token per page.
+    """
+
+    def __init__(self, max_workers = 16, bulk_workers = None, pool_maxsize = None,
+                 rate_limit = 1, rate_burst = 1, transport = "requests", **client_kwargs):
+        """
+        :param max_workers: (Int, Optional, default=16) Number of worker threads shared by all accounts
+        :param bulk_workers: (Int, Optional, default=max_workers // 2) Max number of workers running bulk calls
+        :param pool_maxsize: (Int, Optional, default=max_workers) Max connections kept to API
+        :param rate_limit: (Float, Optional, default=1) Default requests per second of account (None - no limit)
+        :param rate_burst: (Int, Optional, default=1) Default max number of requests of account made at once
+        :param transport: (Optional, default="requests") Shared HTTP transport: "requests", "urllib3", "httpx" (HTTP/2)
+            or transport instance (it is not closed by close())
+        :param client_kwargs: (Optional) Default pyPayokAPI arguments (timeout, retry_policy, cache_ttl, ...)
+        """
+        self.max_workers = max(1, max_workers)
+        self.bulk_workers = max(1, self.max_workers // 2 if bulk_workers is None else bulk_workers)
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.client_kwargs = client_kwargs
+        self.own_transport = isinstance(transport, str)
+        if self.own_transport:
+            transport = create_transport(transport, pool_maxsize=pool_maxsize or self.max_workers)
+        self.transport = transport
+        self.accounts = {}
+        self.order = []
+        self.bulk_running = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.threads = []
+        for _ in range(self.max_workers):
+            thread = threading.Thread(target=self.__worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Finish queued calls, stop workers and close pooled connections
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        for account in self.accounts.values():
+            account.client.close()
+        if self.own_transport:
+            self.transport.close()
+
+    def add(self, name, api_id, api_key, secret_key = None, rate_limit = -1, rate_burst = None, **client_kwargs):
+        """
+        Add merchant account
+
+        :param name: Account name (any hashable)
+        :param api_id: API id for access
+        :param api_key: API key for access
+        :param secret_key: (Optional) Secret key for payment links
+        :param rate_limit: (Float, Optional) Requests per second of account (default - pool rate_limit, None - no limit)
+        :param rate_burst: (Int, Optional) Max number of requests of account made at once (default - pool rate_burst)
+        :param client_kwargs: (Optional) pyPayokAPI arguments overriding pool defaults
+        :return: pyPayokAPI client of account
+        """
+        if rate_limit == -1:
+            rate_limit = self.rate_limit
+        rate_limiter = TokenBucket(rate_limit, rate_burst or self.rate_burst) if rate_limit else None
+        kwargs = dict(self.client_kwargs)
+        kwargs.update(client_kwargs)
+        kwargs["transport"] = self.transport
+        kwargs["rate_limit"] = None
+        client = pyPayokAPI(api_id, api_key, secret_key=secret_key, **kwargs)
+        # Paginated calls share the account limit
+        client.rate_limiter = rate_limiter
+        with self.cond:
+            if name in self.accounts:
+                raise ValueError("Account {} already exists".format(name))
+            self.accounts[name] = _Account(name, client, rate_limiter)
+            self.order.append(self.accounts[name])
+        return client
+
+    def client(self, name):
+        """
+        Returns pyPayokAPI client of account (calls made directly are not scheduled by the pool)
+
+        :param name: Account name
+        """
+        return self.accounts[name].client
+
+    def names(self):
+        """
+        Returns list of account names
+        """
+        return list(self.accounts)
+
+    def submit(self, name, method, *args, priority = INTERACTIVE, **kwargs):
+        """
+        Schedule API call of account
+
+        :param name: Account name
+        :param method: pyPayokAPI method name (e.g. "balance") or function(client, *args, **kwargs)
+        :param args: Method arguments
+        :param priority: (Optional, default=INTERACTIVE) INTERACTIVE or BULK (long calls like history sync)
+        :param kwargs: Method keyword arguments
+        :return: concurrent.futures.Future
+        """
+        future = Future()
+        if callable(method):
+            call = (method, args, kwargs, False)
+        else:
+            call = (getattr(pyPayokAPI, method), args, kwargs, method in PAGINATED_METHODS)
+        with self.cond:
+            if self.closed:
+                raise pyPayokAPIException(-8, "Client pool is closed")
+            self.accounts[name].queues[priority].append((future, call))
+            self.cond.notify()
+        return future
+
+    def call(self, name, method, *args, **kwargs):
+        """
+        Make scheduled API call of account and wait for result (same arguments as submit)
+        """
+        return self.submit(name, method, *args, **kwargs).result()
+
+    def fan_out(self, method, *args, names = None, return_exceptions = True, **kwargs):
+        """
+        Make the same call for many accounts concurrently
+
+        :param method: pyPayokAPI method name or function(client)
+        :param args: Method arguments
+        :param names: (Optional) Account names (default - all accounts)
+        :param return_exceptions: (Bool, Optional, default=True) Return exceptions as results instead of raising
+        :param kwargs: Method keyword arguments (including priority)
+        :return: dict of account name -> result
+        """
+        futures = {name: self.submit(name, method, *args, **kwargs) for name in (names or self.names())}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[name] = e
+        return results
+
+    def balances(self, names = None):
+        """
+        Balance of all accounts
+
+        :param names: (Optional) Account names (default - all accounts)
+        :return: dict of account name -> Balance (or exception)
+        """
+        return self.fan_out("balance", names=names)
+
+    def __next_task(self):
+        """
+        Pick next task round-robin between accounts. Returns (account, priority, task) or delay to wait.
+        """
+        delay = None
+        for index, account in enumerate(self.order):
+            for priority in (INTERACTIVE, BULK):
+                if not account.queues[priority]:
+                    continue
+                if priority == BULK and self.bulk_running >= self.bulk_workers:
+                    continue
+                if account.rate_limiter:
+                    wait = account.rate_limiter.try_acquire()
+                    if wait:
+                        delay = wait if delay is None else min(delay, wait)
+                        break
+                # Move account to the end of the round
+                del self.order[index]
+                self.order.append(account)
+                return account, priority, account.queues[priority].popleft()
+        return delay
+
+    def __worker(self):
+        while True:
+            with self.cond:
+                while True:
+                    picked = self.__next_task()
+                    if isinstance(picked, tuple):
+                        break
+                    if self.closed and picked is None:
+                        return
+                    self.cond.wait(picked)
+                account, priority, (future, (func, args, kwargs, paginated)) = picked
+                if priority == BULK:
+                    self.bulk_running += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    if paginated and account.rate_limiter:
+                        # Token taken by scheduler pays for the first page
+                        account.rate_limiter.refund()
+                    try:
+                        future.set_result(func(account.client, *args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                if priority == BULK:
+                    with self.cond:
+                        self.bulk_running -= 1
+                        self.cond.notify_all()
@@ -0,0 +1,160 @@
+from collections import deque
+from threading import Lock
+from time import monotonic
+
+from .retry import IDEMPOTENT_METHODS
+
+# pyPayokAPIException code of calls that did not finish before deadline
+DEADLINE_EXCEEDED = -11
+
+
+class Deadline:
+    """
+    Time budget of one call, shared by its retries and pages.
+    Every request gets connect and read timeouts limited by the remaining time.
+    """
+
+    def __init__(self, timeout, connect = None, read = None):
+        """
+        :param timeout: (Float) Seconds for the whole call (all requests, retries and pages)
+        :param connect: (Float, Optional) Max connect time of each request (default - client timeout)
+        :param read: (Float, Optional) Max time of each socket read (default - client timeout)
+        """
+        self.timeout = timeout
+        self.connect = connect
+        self.read = read
+        self.expires = monotonic() + timeout
+
+    def remaining(self):
+        """
+        Returns remaining seconds (0 if deadline passed)
+        """
+        return max(0.0, self.expires - monotonic())
+
+    @property
+    def expired(self):
+        return monotonic() >= self.expires
+
+    def check(self, need = 0.0, error = None):
+        """
+        Raise pyPayokAPIException (DEADLINE_EXCEEDED) if less than "need" seconds remain
+
+        :param need: (Float, Optional, default=0) Required remaining time (seconds)
+        :param error: (Optional) Error that caused the delay (saved as full_error)
+        """
+        if self.expires - monotonic() <= need:
+            raise self.exceeded(error)
+
+    def exceeded(self, error = None):
+        """
+        Returns pyPayokAPIException (DEADLINE_EXCEEDED) of this deadline
+
+        :param error: (Optional) Error that caused the delay (saved as full_error)
+        """
+        from .api import pyPayokAPIException
+
+        return pyPayokAPIException(DEADLINE_EXCEEDED, "Deadline of {} s exceeded".format(self.timeout),
+                                   repr(error) if error is not None else "")
+
+    def request_timeout(self, default = None):
+        """
+        Returns (connect, read) timeouts of the next request
+
+        :param default: (Optional) Client timeout (seconds or (connect, read) tuple)
+        """
+        self.check()
+        remaining = self.remaining()
+        connect, read = default if isinstance(default, tuple) else (default, default)
+        if self.connect is not None:
+            connect = self.connect
+        if self.read is not None:
+            read = self.read
+        return (remaining if connect is None else min(connect, remaining),
+                remaining if read is None else min(read, remaining))
+
+
+def to_deadline(value):
+    """
+    Returns Deadline for deadline argument: Deadline, seconds or None
+    """
+    if value is None or isinstance(value, Deadline):
+        return value
+    return Deadline(value)
+
+
+class HedgePolicy:
+    """
+    Hedged requests for idempotent reads: if the response does not come within the delay
+    (quantile of recent latencies of the method), the same request is sent again and the first answer is used.
+    "payout_create" is never hedged, since a duplicate request could create a second payout.
+    """
+
+    def __init__(self, quantile = 0.95, min_delay = 0.01, max_delay = 2.0, initial_delay = 0.5,
+                 window = 200, min_samples = 20, methods = IDEMPOTENT_METHODS, max_workers = 16):
+        """
+        :param quantile: (Float, Optional, default=0.95) Latency quantile used as hedge delay
+        :param min_delay: (Float, Optional, default=0.01) Min hedge delay (seconds)
+        :param max_delay: (Float, Optional, default=2.0) Max hedge delay (seconds)
+        :param initial_delay: (Float, Optional, default=0.5) Hedge delay until min_samples latencies are known
+        :param window: (Int, Optional, default=200) Number of recent latencies of each method kept
+        :param min_samples: (Int, Optional, default=20) Number of latencies needed to use the quantile
+        :param methods: (Optional) API methods that can be hedged
+        :param max_workers: (Int, Optional, default=16) Threads of client sending hedged requests
+        """
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.window = window
+        self.min_samples = min_samples
+        self.methods = frozenset(methods) - {"payout_create"}
+        self.max_workers = max_workers
+        self.samples = {}
+        self.observed = {}
+        self.delays = {}
+        self.hedged = 0
+        self.wins = 0
+        self.lock = Lock()
+
+    def delay(self, method):
+        """
+        Returns delay (seconds) before hedge request of method
+        """
+        return self.delays.get(method, self.initial_delay)
+
+    def observe(self, method, seconds):
+        """
+        Record latency of a successful request
+
+        :param method: API method name
+        :param seconds: (Float) Request latency
+        """
+        with self.lock:
+            samples = self.samples.get(method)
+            if samples is None:
+                samples = self.samples[method] = deque(maxlen=self.window)
+            samples.append(seconds)
+            observed = self.observed[method] = self.observed.get(method, 0) + 1
+            # Quantile is recalculated every few samples
+            if len(samples) >= self.min_samples and (observed % 10 == 0 or observed == self.min_samples):
+                ordered = sorted(samples)
+                value = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+                self.delays[method] = min(self.max_delay, max(self.min_delay, value))
+
+    def record(self, won):
+        """
+        Count hedge request
+
+        :param won: (Bool) Hedge answered first
+        """
+        with self.lock:
+            self.hedged += 1
+            if won:
+                self.wins += 1
+
+    def stats(self):
+        """
+        Returns dict with number of hedge requests, number of them answered first and current delays
+        """
+        with self.lock:
+            return {"hedged": self.hedged, "wins": self.wins, "delays": dict(self.delays)}
@@ -0,0 +1,306 @@
+import csv
+import json
+import os
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .pagination import iterate, window_filter, window_pager
+from .payok_types import DATETIME_FORMAT, PaymentStatus, PayoutMethod, Transaction, Payout
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+def _plain(value):
+    # Value for CSV and JSON Lines (API format)
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, PayoutMethod):
+        return value.name
+    if isinstance(value, PaymentStatus):
+        return value.value
+    return value
+
+
+def _arrow_type(value):
+    if isinstance(value, datetime):
+        return pyarrow.timestamp("s")
+    if isinstance(value, bool):
+        return pyarrow.bool_()
+    if isinstance(value, (int, PaymentStatus)):
+        return pyarrow.int64()
+    if isinstance(value, float):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _arrow_value(value, arrow_type):
+    # Value for Parquet column (datetimes are kept, enums are stored as in API)
+    if value is None:
+        return None
+    if isinstance(value, (PayoutMethod, PaymentStatus)):
+        value = _plain(value)
+    if arrow_type == pyarrow.string() and not isinstance(value, str):
+        return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+
+class Exporter:
+    """
+    Streaming export of records (Transaction, Payout) to CSV, JSON Lines or Parquet.
+    Records are written in chunks, so memory use does not depend on export size. After each chunk
+    a checkpoint (last exported key and file state) is saved, and interrupted export continues from it.
+
+    Records should come in descending key order (newest first, as API and TransactionCache return them).
+    Parquet (requires pyarrow) is written as a directory with one part file per chunk.
+    """
+
+    def __init__(self, path, format = None, fields = None, chunk_size = 10000, checkpoint_path = None, resume = True):
+        """
+        :param path: Output file path (directory for Parquet)
+        :param format: (Optional) "csv", "jsonl" or "parquet" (default - by path extension)
+        :param fields: (Optional) List of exported fields (default - record schema fields)
+        :param chunk_size: (Int, Optional, default=10000) Number of records written at once
+        :param checkpoint_path: (Optional, default=path + ".checkpoint") Checkpoint file path
+        :param resume: (Bool, Optional, default=True) Continue export from checkpoint if it exists
+        """
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in FORMATS:
+            raise ValueError("Unknown export format: {}".format(format))
+        if format == "parquet" and pyarrow is None:
+            raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+        self.path = path
+        self.format = format
+        self.fields = list(fields) if fields else None
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path or path + ".checkpoint"
+        self.state = None
+        if resume and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self.state = json.load(f)
+            if self.state.get("format") != format:
+                raise ValueError("Checkpoint was written for {} export".format(self.state.get("format")))
+            self.fields = self.state["fields"]
+
+    @property
+    def last_key(self):
+        """
+        Key of the last exported record (None if export was not started)
+        """
+        return self.state["last_key"] if self.state else None
+
+    @property
+    def done(self):
+        """
+        True if export was completed
+        """
+        return bool(self.state and self.state.get("done"))
+
+    def __save_state(self):
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def write(self, records, key):
+        """
+        Export records
+
+        :param records: Iterable of records (newest first)
+        :param key: Name of unique record key field ("transaction", "payout_id")
+        :return: Total number of exported rows
+        """
+        if self.done:
+            return self.state["rows"]
+        last_key = self.last_key
+        chunk = []
+        for record in records:
+            if last_key is not None and getattr(record, key) >= last_key:
+                # Exported before interruption
+                continue
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self.__write_chunk(chunk, key)
+                chunk = []
+        if chunk or self.state is None:
+            self.__write_chunk(chunk, key)
+        self.state["done"] = True
+        self.__save_state()
+        return self.state["rows"]
+
+    def __write_chunk(self, chunk, key):
+        if self.state is None:
+            if self.fields is None:
+                schema = chunk[0].schema if chunk else ()
+                self.fields = [name for name, _ in schema]
+            self.state = {"format": self.format, "fields": self.fields, "rows": 0, "last_key": None,
+                          "size": 0, "parts": 0, "done": False}
+            self.__start()
+        if self.format == "csv":
+            self.__write_csv(chunk)
+        elif self.format == "jsonl":
+            self.__write_jsonl(chunk)
+        else:
+            self.__write_parquet(chunk)
+        self.state["rows"] += len(chunk)
+        if chunk:
+            self.state["last_key"] = getattr(chunk[-1], key)
+        self.__save_state()
+
+    def __start(self):
+        if self.format == "parquet":
+            os.makedirs(self.path, exist_ok=True)
+            return
+        with open(self.path, "w", newline="", encoding="utf-8") as f:
+            if self.format == "csv":
+                csv.writer(f).writerow(self.fields)
+            self.state["size"] = f.tell()
+
+    def __open(self):
+        # Drop anything written after the last checkpoint
+        f = open(self.path, "r+", newline="", encoding="utf-8")
+        f.truncate(self.state["size"])
+        f.seek(self.state["size"])
+        return f
+
+    def __finish(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+        self.state["size"] = f.tell()
+        f.close()
+
+    def __write_csv(self, chunk):
+        f = self.__open()
+        writer = csv.writer(f)
+        fields = self.fields
+        writer.writerows([_plain(getattr(record, name, None)) for name in fields] for record in chunk)
+        self.__finish(f)
+
+    def __write_jsonl(self, chunk):
+        f = self.__open()
+        fields = self.fields
+        f.writelines(json.dumps({name: _plain(getattr(record, name, None)) for name in fields},
+                                ensure_ascii=False) + "\n" for record in chunk)
+        self.__finish(f)
+
+    def __write_parquet(self, chunk):
+        if not chunk:
+            return
+        types = self.state.get("types")
+        if types is None:
+            types = {}
+            for name in self.fields:
+                sample = next((getattr(record, name, None) for record in chunk
+                               if getattr(record, name, None) is not None), None)
+                types[name] = str(_arrow_type(sample))
+            self.state["types"] = types
+        schema = pyarrow.schema([(name, pyarrow.type_for_alias(types[name])) for name in self.fields])
+        columns = []
+        for field in schema:
+            columns.append(pyarrow.array(
+                [_arrow_value(getattr(record, field.name, None), field.type) for record in chunk], type=field.type))
+        table = pyarrow.Table.from_arrays(columns, schema=schema)
+        part_path = os.path.join(self.path, "part-{:05d}.parquet".format(self.state["parts"]))
+        pyarrow.parquet.write_table(table, part_path)
+        self.state["parts"] += 1
+
+
+def export_transactions(client, shop, path, format = None, status = None, method = None, since = None, until = None,
+                        chunk_size = 10000, resume = True, prefetch = 2):
+    """
+    Export transaction history from API (newest first). Interrupted export continues from checkpoint:
+    the page of the last exported transaction is found by binary search over offsets.
+
+    :param client: pyPayokAPI instance
+    :param shop: Shop ID
+    :param path: Output file path (directory for Parquet)
+    :param format: (Optional) "csv", "jsonl" or "parquet" (default - by path extension)
+    :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+    :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+    :param since: (datetime, Optional) Created at or after this date
+    :param until: (datetime, Optional) Created before this date
+    :param chunk_size: (Int, Optional, default=10000) Number of records written at once
+    :param resume: (Bool, Optional, default=True) Continue export from checkpoint if it exists
+    :param prefetch: (Int, Optional, default=2) Number of pages fetched in parallel
+    :return: Total number of exported rows
+    """
+    exporter = Exporter(path, format, chunk_size=chunk_size, resume=resume)
+    if exporter.done:
+        return exporter.state["rows"]
+    fetch_page = lambda offset: client.transaction(shop, offset=offset).items
+    if exporter.last_key is not None:
+        pages = window_pager(fetch_page, "transaction", exporter.last_key, max_pages=None, prefetch=prefetch,
+                             rate_limiter=client.rate_limiter)
+    else:
+        pages = window_pager(fetch_page, "date", until, max_pages=None, prefetch=prefetch,
+                             rate_limiter=client.rate_limiter)
+    match, stop = window_filter("date", "transaction_status", status, method, since, until)
+    if exporter.fields is None:
+        exporter.fields = [name for name, _ in Transaction.schema]
+    return exporter.write(iterate(pages, match, stop), "transaction")
+
+
+def export_payouts(client, path, format = None, status = None, method = None, since = None, until = None,
+                   chunk_size = 10000, resume = True, prefetch = 2):
+    """
+    Export payout history from API (newest first). Interrupted export continues from checkpoint.
+
+    :param client: pyPayokAPI instance
+    :param path: Output file path (directory for Parquet)
+    :param format: (Optional) "csv", "jsonl" or "parquet" (default - by path extension)
+    :param status: (PaymentStatus, Optional) Filter by status (or list of statuses)
+    :param method: (PayoutMethod, Optional) Filter by method (or list of methods)
+    :param since: (datetime, Optional) Created at or after this date
+    :param until: (datetime, Optional) Created before this date
+    :param chunk_size: (Int, Optional, default=10000) Number of records written at once
+    :param resume: (Bool, Optional, default=True) Continue export from checkpoint if it exists
+    :param prefetch: (Int, Optional, default=2) Number of pages fetched in parallel
+    :return: Total number of exported rows
+    """
+    exporter = Exporter(path, format, chunk_size=chunk_size, resume=resume)
+    if exporter.done:
+        return exporter.state["rows"]
+    fetch_page = lambda offset: client.payout(offset=offset).items
+    if exporter.last_key is not None:
+        pages = window_pager(fetch_page, "payout_id", exporter.last_key, max_pages=None, prefetch=prefetch,
+                             rate_limiter=client.rate_limiter)
+    else:
+        pages = window_pager(fetch_page, "date_create", until, max_pages=None, prefetch=prefetch,
+                             rate_limiter=client.rate_limiter)
+    match, stop = window_filter("date_create", "status", status, method, since, until)
+    if exporter.fields is None:
+        exporter.fields = [name for name, _ in Payout.schema]
+    return exporter.write(iterate(pages, match, stop), "payout_id")
+
+
+def export_cached_transactions(cache, shop, path, format = None, status = None, since = None, until = None,
+                               chunk_size = 10000, resume = True):
+    """
+    Export transactions from TransactionCache (newest first). Interrupted export continues from checkpoint.
+
+    :param cache: TransactionCache instance
+    :param shop: Shop ID
+    :param path: Output file path (directory for Parquet)
+    :param format: (Optional) "csv", "jsonl" or "parquet" (default - by path extension)
+    :param status: (PaymentStatus, Optional) Filter by status
+    :param since: (datetime, Optional) Created at or after this date
+    :param until: (datetime, Optional) Created before this date
+    :param chunk_size: (Int, Optional, default=10000) Number of records written at once
+    :param resume: (Bool, Optional, default=True) Continue export from checkpoint if it exists
+    :return: Total number of exported rows
+    """
+    exporter = Exporter(path, format, chunk_size=chunk_size, resume=resume)
+    if exporter.done:
+        return exporter.state["rows"]
+    if exporter.fields is None:
+        exporter.fields = [name for name, _ in Transaction.schema]
+    records = cache.iter_transactions(shop, status, since, until, before=exporter.last_key,
+                                      batch_size=min(chunk_size, 10000))
+    return exporter.write(records, "transaction")
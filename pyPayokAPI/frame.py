@@ -0,0 +1,409 @@
+from array import array
+from datetime import datetime, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .payok_types import Transaction, Transactions, Payout, Payouts, PayoutMethod, PaymentStatus, \
+    payout_method, payment_status
+
+EPOCH = datetime(1970, 1, 1)
+
+# Stored values of missing integers and dates, and of missing enum members (missing floats are NaN)
+NULL = -2 ** 63
+NULL_CODE = -1
+
+# Column kinds
+FLOAT = "d"
+INT = "q"
+DATE = "date"
+OBJECT = None
+
+
+# Conversion of raw API values (e.g. status code) to enum members
+_CONVERTERS = {PaymentStatus: payment_status, PayoutMethod: payout_method}
+
+
+class _EnumColumn:
+    """
+    Enum column encoding: members are stored as small integer codes
+    """
+
+    def __init__(self, enum_class):
+        self.members = list(enum_class)
+        self.codes = {member: code for code, member in enumerate(self.members)}
+        self.convert = _CONVERTERS.get(enum_class)
+
+    def code(self, value):
+        """
+        Returns code of member or raw API value (NULL_CODE for None)
+        """
+        code = self.codes.get(value)
+        if code is None and value is not None and self.convert is not None:
+            code = self.codes.get(self.convert(value))
+        return NULL_CODE if code is None else code
+
+    def member(self, code):
+        return None if code == NULL_CODE else self.members[code]
+
+
+class RecordFrame:
+    """
+    Columnar container for Transaction / Payout records.
+    Numeric, date and enum columns are stored in typed arrays (used as NumPy arrays when NumPy is installed),
+    other columns are stored in lists.
+    """
+
+    record_class = None
+    container_class = None
+    # (column name, kind) pairs: FLOAT, INT, DATE, OBJECT or enum class
+    columns = ()
+
+    def __init__(self):
+        self.data = {}
+        self.kinds = {}
+        for name, kind in self.columns:
+            if isinstance(kind, type):
+                kind = _EnumColumn(kind)
+            self.kinds[name] = kind
+            self.data[name] = self.__empty(kind)
+        self.size = 0
+
+    @staticmethod
+    def __empty(kind):
+        if kind is OBJECT:
+            return []
+        elif kind is DATE:
+            return array(INT)
+        elif isinstance(kind, _EnumColumn):
+            return array("b")
+        else:
+            return array(kind)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Create frame from records.
+
+        :param records: Iterable of records, Transactions / Payouts container or iterable of pages (lists of records)
+        """
+        frame = cls()
+        frame.extend(records)
+        return frame
+
+    def extend(self, records):
+        """
+        Append records to frame.
+
+        :param records: Iterable of records, Transactions / Payouts container or iterable of pages (lists of records)
+        """
+        if isinstance(records, (Transactions, Payouts)):
+            records = records.items
+        for record in records:
+            if isinstance(record, (list, tuple, Transactions, Payouts)):
+                self.extend(record)
+            else:
+                self.append(record)
+        return self
+
+    def append(self, record):
+        """
+        Append one record to frame
+
+        :param record: Transaction / Payout
+        """
+        for name, kind in self.kinds.items():
+            value = getattr(record, name, None)
+            if kind is DATE:
+                value = NULL if value is None else int((value - EPOCH).total_seconds())
+            elif isinstance(kind, _EnumColumn):
+                value = kind.code(value)
+            elif value is None and kind is not OBJECT:
+                value = float("nan") if kind is FLOAT else NULL
+            self.data[name].append(value)
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name):
+        """
+        Returns copy of column: NumPy array (or array.array without NumPy) for numeric, date and enum columns,
+        list for other columns. Dates are stored as seconds since 1970-01-01, enums as member codes.
+        Missing values are stored as NULL (integers and dates), NULL_CODE (enums) or NaN (floats).
+
+        :param name: Column name
+        """
+        values = self.data[name]
+        if numpy is not None and isinstance(values, array):
+            return self.__view(name).copy()
+        return values[:]
+
+    def __view(self, name):
+        # Zero-copy NumPy view of typed column, should not outlive the call (array can't grow while viewed)
+        values = self.data[name]
+        return numpy.frombuffer(values, dtype=values.typecode) if len(values) else numpy.array([], dtype=values.typecode)
+
+    def values(self, name):
+        """
+        Returns decoded column values as list (dates as datetime, enums as members, missing values as None)
+
+        :param name: Column name
+        """
+        kind = self.kinds[name]
+        values = self.data[name]
+        if kind is DATE:
+            return [None if value == NULL else EPOCH + timedelta(seconds=value) for value in values]
+        elif isinstance(kind, _EnumColumn):
+            return [kind.member(code) for code in values]
+        elif kind is INT:
+            return [None if value == NULL else value for value in values]
+        return list(values)
+
+    def take(self, indices):
+        """
+        Returns new frame with rows at given indices
+
+        :param indices: Iterable of row indices
+        """
+        indices = list(indices)
+        frame = type(self)()
+        for name, values in self.data.items():
+            if isinstance(values, array):
+                if numpy is not None:
+                    column = self.__view(name)[numpy.asarray(indices, dtype=numpy.int64)]
+                    frame.data[name] = array(values.typecode, column.tobytes())
+                else:
+                    frame.data[name] = array(values.typecode, [values[i] for i in indices])
+            else:
+                frame.data[name] = [values[i] for i in indices]
+        frame.size = len(indices)
+        return frame
+
+    def _mask(self, status_column = None, status = None, method = None, since = None, until = None, date_column = None):
+        """
+        Returns indices of rows matching all given conditions
+        """
+        conditions = []
+        if status is not None:
+            conditions.append((status_column, self.__codes(status_column, status)))
+        if method is not None:
+            conditions.append(("method", self.__codes("method", method)))
+        if numpy is not None:
+            selected = numpy.ones(self.size, dtype=bool)
+            for name, codes in conditions:
+                selected &= numpy.isin(self.__view(name), codes)
+            if since is not None:
+                selected &= self.__view(date_column) >= self.__seconds(since)
+            if until is not None:
+                dates = self.__view(date_column)
+                selected &= (dates < self.__seconds(until)) & (dates != NULL)
+            return numpy.flatnonzero(selected).tolist()
+        indices = []
+        dates = self.data[date_column] if date_column else None
+        since = self.__seconds(since) if since is not None else None
+        until = self.__seconds(until) if until is not None else None
+        for i in range(self.size):
+            if any(self.data[name][i] not in codes for name, codes in conditions):
+                continue
+            if since is not None and dates[i] < since:
+                continue
+            if until is not None and (dates[i] >= until or dates[i] == NULL):
+                continue
+            indices.append(i)
+        return indices
+
+    def __codes(self, name, members):
+        kind = self.kinds[name]
+        if not isinstance(members, (list, tuple, set, frozenset)):
+            members = [members]
+        return [kind.code(member) for member in members]
+
+    @staticmethod
+    def __seconds(value):
+        return int((value - EPOCH).total_seconds())
+
+    def __present(self, name):
+        # NumPy view of numeric column and mask of present (not missing) values
+        values = self.__view(name)
+        return values, ~numpy.isnan(values) if self.kinds[name] is FLOAT else values != NULL
+
+    def __present_values(self, name):
+        # Present values of numeric column without NumPy
+        if self.kinds[name] is FLOAT:
+            return [value for value in self.data[name] if value == value]
+        return [value for value in self.data[name] if value != NULL]
+
+    def sum(self, name):
+        """
+        Sum of numeric column (missing values are skipped)
+
+        :param name: Column name
+        """
+        if numpy is not None:
+            values, present = self.__present(name)
+            return float(values[present].sum())
+        return float(sum(self.__present_values(name)))
+
+    def mean(self, name):
+        """
+        Mean of numeric column (missing values are skipped, None if there are no values)
+
+        :param name: Column name
+        """
+        if numpy is not None:
+            values, present = self.__present(name)
+            count = int(present.sum())
+            return float(values[present].sum()) / count if count else None
+        values = self.__present_values(name)
+        return float(sum(values)) / len(values) if values else None
+
+    def group(self, by, name = None, func = "sum"):
+        """
+        Aggregate column by groups of enum / object column.
+        Missing values of aggregated column are skipped (mean is None for group without values).
+
+        :param by: Column to group by (e.g. "method")
+        :param name: (Optional) Numeric column to aggregate (not needed for "count")
+        :param func: (Optional, default="sum") "sum", "mean" or "count"
+        :return: dict {group value: aggregated value}
+        """
+        if func not in ("sum", "mean", "count"):
+            raise ValueError("func should be 'sum', 'mean' or 'count'")
+        kind = self.kinds[by]
+        if numpy is not None and isinstance(kind, _EnumColumn):
+            # Shifted by one, so missing members (NULL_CODE) are counted as None group
+            codes = self.__view(by).astype(numpy.int64) + 1
+            counts = numpy.bincount(codes, minlength=len(kind.members) + 1)
+            if name:
+                values, present = self.__present(name)
+                sums = numpy.bincount(codes[present], weights=values[present], minlength=len(kind.members) + 1)
+                present_counts = numpy.bincount(codes[present], minlength=len(kind.members) + 1)
+            result = {}
+            for code in numpy.flatnonzero(counts).tolist():
+                member = kind.member(code - 1)
+                if func == "count":
+                    result[member] = int(counts[code])
+                elif func == "sum":
+                    result[member] = float(sums[code])
+                else:
+                    result[member] = float(sums[code] / present_counts[code]) if present_counts[code] else None
+            return result
+        counts = {}
+        sums = {}
+        present_counts = {}
+        values = self.data[name] if name else None
+        missing = (lambda value: value != value) if name and self.kinds[name] is FLOAT else (lambda value: value == NULL)
+        for i, key in enumerate(self.values(by)):
+            counts[key] = counts.get(key, 0) + 1
+            if values is not None:
+                sums.setdefault(key, 0.0)
+                present_counts.setdefault(key, 0)
+                if not missing(values[i]):
+                    sums[key] += values[i]
+                    present_counts[key] += 1
+        if func == "count":
+            return counts
+        elif func == "sum":
+            return sums
+        return {key: sums[key] / present_counts[key] if present_counts[key] else None for key in sums}
+
+    def to_records(self):
+        """
+        Convert frame back to list of records
+        """
+        records = []
+        columns = [(name, self.values(name)) for name in self.data]
+        for i in range(self.size):
+            record = self.record_class()
+            for name, values in columns:
+                setattr(record, name, values[i])
+            records.append(record)
+        return records
+
+    def to_container(self):
+        """
+        Convert frame back to Transactions / Payouts
+        """
+        container = self.container_class()
+        container.items = self.to_records()
+        return container
+
+
+class TransactionFrame(RecordFrame):
+    """
+    Columnar container for transactions
+    """
+
+    record_class = Transaction
+    container_class = Transactions
+    columns = (
+        ("num", INT),
+        ("transaction", INT),
+        ("email", OBJECT),
+        ("amount", FLOAT),
+        ("currency", OBJECT),
+        ("currency_amount", FLOAT),
+        ("comission_percent", FLOAT),
+        ("comission_fixed", FLOAT),
+        ("amount_profit", FLOAT),
+        ("method", PayoutMethod),
+        ("payment_id", OBJECT),
+        ("description", OBJECT),
+        ("date", DATE),
+        ("pay_date", DATE),
+        ("transaction_status", PaymentStatus),
+        ("custom_fields", OBJECT),
+        ("webhook_status", INT),
+        ("webhook_amount", INT),
+        ("extra", OBJECT),
+    )
+
+    def filter(self, status = None, method = None, since = None, until = None):
+        """
+        Returns new frame with matching transactions
+
+        :param status: (Optional) PaymentStatus or list of statuses
+        :param method: (Optional) PayoutMethod or list of methods
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        """
+        return self.take(self._mask("transaction_status", status, method, since, until, "date"))
+
+
+class PayoutFrame(RecordFrame):
+    """
+    Columnar container for payouts
+    """
+
+    record_class = Payout
+    container_class = Payouts
+    columns = (
+        ("num", INT),
+        ("payout_id", INT),
+        ("method", PayoutMethod),
+        ("amount", FLOAT),
+        ("comission_percent", FLOAT),
+        ("comission_fixed", FLOAT),
+        ("amount_profit", FLOAT),
+        ("date_create", DATE),
+        ("date_pay", DATE),
+        ("status", PaymentStatus),
+        ("remain_balance", OBJECT),
+        ("payout_status_code", OBJECT),
+        ("payout_status_text", OBJECT),
+        ("extra", OBJECT),
+    )
+
+    def filter(self, status = None, method = None, since = None, until = None):
+        """
+        Returns new frame with matching payouts
+
+        :param status: (Optional) PaymentStatus or list of statuses
+        :param method: (Optional) PayoutMethod or list of methods
+        :param since: (datetime, Optional) Created at or after this date
+        :param until: (datetime, Optional) Created before this date
+        """
+        return self.take(self._mask("status", status, method, since, until, "date_create"))
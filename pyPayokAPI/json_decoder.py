@@ -0,0 +1,51 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Backends in order of preference for "auto"
+BACKENDS = ("orjson", "msgspec", "json")
+
+
+def _msgspec_loads(data):
+    try:
+        return msgspec.json.decode(data)
+    except msgspec.DecodeError as e:
+        # Same exception type as other backends
+        raise ValueError(str(e))
+
+
+def available_backends():
+    """
+    Returns names of installed JSON backends (in order of preference)
+    """
+    installed = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    return [name for name in BACKENDS if installed[name]]
+
+
+def get_decoder(backend = None):
+    """
+    Returns function(bytes) decoding JSON response body. Decode errors are raised as ValueError.
+
+    :param backend: (Optional) "orjson", "msgspec", "json" or None/"auto" - the fastest installed one
+    """
+    if backend in (None, "auto"):
+        backend = available_backends()[0]
+    if backend == "orjson":
+        if orjson is None:
+            raise ImportError("orjson backend requires orjson: pip install orjson")
+        return orjson.loads
+    if backend == "msgspec":
+        if msgspec is None:
+            raise ImportError("msgspec backend requires msgspec: pip install msgspec")
+        return _msgspec_loads
+    if backend == "json":
+        return json.loads
+    raise ValueError("Unknown JSON backend: {}".format(backend))
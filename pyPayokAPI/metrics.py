@@ -0,0 +1,201 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+# Histogram bucket bounds (seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Request phases:
+#   wait - connect, send and wait for response headers
+#   transfer - response body download
+#   decode - JSON decoding
+#   deserialize - conversion of decoded response to payok_types objects
+PHASES = ("wait", "transfer", "decode", "deserialize")
+
+
+class Histogram:
+    """
+    Cumulative histogram (Prometheus style)
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds = DEFAULT_BUCKETS):
+        """
+        :param bounds: (Optional) Sorted bucket upper bounds
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self):
+        """
+        Returns list of (upper bound, cumulative count), the last bound is float("inf")
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(
+        key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Client instrumentation: per-method timing histograms by phase, byte, record, request and retry counters,
+    optional tracing spans. Pass it as "instrumentation" to pyPayokAPI or AsyncPayokAPI
+    (one instance can be shared by many clients).
+
+    Tracer can be any object with OpenTelemetry-style start_as_current_span(name, attributes=...) method,
+    e.g. opentelemetry.trace.get_tracer(__name__).
+    """
+
+    def __init__(self, buckets = DEFAULT_BUCKETS, tracer = None):
+        """
+        :param buckets: (Optional) Histogram bucket upper bounds (seconds)
+        :param tracer: (Optional) Tracer to create span for each API call
+        """
+        self.bucket_bounds = tuple(buckets)
+        self.tracer = tracer
+        self.lock = Lock()
+        self.durations = {}
+        self.requests = {}
+        self.retries = {}
+        self.sent_bytes = {}
+        self.received_bytes = {}
+        self.records = {}
+
+    @contextmanager
+    def span(self, method):
+        """
+        Tracing span of API call (does nothing without tracer)
+
+        :param method: API method name
+        """
+        if self.tracer is None:
+            yield None
+            return
+        with self.tracer.start_as_current_span("payok." + method, attributes={"payok.method": method}) as span:
+            try:
+                yield span
+            except Exception as e:
+                code = getattr(e, "code", None)
+                if code is not None:
+                    span.set_attribute("payok.error_code", code)
+                raise
+
+    def __observe(self, method, phase, seconds):
+        histogram = self.durations.get((method, phase))
+        if histogram is None:
+            histogram = self.durations[(method, phase)] = Histogram(self.bucket_bounds)
+        histogram.observe(seconds)
+
+    def observe_request(self, method, timings, sent_bytes, received_bytes, error = None):
+        """
+        Record one HTTP request
+
+        :param method: API method name
+        :param timings: Dict of phase -> seconds
+        :param sent_bytes: Request body size
+        :param received_bytes: Response body size
+        :param error: (Optional) pyPayokAPIException raised by request
+        """
+        code = "ok" if error is None else str(error.code)
+        with self.lock:
+            for phase, seconds in timings.items():
+                self.__observe(method, phase, seconds)
+            self.requests[(method, code)] = self.requests.get((method, code), 0) + 1
+            self.sent_bytes[method] = self.sent_bytes.get(method, 0) + sent_bytes
+            self.received_bytes[method] = self.received_bytes.get(method, 0) + received_bytes
+
+    def observe_retry(self, method, error):
+        """
+        Record retry of failed request
+
+        :param method: API method name
+        :param error: pyPayokAPIException that caused retry
+        """
+        key = (method, str(error.code))
+        with self.lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def observe_deserialize(self, method, seconds, records):
+        """
+        Record conversion of response to payok_types objects
+
+        :param method: API method name
+        :param seconds: Conversion time
+        :param records: Number of converted records
+        """
+        with self.lock:
+            self.__observe(method, "deserialize", seconds)
+            self.records[method] = self.records.get(method, 0) + records
+
+    def snapshot(self):
+        """
+        Returns dict of current values: "durations" {(method, phase): {"count", "sum", "buckets"}},
+        "requests" {(method, code): count}, "retries" {(method, code): count},
+        "sent_bytes", "received_bytes", "records" {method: count}
+        """
+        with self.lock:
+            return {
+                "durations": {key: {"count": h.count, "sum": h.sum, "buckets": h.buckets()}
+                              for key, h in self.durations.items()},
+                "requests": dict(self.requests),
+                "retries": dict(self.retries),
+                "sent_bytes": dict(self.sent_bytes),
+                "received_bytes": dict(self.received_bytes),
+                "records": dict(self.records),
+            }
+
+    def prometheus(self, prefix = "payok"):
+        """
+        Export metrics in Prometheus text exposition format
+
+        :param prefix: (Optional, default="payok") Metric name prefix
+        """
+        data = self.snapshot()
+        lines = []
+
+        name = prefix + "_request_duration_seconds"
+        lines.append("# HELP {} API request duration by phase.".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for (method, phase), histogram in sorted(data["durations"].items()):
+            for bound, count in histogram["buckets"]:
+                lines.append("{}_bucket{} {}".format(name, _labels(method=method, phase=phase, le=_number(bound)), count))
+            lines.append("{}_sum{} {}".format(name, _labels(method=method, phase=phase), _number(histogram["sum"])))
+            lines.append("{}_count{} {}".format(name, _labels(method=method, phase=phase), histogram["count"]))
+
+        for suffix, key, label, help_text in (
+                ("requests_total", "requests", "code", "API requests by result code."),
+                ("retries_total", "retries", "code", "Retried API requests by error code."),
+                ("sent_bytes_total", "sent_bytes", None, "Request body bytes sent."),
+                ("received_bytes_total", "received_bytes", None, "Response body bytes received."),
+                ("records_total", "records", None, "Records deserialized.")):
+            name = "{}_{}".format(prefix, suffix)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} counter".format(name))
+            for labels, value in sorted(data[key].items()):
+                if label is None:
+                    labels = _labels(method=labels)
+                else:
+                    labels = _labels(method=labels[0], **{label: labels[1]})
+                lines.append("{}{} {}".format(name, labels, value))
+        return "\n".join(lines) + "\n"
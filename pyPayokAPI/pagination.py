@@ -0,0 +1,323 @@
+from collections import deque
+from math import ceil
+from threading import Lock
+from time import monotonic, sleep
+
+from .payok_types import PayoutMethod, payout_method
+
+PAGE_SIZE = 100
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+    """
+
+    def __init__(self, rate, burst = 1):
+        """
+        :param rate: (Float) Requests per second
+        :param burst: (Int, Optional, default=1) Max number of requests that can be made at once
+        """
+        if rate <= 0:
+            raise ValueError("rate should be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def reserve(self, tokens = 1):
+        """
+        Reserve tokens and return the delay (seconds) caller should wait before making request
+
+        :param tokens: (Int, Optional, default=1) Number of tokens to take
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def try_acquire(self, tokens = 1):
+        """
+        Take tokens only if they are available now.
+        Returns 0 if tokens were taken, otherwise the delay (seconds) until they are available.
+
+        :param tokens: (Int, Optional, default=1) Number of tokens to take
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def refund(self, tokens = 1):
+        """
+        Return unused tokens
+
+        :param tokens: (Int, Optional, default=1) Number of tokens to return
+        """
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+    def acquire(self, tokens = 1, deadline = None):
+        """
+        Wait until tokens are available and take them
+
+        :param tokens: (Int, Optional, default=1) Number of tokens to take
+        :param deadline: (Deadline, Optional) Fail instead of waiting past the deadline
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            if deadline is not None and delay >= deadline.remaining():
+                # Tokens are not used
+                self.refund(tokens)
+                deadline.check(delay)
+            sleep(delay)
+
+
+class Pager:
+    """
+    Offset pagination engine.
+    Fetches pages under rate limit, optionally prefetching several offsets in parallel,
+    and stops on empty or short page (end of data).
+    """
+
+    def __init__(self, fetch_page, max_pages = 10, page_size = PAGE_SIZE, prefetch = 1, rate_limiter = None,
+                 start_offset = 0, fetched = None, deadline = None):
+        """
+        :param fetch_page: Function(offset) returning list of page items
+        :param max_pages: (Int, Optional, default=10) Max number of pages to fetch (None - no limit)
+        :param page_size: (Int, Optional, default=100) Page size of API method
+        :param prefetch: (Int, Optional, default=1) Max number of pages fetched in parallel
+        :param rate_limiter: (TokenBucket, Optional) Rate limiter for page requests
+        :param start_offset: (Int, Optional, default=0) Offset of the first page
+        :param fetched: (Dict, Optional) Already fetched pages by offset (used without request)
+        :param deadline: (Deadline, Optional) Deadline of the whole pagination (waits for rate limit are bounded by it)
+        """
+        self.fetch_page = fetch_page
+        self.max_pages = max_pages
+        self.page_size = page_size
+        self.prefetch = max(1, prefetch)
+        self.rate_limiter = rate_limiter
+        self.start_offset = start_offset
+        self.fetched = fetched or {}
+        self.deadline = deadline
+        self.expected = None
+
+    def expect(self, pages):
+        """
+        Set estimated number of pages still needed by consumer: no more than that is prefetched
+
+        :param pages: (Int) Number of pages
+        """
+        self.expected = max(1, pages)
+
+    def __fetch(self, offset):
+        if offset in self.fetched:
+            return self.fetched.pop(offset)
+        if self.rate_limiter:
+            self.rate_limiter.acquire(deadline=self.deadline)
+        return self.fetch_page(offset)
+
+    def __iter__(self):
+        """
+        Yield pages (lists of items) in offset order
+        """
+        if self.prefetch == 1:
+            page_number = 0
+            while self.max_pages is None or page_number < self.max_pages:
+                items = self.__fetch(self.start_offset + page_number * self.page_size)
+                page_number += 1
+                if not items:
+                    # No (more) items
+                    return
+                yield items
+                if len(items) < self.page_size:
+                    # Short page - end of data
+                    return
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=self.prefetch)
+        futures = deque()
+        next_page = 0
+        try:
+            while True:
+                prefetch = self.prefetch if self.expected is None else min(self.prefetch, self.expected)
+                while len(futures) < prefetch and (self.max_pages is None or next_page < self.max_pages):
+                    futures.append(executor.submit(self.__fetch, self.start_offset + next_page * self.page_size))
+                    next_page += 1
+                if not futures:
+                    return
+                items = futures.popleft().result()
+                if not items:
+                    # No (more) items
+                    return
+                yield items
+                if len(items) < self.page_size:
+                    # Short page - end of data
+                    return
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+def iterate(pages, match = None, stop = None):
+    """
+    Yield items from pages lazily. Closing the generator stops page fetching.
+
+    :param pages: Iterable of pages (lists of items)
+    :param match: (Optional) Function(item) returning True for items to yield
+    :param stop: (Optional) Function(item) returning True when iteration should stop
+    """
+    pages = iter(pages)
+    try:
+        for page in pages:
+            for item in page:
+                if stop and stop(item):
+                    return
+                if match and not match(item):
+                    continue
+                yield item
+    finally:
+        if hasattr(pages, "close"):
+            # Stop prefetching
+            pages.close()
+
+
+def collect(pages, result, max_results, match = None, stop = None):
+    """
+    Collect items from pages into result.items
+
+    :param pages: Iterable of pages (lists of items)
+    :param result: Container with items list (Transactions, Payouts)
+    :param max_results: Max number of results to collect
+    :param match: (Optional) Function(item) returning True for items to collect
+    :param stop: (Optional) Function(item) returning True when collecting should stop
+    """
+    page_size = getattr(pages, "page_size", PAGE_SIZE)
+    expect = getattr(pages, "expect", None)
+    page_iter = iter(pages)
+    seen = 0
+    try:
+        for page in page_iter:
+            seen += len(page)
+            for item in page:
+                if stop and stop(item):
+                    return result
+                if match and not match(item):
+                    continue
+                result.items.append(item)
+                if len(result.items) >= max_results:
+                    return result
+            if expect:
+                # Prefetch only as many pages as needed at the observed match rate
+                rate = max(len(result.items), 1) / seen
+                expect(ceil((max_results - len(result.items)) / (rate * page_size)))
+    finally:
+        if hasattr(page_iter, "close"):
+            page_iter.close()
+    return result
+
+
+def seek(fetch_page, reached, page_size = PAGE_SIZE, rate_limiter = None, fetched = None, deadline = None):
+    """
+    Find the first page that can contain records of a window, for records ordered newest first.
+    Pages are probed exponentially and then by binary search, so deep windows are found in O(log n) requests.
+
+    :param fetch_page: Function(offset) returning list of page items
+    :param reached: Function(item) returning True for items older than window end
+    :param page_size: (Int, Optional, default=100) Page size of API method
+    :param rate_limiter: (TokenBucket, Optional) Rate limiter for page requests
+    :param fetched: (Dict, Optional) Filled with probed pages by offset (to reuse them)
+    :param deadline: (Deadline, Optional) Waits for rate limit are bounded by it
+    :return: offset of the page
+    """
+    fetched = {} if fetched is None else fetched
+
+    def done(page_number):
+        offset = page_number * page_size
+        if offset not in fetched:
+            if rate_limiter:
+                rate_limiter.acquire(deadline=deadline)
+            fetched[offset] = fetch_page(offset)
+        items = fetched[offset]
+        return len(items) < page_size or reached(items[-1])
+
+    if done(0):
+        return 0
+    low, high = 0, 1
+    while not done(high):
+        low, high = high, high * 2
+    # First page that is done is in (low, high]
+    while high - low > 1:
+        middle = (low + high) // 2
+        if done(middle):
+            high = middle
+        else:
+            low = middle
+    return high * page_size
+
+
+def window_filter(date_field, status_field, status = None, method = None, since = None, until = None):
+    """
+    Build match and stop functions for records ordered newest first
+
+    :param date_field: Name of record date field
+    :param status_field: Name of record status field
+    :param status: (Optional) PaymentStatus or list of statuses
+    :param method: (Optional) PayoutMethod (or name) or list of methods
+    :param since: (datetime, Optional) Created at or after this date (older records stop iteration)
+    :param until: (datetime, Optional) Created before this date
+    :return: tuple (match, stop), functions are None if not needed
+    """
+    conditions = []
+    if status is not None:
+        statuses = frozenset(status) if isinstance(status, (list, tuple, set, frozenset)) else frozenset([status])
+        conditions.append(lambda item: getattr(item, status_field) in statuses)
+    if method is not None:
+        methods = method if isinstance(method, (list, tuple, set, frozenset)) else [method]
+        methods = frozenset(item if isinstance(item, PayoutMethod) else payout_method(item) for item in methods)
+        conditions.append(lambda item: item.method in methods)
+    if until is not None:
+        conditions.append(lambda item: getattr(item, date_field) < until)
+    if not conditions:
+        match = None
+    elif len(conditions) == 1:
+        match = conditions[0]
+    else:
+        match = lambda item: all(condition(item) for condition in conditions)
+    stop = (lambda item: getattr(item, date_field) < since) if since is not None else None
+    return match, stop
+
+
+def window_pager(fetch_page, date_field, until = None, max_pages = 10, prefetch = 1, rate_limiter = None,
+                 deadline = None):
+    """
+    Pager for records ordered newest first that starts at the first page that can contain records created
+    before "until" (found with seek()).
+
+    :param fetch_page: Function(offset) returning list of page items
+    :param date_field: Name of record date field
+    :param until: (datetime, Optional) Window end
+    :param max_pages: (Int, Optional, default=10) Max number of pages to fetch after the window start
+    :param prefetch: (Int, Optional, default=1) Max number of pages fetched in parallel
+    :param rate_limiter: (TokenBucket, Optional) Rate limiter for page requests
+    :param deadline: (Deadline, Optional) Deadline of the whole pagination (waits for rate limit are bounded by it)
+    """
+    if until is None:
+        return Pager(fetch_page, max_pages=max_pages, prefetch=prefetch, rate_limiter=rate_limiter, deadline=deadline)
+    fetched = {}
+    start_offset = seek(fetch_page, lambda item: getattr(item, date_field) < until,
+                        rate_limiter=rate_limiter, fetched=fetched, deadline=deadline)
+    return Pager(fetch_page, max_pages=max_pages, prefetch=prefetch, rate_limiter=rate_limiter,
+                 start_offset=start_offset, fetched={start_offset: fetched[start_offset]}, deadline=deadline)
@@ -10,6 +10,7 @@ class Dictionaryable(ABC):
     Subclasses of this class are guaranteed to be able to be converted to dictionary.
     All subclasses of this class must override to_dict.
     """
+    __slots__ = ()
 
     def to_dict(self):
         """
@@ -44,6 +45,7 @@ class JsonDeserializable(ABC):
     Subclasses of this class are guaranteed to be able to be created from a json-style dict or json formatted string.
     All subclasses of this class must override de_json.
     """
+    __slots__ = ()
 
     @classmethod
     def de_json(cls, json_dict, process_mode = 0):
@@ -88,7 +90,7 @@ class JsonDeserializable(ABC):
         #     for x, y in self.__dict__.items()
         # }
         d = {}
-        for x, y in self.__dict__.items():
+        for x, y in self._fields():
             if isinstance(y, list):
                 d[x] = [str(i) for i in y]
             elif isinstance(y, dict):
@@ -99,6 +101,91 @@ class JsonDeserializable(ABC):
                 d[x] = y
         return str(d)
 
+    def _fields(self):
+        """
+        Returns (name, value) pairs of instance fields
+        """
+        return self.__dict__.items()
+
+
+class Record(JsonDeserializable, Dictionaryable):
+    """
+    Base class for API records with fixed schema (Transaction, Payout).
+    Schema fields are stored in __slots__, unknown response keys are stored in "extra" mapping.
+    """
+    __slots__ = ()
+
+    # (field name, converter or None) pairs of API fields
+    schema = ()
+    field_names = frozenset()
+
+    # noinspection PyMethodOverriding
+    @classmethod
+    def de_json(cls, json_dict, num):
+        """
+        Returns an instance of this class from the given json dict or string.
+
+        :param json_dict: The json dict from which to create the object.
+        :param num: Record number in list response
+        """
+        data = cls.check_json(json_dict)
+        instance = cls.__new__(cls)
+        get = data.get
+        for key, converter in cls.schema:
+            value = get(key)
+            setattr(instance, key, converter(value) if converter else value)
+        unknown = data.keys() - cls.field_names
+        instance.extra = {key: data[key] for key in unknown if not key.isdigit()} if unknown else {}
+        instance.num = num
+        return instance
+
+    def __getattr__(self, name):
+        # Unknown response keys are still accessible as attributes
+        if name != "extra":
+            try:
+                return self.extra[name]
+            except (AttributeError, KeyError):
+                pass
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def _fields(self):
+        return ((name, getattr(self, name, None)) for name in self.__slots__)
+
+    def to_dict(self):
+        """
+        Returns a DICT in API response format (can be passed back to de_json)
+        """
+        d = dict(self.extra)
+        for key, _ in self.schema:
+            value = getattr(self, key)
+            if isinstance(value, datetime):
+                value = value.strftime(DATETIME_FORMAT)
+            elif isinstance(value, PayoutMethod):
+                value = value.name
+            elif isinstance(value, PaymentStatus):
+                value = value.value
+            d[key] = value
+        return d
+
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_datetime(value):
+    """
+    Parse API timestamp ("%Y-%m-%d %H:%M:%S").
+    Fixed format is parsed with datetime.fromisoformat, anything else falls back to datetime.strptime.
+
+    :param value: Timestamp string
+    :return: datetime
+    """
+    if isinstance(value, str) and len(value) == 19 and value[10] == " ":
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, DATETIME_FORMAT)
+
 
 # noinspection PyMethodOverriding
 class Balance(JsonDeserializable):
@@ -115,8 +202,13 @@ class Balance(JsonDeserializable):
         return instance
 
 
-# noinspection PyMethodOverriding
-class Transaction(JsonDeserializable):
+class Transaction(Record):
+    __slots__ = (
+        "num", "transaction", "email", "amount", "currency", "currency_amount",
+        "comission_percent", "comission_fixed", "amount_profit", "method", "payment_id", "description",
+        "date", "pay_date", "transaction_status", "custom_fields", "webhook_status", "webhook_amount",
+        "extra")
+
     def __init__(self):
         self.num = None
         self.transaction = None
@@ -136,32 +228,7 @@ class Transaction(JsonDeserializable):
         self.custom_fields = None
         self.webhook_status = None
         self.webhook_amount = None
-
-    @classmethod
-    def de_json(cls, json_dict, num):
-        data = cls.check_json(json_dict)
-        instance = super(Transaction, cls).de_json(data, process_mode=2)
-        instance.num = num
-        instance.transaction = int(instance.transaction)
-        instance.amount = float(instance.amount)
-        instance.currency_amount = float(instance.currency_amount)
-        instance.comission_percent = float(instance.comission_percent)
-        instance.comission_fixed = float(instance.comission_fixed)
-        instance.amount_profit = float(instance.amount_profit)
-        try:
-            instance.method = PayoutMethod[instance.method.lower()]
-        except:
-            instance.method = PayoutMethod.unknown
-        #instance.payment_id = int(instance.payment_id)
-        instance.date = datetime.strptime(instance.date, "%Y-%m-%d %H:%M:%S")
-        instance.pay_date = datetime.strptime(instance.pay_date, "%Y-%m-%d %H:%M:%S")
-        try:
-            instance.transaction_status = PaymentStatus(int(instance.transaction_status))
-        except:
-            instance.transaction_status = PaymentStatus.unknown
-        instance.webhook_status = int(instance.webhook_status)
-        instance.webhook_amount = int(instance.webhook_amount)
-        return instance
+        self.extra = {}
 
 
 # noinspection PyMethodOverriding
@@ -174,10 +241,11 @@ class Transactions(JsonDeserializable):
         data = cls.check_json(json_dict)
         instance = super(Transactions, cls).de_json(data, process_mode=2)
         instance.items = []
+        append = instance.items.append
+        de_json = Transaction.de_json
         for key, value in data.items():
             if not key.isdigit(): continue
-            transaction = Transaction.de_json(json.dumps(value), int(key))
-            instance.items.append(transaction)
+            append(de_json(value, int(key)))
         return instance
 
 
@@ -208,13 +276,22 @@ class PaymentStatus(Enum):
     unknown = 99
 
 
+# Statuses that never change
+FINAL_STATUSES = (PaymentStatus.success, PaymentStatus.fail)
+
+
 class PaymentCommissionType(Enum):
     balance = "Comission from balance"
     payment = "Comission from payment"
 
 
 # noinspection PyMethodOverriding
-class Payout(JsonDeserializable):
+class Payout(Record):
+    __slots__ = (
+        "num", "payout_id", "method", "amount", "comission_percent", "comission_fixed", "amount_profit",
+        "date_create", "date_pay", "status", "remain_balance", "payout_status_code", "payout_status_text",
+        "extra")
+
     def __init__(self):
         self.num = None
         self.payout_id = None
@@ -229,34 +306,16 @@ class Payout(JsonDeserializable):
         self.remain_balance = None
         self.payout_status_code = None
         self.payout_status_text = None
+        self.extra = {}
 
     @classmethod
     def de_json(cls, json_dict, num):
-        data = cls.check_json(json_dict)
-        instance = super(Payout, cls).de_json(data, process_mode=2)
-        instance.num = num
-        instance.payout_id = int(instance.payout_id)
-        try:
-            instance.method = PayoutMethod[instance.method.lower()]
-        except:
-            instance.method = PayoutMethod.unknown
-        instance.amount = float(instance.amount)
-        instance.comission_percent = float(instance.comission_percent)
-        instance.comission_fixed = float(instance.comission_fixed)
-        instance.amount_profit = float(instance.amount_profit)
-        instance.date_create = datetime.strptime(instance.date_create, "%Y-%m-%d %H:%M:%S")
-        instance.date_pay = datetime.strptime(instance.date_pay, "%Y-%m-%d %H:%M:%S")
+        instance = super(Payout, cls).de_json(json_dict, num)
         if not(instance.status is None):
-            try:
-                instance.status = PaymentStatus(int(instance.status))
-            except:
-                instance.status = PaymentStatus.unknown
+            instance.status = payment_status(instance.status)
             instance.payout_status_code = instance.status.value
         elif not(instance.payout_status_code is None):
-            try:
-                instance.payout_status_code = PaymentStatus(int(instance.payout_status_code))
-            except:
-                instance.payout_status_code = PaymentStatus.unknown
+            instance.payout_status_code = payment_status(instance.payout_status_code)
             instance.status = instance.payout_status_code.value
         else:
             instance.status = PaymentStatus.unknown
@@ -274,10 +333,11 @@ class Payouts(JsonDeserializable):
         data = cls.check_json(json_dict)
         instance = super(Payouts, cls).de_json(data, process_mode=2)
         instance.items = []
+        append = instance.items.append
+        de_json = Payout.de_json
         for key, value in data.items():
-            if not key.isdigit(): pass
-            payout = Payout.de_json(json.dumps(value), int(key))
-            instance.items.append(payout)
+            if not key.isdigit(): continue
+            append(de_json(value, int(key)))
         return instance
 
 
@@ -294,3 +354,65 @@ class PaymentMethod(Enum):
     th = "Tether USDT"
     lt = "Litecoin"
     dg = "Dogecoin"
+
+
+_payout_methods = {item.name: item for item in PayoutMethod}
+_payment_statuses = {item.value: item for item in PaymentStatus}
+
+
+def payout_method(value):
+    """
+    Convert API method name to PayoutMethod (PayoutMethod.unknown for unknown names)
+    """
+    try:
+        return _payout_methods[value.lower()]
+    except (KeyError, AttributeError):
+        return PayoutMethod.unknown
+
+
+def payment_status(value):
+    """
+    Convert API status code to PaymentStatus (PaymentStatus.unknown for unknown codes)
+    """
+    try:
+        return _payment_statuses[int(value)]
+    except (KeyError, TypeError, ValueError):
+        return PaymentStatus.unknown
+
+
+Transaction.schema = (
+    ("transaction", int),
+    ("email", None),
+    ("amount", float),
+    ("currency", None),
+    ("currency_amount", float),
+    ("comission_percent", float),
+    ("comission_fixed", float),
+    ("amount_profit", float),
+    ("method", payout_method),
+    ("payment_id", None),
+    ("description", None),
+    ("date", parse_datetime),
+    ("pay_date", parse_datetime),
+    ("transaction_status", payment_status),
+    ("custom_fields", None),
+    ("webhook_status", int),
+    ("webhook_amount", int),
+)
+Transaction.field_names = frozenset(name for name, _ in Transaction.schema)
+
+Payout.schema = (
+    ("payout_id", int),
+    ("method", payout_method),
+    ("amount", float),
+    ("comission_percent", float),
+    ("comission_fixed", float),
+    ("amount_profit", float),
+    ("date_create", parse_datetime),
+    ("date_pay", parse_datetime),
+    ("status", None),
+    ("remain_balance", None),
+    ("payout_status_code", None),
+    ("payout_status_text", None),
+)
+Payout.field_names = frozenset(name for name, _ in Payout.schema)
@@ -0,0 +1,281 @@
+import asyncio
+import queue
+import threading
+from time import monotonic
+
+from .pagination import PAGE_SIZE
+from .payok_types import PaymentStatus, FINAL_STATUSES, payment_status
+
+
+class PayoutEvent:
+    """
+    Payout status change
+    """
+
+    def __init__(self, payout, old_status, new_status):
+        """
+        :param payout: Payout
+        :param old_status: Previous PaymentStatus
+        :param new_status: New PaymentStatus
+        """
+        self.payout = payout
+        self.old_status = old_status
+        self.new_status = new_status
+
+    def __str__(self):
+        return "Payout {}: {} -> {}".format(self.payout.payout_id, self.old_status, self.new_status)
+
+
+class _Tracked:
+    __slots__ = ("status", "added", "next_due", "checked")
+
+    def __init__(self, status, now):
+        self.status = status
+        self.added = now
+        self.next_due = now
+        self.checked = None
+
+
+class PayoutWatcher:
+    """
+    Payout status watcher.
+    Tracked payouts are checked in bulk with payout list pages, single payout lookups are used only for payouts
+    not found on the first pages. Fresh payouts are polled often, old ones less and less often.
+    Payout is not tracked anymore when it reaches final status.
+    """
+
+    def __init__(self, client, callback = None,
+                 min_interval = 5.0, max_interval = 300.0, age_factor = 0.1,
+                 max_pages = 3, max_lookups = 10, max_queue = 1000, on_error = None):
+        """
+        :param client: pyPayokAPI instance
+        :param callback: (Optional) Function(PayoutEvent) called on status change
+        :param min_interval: (Float, Optional, default=5.0) Poll interval of fresh payouts (seconds)
+        :param max_interval: (Float, Optional, default=300.0) Max poll interval of old payouts (seconds)
+        :param age_factor: (Float, Optional, default=0.1) Poll interval grows as age_factor * payout tracking age
+        :param max_pages: (Int, Optional, default=3) Max number of payout list pages per poll
+        :param max_lookups: (Int, Optional, default=10) Max number of single payout lookups per poll
+        :param max_queue: (Int, Optional, default=1000) Max number of undelivered events of each events()/aevents()
+            consumer (the oldest events are dropped)
+        :param on_error: (Optional) Function(Exception) called when background poll fails
+            (default - error is printed if client has print_errors)
+        """
+        self.client = client
+        self.callback = callback
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.age_factor = age_factor
+        self.max_pages = max_pages
+        self.max_lookups = max_lookups
+        self.max_queue = max_queue
+        self.on_error = on_error
+        self.tracked = {}
+        self.lock = threading.Lock()
+        # Delivery functions of attached events()/aevents() consumers
+        self.consumers = []
+        self.dropped = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def watch(self, payout_ids, status = PaymentStatus.waiting):
+        """
+        Start tracking payouts
+
+        :param payout_ids: Iterable of payout IDs
+        :param status: (PaymentStatus, Optional, default=waiting) Known status of payouts
+        """
+        now = monotonic()
+        with self.lock:
+            for payout_id in payout_ids:
+                if int(payout_id) not in self.tracked:
+                    self.tracked[int(payout_id)] = _Tracked(status, now)
+
+    def unwatch(self, payout_id):
+        """
+        Stop tracking payout
+
+        :param payout_id: Payout ID
+        """
+        with self.lock:
+            self.tracked.pop(int(payout_id), None)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.tracked)
+
+    def interval(self, age):
+        """
+        Poll interval of payout tracked for age seconds
+        """
+        return min(self.max_interval, max(self.min_interval, age * self.age_factor))
+
+    def poll(self):
+        """
+        Check due payouts once.
+
+        :return: list of PayoutEvent
+        """
+        now = monotonic()
+        with self.lock:
+            due = {payout_id for payout_id, tracked in self.tracked.items() if tracked.next_due <= now}
+            tracked_ids = set(self.tracked)
+            # Never checked first, then least recently checked
+            last_checked = {payout_id: self.tracked[payout_id].checked for payout_id in due}
+        if not due:
+            return []
+
+        found = {}
+        oldest_due = min(due)
+        for page in range(self.max_pages):
+            items = self.client.payout(offset=page * PAGE_SIZE).items
+            for item in items:
+                if item.payout_id in tracked_ids:
+                    found[item.payout_id] = item
+            if len(items) < PAGE_SIZE or due.issubset(found) or min(item.payout_id for item in items) < oldest_due:
+                break
+        checked = set(found)
+        lookups = sorted(due.difference(found), key=lambda payout_id: (
+            last_checked[payout_id] is not None, last_checked[payout_id] or 0, -payout_id))
+        for payout_id in lookups[:self.max_lookups]:
+            # Too old for list pages
+            checked.add(payout_id)
+            for item in self.client.payout(payout_id=payout_id).items:
+                found[item.payout_id] = item
+
+        events = []
+        now = monotonic()
+        with self.lock:
+            for payout_id, item in found.items():
+                tracked = self.tracked.get(payout_id)
+                if tracked is None:
+                    continue
+                # Status is a plain code when response has only payout_status_code
+                status = payment_status(getattr(item.status, "value", item.status))
+                if status != tracked.status:
+                    events.append(PayoutEvent(item, tracked.status, status))
+                    tracked.status = status
+                if status in FINAL_STATUSES:
+                    del self.tracked[payout_id]
+            # Due payouts left without lookup stay due for the next poll
+            for payout_id in due.intersection(checked):
+                tracked = self.tracked.get(payout_id)
+                if tracked is not None:
+                    tracked.checked = now
+                    tracked.next_due = now + self.interval(now - tracked.added)
+        with self.lock:
+            consumers = list(self.consumers)
+        for event in events:
+            for deliver in consumers:
+                deliver(event)
+            if self.callback:
+                self.callback(event)
+        return events
+
+    def next_due(self):
+        """
+        Returns seconds until next poll is due (None if nothing is tracked)
+        """
+        with self.lock:
+            if not self.tracked:
+                return None
+            return max(0.0, min(tracked.next_due for tracked in self.tracked.values()) - monotonic())
+
+    def run(self, idle_interval = 1.0):
+        """
+        Poll until stop() is called (blocking)
+
+        :param idle_interval: (Float, Optional, default=1.0) Check interval when nothing is tracked (seconds)
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+                elif getattr(self.client, "print_errors", False):
+                    print("Payout watcher poll failed: {}".format(e))
+            delay = self.next_due()
+            self.stop_event.wait(idle_interval if delay is None else max(delay, 0.05))
+
+    def start(self):
+        """
+        Start polling in background thread
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop background polling
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __put(self, events, event):
+        # Bounded queue of consumer: the oldest event is dropped when it is full
+        while True:
+            try:
+                events.put_nowait(event)
+                return
+            except (queue.Full, asyncio.QueueFull):
+                try:
+                    events.get_nowait()
+                    with self.lock:
+                        self.dropped += 1
+                except (queue.Empty, asyncio.QueueEmpty):
+                    pass
+
+    def __attach(self, deliver):
+        with self.lock:
+            self.consumers.append(deliver)
+
+    def __detach(self, deliver):
+        with self.lock:
+            self.consumers.remove(deliver)
+
+    def events(self, timeout = None):
+        """
+        Generator of status changes (for use with background polling).
+        Events are queued only while the generator is running.
+
+        :param timeout: (Optional) Stop if no event arrives in timeout seconds
+        """
+        events = queue.Queue(self.max_queue)
+
+        def deliver(event):
+            self.__put(events, event)
+
+        self.__attach(deliver)
+        try:
+            while True:
+                try:
+                    yield events.get(timeout=timeout)
+                except queue.Empty:
+                    return
+        finally:
+            self.__detach(deliver)
+
+    async def aevents(self):
+        """
+        Async generator of status changes (for use with background polling).
+        Events are queued only while the generator is running, it can be cancelled at any time.
+        """
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(self.max_queue)
+
+        def deliver(event):
+            try:
+                loop.call_soon_threadsafe(self.__put, events, event)
+            except RuntimeError:
+                # Loop is closed
+                pass
+
+        self.__attach(deliver)
+        try:
+            while True:
+                yield await events.get()
+        finally:
+            self.__detach(deliver)
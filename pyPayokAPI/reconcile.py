@@ -0,0 +1,282 @@
+import csv
+import os
+import pickle
+import shutil
+import tempfile
+from zlib import crc32
+
+from .payok_types import PaymentStatus, payment_status
+
+MATCHED = "matched"
+MISSING = "missing"                  # Order has no PayOK transaction
+UNKNOWN = "unknown"                  # PayOK transaction has no order
+DUPLICATE = "duplicate"              # More than one PayOK transaction for the order
+AMOUNT_MISMATCH = "amount_mismatch"
+STATUS_DIVERGED = "status_diverged"
+KINDS = (MATCHED, MISSING, UNKNOWN, DUPLICATE, AMOUNT_MISMATCH, STATUS_DIVERGED)
+
+
+class Order:
+    """
+    Local order to reconcile
+    """
+    __slots__ = ("key", "amount", "status", "data")
+
+    def __init__(self, key, amount, status = None, data = None):
+        """
+        :param key: Payment ID (or transaction ID) of the order
+        :param amount: (Float) Expected amount
+        :param status: (PaymentStatus, Optional) Expected status (None - not checked)
+        :param data: (Optional) Original order row
+        """
+        self.key = str(key)
+        self.amount = float(amount)
+        self.status = status if status is None or isinstance(status, PaymentStatus) else payment_status(status)
+        self.data = data
+
+    def __repr__(self):
+        return "Order({!r}, {!r}, {})".format(self.key, self.amount, self.status)
+
+
+class Discrepancy:
+    """
+    Reconciliation result for one order or transaction
+    """
+    __slots__ = ("kind", "key", "order", "transaction")
+
+    def __init__(self, kind, key, order, transaction):
+        """
+        :param kind: One of KINDS
+        :param key: Join key (payment ID or transaction ID)
+        :param order: Order (None for UNKNOWN)
+        :param transaction: Transaction (None for MISSING)
+        """
+        self.kind = kind
+        self.key = key
+        self.order = order
+        self.transaction = transaction
+
+    def __repr__(self):
+        return "Discrepancy({}, {!r})".format(self.kind, self.key)
+
+
+class ReconciliationReport:
+    """
+    Counts of reconciliation results by kind and first max_items results of each kind (except MATCHED)
+    """
+
+    def __init__(self, max_items = 1000):
+        """
+        :param max_items: (Int, Optional, default=1000) Max number of kept results of each kind (None - all)
+        """
+        self.max_items = max_items
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.items = {kind: [] for kind in KINDS if kind != MATCHED}
+        self.orders = 0
+        self.transactions = 0
+
+    @property
+    def ok(self):
+        """
+        True if every order matched exactly one transaction and there are no unknown transactions
+        """
+        return all(not count for kind, count in self.counts.items() if kind != MATCHED)
+
+    def add(self, item):
+        self.counts[item.kind] += 1
+        if item.kind != MATCHED:
+            items = self.items[item.kind]
+            if self.max_items is None or len(items) < self.max_items:
+                items.append(item)
+
+    def __repr__(self):
+        return "ReconciliationReport(orders={}, transactions={}, {})".format(
+            self.orders, self.transactions, ", ".join("{}={}".format(kind, self.counts[kind]) for kind in KINDS))
+
+
+def read_orders_csv(path, key_column = "payment_id", amount_column = "amount", status_column = None,
+                    delimiter = ",", encoding = "utf-8"):
+    """
+    Read orders from CSV file lazily (constant memory)
+
+    :param path: CSV file path (first row is header)
+    :param key_column: (Optional, default="payment_id") Column with payment ID
+    :param amount_column: (Optional, default="amount") Column with amount
+    :param status_column: (Optional) Column with expected status (PayOK status code)
+    :param delimiter: (Optional, default=",") CSV delimiter
+    :param encoding: (Optional, default="utf-8") File encoding
+    """
+    with open(path, newline="", encoding=encoding) as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            status = row[status_column] if status_column else None
+            yield Order(row[key_column], row[amount_column], status if status != "" else None, row)
+
+
+def _order(item):
+    if isinstance(item, Order):
+        return item
+    if isinstance(item, dict):
+        return Order(item["key"], item["amount"], item.get("status"), item)
+    return Order(*item)
+
+
+class Reconciler:
+    """
+    Matches local orders against PayOK transactions with a hash index on the join key in a single pass
+    over each input.
+
+    Orders are indexed in memory. If there are more than max_orders, both inputs are spilled to
+    temporary files partitioned by key hash, and partitions are reconciled one by one, so memory
+    use is bounded by max_orders (with evenly distributed keys).
+    """
+
+    def __init__(self, key = "payment_id", amount_tolerance = 0.005, max_orders = 1000000, partitions = 16,
+                 temp_dir = None, max_items = 1000, callback = None):
+        """
+        :param key: (Optional, default="payment_id") Transaction field matched with order key ("payment_id" or "transaction")
+        :param amount_tolerance: (Float, Optional, default=0.005) Max allowed amount difference
+        :param max_orders: (Int, Optional, default=1000000) Max number of orders indexed in memory at once
+        :param partitions: (Int, Optional, default=16) Number of partitions when orders do not fit in memory
+        :param temp_dir: (Optional) Directory for partition files (default - system temp directory)
+        :param max_items: (Int, Optional, default=1000) Max number of kept results of each kind in report
+        :param callback: (Optional) Function(Discrepancy) called for every result except MATCHED
+        """
+        self.key = key
+        self.amount_tolerance = amount_tolerance
+        self.max_orders = max_orders
+        self.partitions = max(2, partitions)
+        self.temp_dir = temp_dir
+        self.max_items = max_items
+        self.callback = callback
+
+    def run(self, orders, transactions):
+        """
+        Reconcile orders with transactions
+
+        :param orders: Iterable of Order, dicts ("key", "amount", optional "status") or (key, amount[, status]) tuples
+        :param transactions: Iterable of Transaction (e.g. client.iter_transactions())
+        :return: ReconciliationReport
+        """
+        report = ReconciliationReport(self.max_items)
+        orders = iter(orders)
+        index = {}
+        for item in orders:
+            order = _order(item)
+            report.orders += 1
+            if order.key in index:
+                # Same order listed twice: keep the last one
+                report.orders -= 1
+            index[order.key] = order
+            if len(index) > self.max_orders:
+                self.__run_partitioned(index, orders, transactions, report)
+                return report
+        self.__join(index, transactions, report)
+        return report
+
+    def __emit(self, report, kind, key, order, transaction):
+        item = Discrepancy(kind, key, order, transaction)
+        report.add(item)
+        if self.callback is not None and kind != MATCHED:
+            self.callback(item)
+
+    def __join(self, index, transactions, report):
+        """
+        Probe order index with transactions, then report orders that were not found
+        """
+        field = self.key
+        tolerance = self.amount_tolerance
+        emit = self.__emit
+        matched = set()
+        for transaction in transactions:
+            report.transactions += 1
+            key = str(getattr(transaction, field))
+            order = index.get(key)
+            if order is None:
+                emit(report, UNKNOWN, key, None, transaction)
+            elif key in matched:
+                emit(report, DUPLICATE, key, order, transaction)
+            else:
+                matched.add(key)
+                if transaction.amount is None or abs(transaction.amount - order.amount) > tolerance:
+                    emit(report, AMOUNT_MISMATCH, key, order, transaction)
+                elif order.status is not None and transaction.transaction_status != order.status:
+                    emit(report, STATUS_DIVERGED, key, order, transaction)
+                else:
+                    emit(report, MATCHED, key, order, transaction)
+        for key, order in index.items():
+            if key not in matched:
+                emit(report, MISSING, key, order, None)
+
+    def __run_partitioned(self, index, orders, transactions, report):
+        """
+        Grace hash join: spill orders and transactions to partition files by key hash and join partitions
+        """
+        temp_dir = tempfile.mkdtemp(prefix="payok-reconcile-", dir=self.temp_dir)
+        count = self.partitions
+        try:
+            order_files = self.__open_partitions(temp_dir, "orders", count)
+            for order in index.values():
+                pickle.dump(order, order_files[crc32(order.key.encode()) % count], pickle.HIGHEST_PROTOCOL)
+            index.clear()
+            for item in orders:
+                order = _order(item)
+                report.orders += 1
+                pickle.dump(order, order_files[crc32(order.key.encode()) % count], pickle.HIGHEST_PROTOCOL)
+            for f in order_files:
+                f.close()
+
+            field = self.key
+            transaction_files = self.__open_partitions(temp_dir, "transactions", count)
+            for transaction in transactions:
+                key = str(getattr(transaction, field))
+                pickle.dump(transaction, transaction_files[crc32(key.encode()) % count], pickle.HIGHEST_PROTOCOL)
+            for f in transaction_files:
+                f.close()
+
+            for number in range(count):
+                index = {}
+                for order in _load(os.path.join(temp_dir, "orders-{}".format(number))):
+                    if order.key in index:
+                        report.orders -= 1
+                    index[order.key] = order
+                self.__join(index, _load(os.path.join(temp_dir, "transactions-{}".format(number))), report)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def __open_partitions(temp_dir, name, count):
+        return [open(os.path.join(temp_dir, "{}-{}".format(name, number)), "wb") for number in range(count)]
+
+
+def _load(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def reconcile(client, shop, orders, since = None, until = None, key = "payment_id", amount_tolerance = 0.005,
+              max_orders = 1000000, prefetch = 2, max_items = 1000, callback = None):
+    """
+    Reconcile orders with PayOK transactions of the shop streamed from API
+
+    :param client: pyPayokAPI instance
+    :param shop: Shop ID
+    :param orders: Iterable of orders (see Reconciler.run) or CSV file path (see read_orders_csv)
+    :param since: (datetime, Optional) Transactions created at or after this date
+    :param until: (datetime, Optional) Transactions created before this date
+    :param key: (Optional, default="payment_id") Transaction field matched with order key ("payment_id" or "transaction")
+    :param amount_tolerance: (Float, Optional, default=0.005) Max allowed amount difference
+    :param max_orders: (Int, Optional, default=1000000) Max number of orders indexed in memory at once
+    :param prefetch: (Int, Optional, default=2) Number of transaction pages fetched in parallel
+    :param max_items: (Int, Optional, default=1000) Max number of kept results of each kind in report
+    :param callback: (Optional) Function(Discrepancy) called for every result except MATCHED
+    :return: ReconciliationReport
+    """
+    if isinstance(orders, str):
+        orders = read_orders_csv(orders, key_column=key)
+    reconciler = Reconciler(key=key, amount_tolerance=amount_tolerance, max_orders=max_orders,
+                            max_items=max_items, callback=callback)
+    return reconciler.run(orders, client.iter_transactions(shop, since=since, until=until, prefetch=prefetch))
@@ -0,0 +1,139 @@
+import random
+from threading import Lock
+from time import monotonic
+
+# Codes of request failures (see pyPayokAPIException): decode failed, transport error, empty response
+TRANSPORT_ERROR_CODES = (-2, -3, -4)
+
+# Read-only methods that are safe to repeat
+IDEMPOTENT_METHODS = ("balance", "transaction", "payout")
+
+
+class RetryPolicy:
+    """
+    Retry policy for API requests: exponential backoff with jitter, only for idempotent read methods.
+    "payout_create" is never retried, since a failed request may still have created the payout.
+    """
+
+    def __init__(self, max_attempts = 3, backoff = 0.5, max_backoff = 10.0, jitter = True,
+                 methods = IDEMPOTENT_METHODS, retry_codes = TRANSPORT_ERROR_CODES,
+                 rate_limit_codes = (429,), rate_limit_backoff = 5.0):
+        """
+        :param max_attempts: (Int, Optional, default=3) Max number of attempts (including the first one)
+        :param backoff: (Float, Optional, default=0.5) Delay before the first retry (seconds), doubled for each next one
+        :param max_backoff: (Float, Optional, default=10.0) Max delay between attempts (seconds)
+        :param jitter: (Bool, Optional, default=True) Randomize delays ("full jitter")
+        :param methods: (Optional) API methods that can be retried
+        :param retry_codes: (Optional) pyPayokAPIException codes to retry
+        :param rate_limit_codes: (Optional) API error codes meaning "too many requests", retried with rate_limit_backoff
+        :param rate_limit_backoff: (Float, Optional, default=5.0) Min delay after rate limit error (seconds)
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.methods = frozenset(methods) - {"payout_create"}
+        self.retry_codes = frozenset(retry_codes)
+        self.rate_limit_codes = frozenset(rate_limit_codes)
+        self.rate_limit_backoff = rate_limit_backoff
+
+    def should_retry(self, method, error, attempt):
+        """
+        Check if request should be repeated
+
+        :param method: API method name
+        :param error: pyPayokAPIException raised by the attempt
+        :param attempt: Number of attempts made
+        """
+        if attempt >= self.max_attempts or method not in self.methods:
+            return False
+        return error.code in self.retry_codes or error.code in self.rate_limit_codes
+
+    def delay(self, error, attempt):
+        """
+        Returns delay (seconds) before next attempt
+
+        :param error: pyPayokAPIException raised by the attempt
+        :param attempt: Number of attempts made
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if error.code in self.rate_limit_codes:
+            delay = max(delay, self.rate_limit_backoff)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Per-client circuit breaker. After failure_threshold consecutive request failures requests fail fast
+    for recovery_timeout seconds, then one probe request is allowed through.
+    """
+
+    def __init__(self, failure_threshold = 5, recovery_timeout = 30.0, failure_codes = TRANSPORT_ERROR_CODES):
+        """
+        :param failure_threshold: (Int, Optional, default=5) Number of consecutive failures that opens the circuit
+        :param recovery_timeout: (Float, Optional, default=30.0) Time before probe request (seconds)
+        :param failure_codes: (Optional) pyPayokAPIException codes counted as failures
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failure_codes = frozenset(failure_codes)
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = Lock()
+
+    @property
+    def state(self):
+        """
+        "closed", "open" or "half-open"
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probing or monotonic() - self.opened_at >= self.recovery_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """
+        Returns True if request can be made now
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and monotonic() - self.opened_at >= self.recovery_timeout:
+                # Let one probe request through
+                self.probing = True
+                return True
+            return False
+
+    def record(self, error = None):
+        """
+        Record request result
+
+        :param error: (Optional) Exception raised by request (None - success). pyPayokAPIException with code not in
+            failure_codes means API is up, any other exception (e.g. unexpected response) is a failure
+        """
+        from .api import pyPayokAPIException
+
+        failed = error is not None and (not isinstance(error, pyPayokAPIException) or error.code in self.failure_codes)
+        with self.lock:
+            if failed:
+                self.failures += 1
+                if self.probing or self.failures >= self.failure_threshold:
+                    self.opened_at = monotonic()
+                self.probing = False
+            else:
+                # API answered (even with API error) - it is up
+                self.failures = 0
+                self.opened_at = None
+                self.probing = False
+
+    def cancel(self):
+        """
+        Forget request that ended without result (e.g. cancelled), so the next probe can be made
+        """
+        with self.lock:
+            self.probing = False
@@ -0,0 +1,261 @@
+import json
+import random
+import socket
+import sys
+import threading
+import urllib.parse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+from .pagination import PAGE_SIZE, TokenBucket
+from .payok_types import DATETIME_FORMAT, PayoutMethod
+
+_TRANSACTION_METHODS = ("card", "qiwi", "yoomoney", "bitcoin", "tether")
+_PAYOUT_METHODS = ("card", "qiwi", "yoomoney", "tether")
+
+
+class PayokSimulator:
+    """
+    Local PayOK API simulator for tests and benchmarks.
+    Implements "balance", "transaction", "payout" and "payout_create" with generated history, offset pagination,
+    "No transactions" (10) and "No payouts" (7) errors, configurable latency and rate limit (HTTP 429).
+    Pass simulator.api_url as "api_url" to the client.
+    """
+
+    def __init__(self, transactions = 1000, payouts = 100, shop = 1, balance = 100000.0,
+                 latency = 0.0, rate_limit = None, rate_burst = 1,
+                 api_id = None, api_key = None, seed = 0, host = "127.0.0.1", port = 0):
+        """
+        :param transactions: (Int, Optional, default=1000) Number of generated transactions
+        :param payouts: (Int, Optional, default=100) Number of generated payouts
+        :param shop: (Optional, default=1) Shop ID of generated transactions
+        :param balance: (Float, Optional, default=100000.0) Account balance
+        :param latency: (Float, Optional, default=0.0) Delay of each response (seconds)
+        :param rate_limit: (Float, Optional) Allowed requests per second (None - no limit)
+        :param rate_burst: (Int, Optional, default=1) Max number of requests allowed at once
+        :param api_id: (Optional) Accepted API ID (None - any)
+        :param api_key: (Optional) Accepted API key (None - any)
+        :param seed: (Optional, default=0) Random seed of generated data
+        :param host: (Optional, default="127.0.0.1") Listen address
+        :param port: (Int, Optional, default=0) Listen port (0 - any free port)
+        """
+        self.shop = str(shop)
+        self.balance = balance
+        self.latency = latency
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.api_id = api_id
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+        self.thread = None
+
+        rnd = random.Random(seed)
+        now = datetime(2024, 6, 1, 12, 0, 0)
+        # Newest first, as returned by API
+        self.transactions = []
+        for i in range(transactions, 0, -1):
+            amount = rnd.randint(100, 500000) / 100
+            date = now - timedelta(minutes=(transactions - i) * 7)
+            method = _TRANSACTION_METHODS[rnd.randrange(len(_TRANSACTION_METHODS))]
+            self.transactions.append({
+                "transaction": str(1000000 + i),
+                "email": "user{}@example.com".format(i),
+                "amount": "{:.2f}".format(amount),
+                "currency": "RUB",
+                "currency_amount": "{:.2f}".format(amount),
+                "comission_percent": "3.5",
+                "comission_fixed": "0",
+                "amount_profit": "{:.2f}".format(amount * 0.965),
+                "method": method,
+                "payment_id": "order-{}".format(i),
+                "description": "Order number {}".format(i),
+                "date": date.strftime(DATETIME_FORMAT),
+                "pay_date": (date + timedelta(minutes=2)).strftime(DATETIME_FORMAT),
+                "transaction_status": str(rnd.choice((0, 1, 1, 1, 2))),
+                "custom_fields": "",
+                "webhook_status": "1",
+                "webhook_amount": "1",
+            })
+        self.payouts = []
+        for i in range(payouts, 0, -1):
+            self.payouts.append(self.__payout(
+                i, rnd.randint(1000, 100000) / 100, _PAYOUT_METHODS[rnd.randrange(len(_PAYOUT_METHODS))],
+                now - timedelta(hours=(payouts - i) * 3), rnd.choice((1, 1, 1, 2))))
+        self.payout_index = {int(payout["payout_id"]): payout for payout in self.payouts}
+
+    def __payout(self, payout_id, amount, method, date, status):
+        return {
+            "payout_id": str(payout_id),
+            "method": method,
+            "amount": "{:.2f}".format(amount),
+            "comission_percent": "2",
+            "comission_fixed": "0",
+            "amount_profit": "{:.2f}".format(amount * 0.98),
+            "date_create": date.strftime(DATETIME_FORMAT),
+            "date_pay": (date + timedelta(minutes=30)).strftime(DATETIME_FORMAT),
+            "status": str(status),
+        }
+
+    @property
+    def api_url(self):
+        return "http://{}:{}/api/".format(self.host, self.port)
+
+    def start(self):
+        """
+        Start HTTP server in background thread
+        """
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with simulator.lock:
+                    simulator.connections += 1
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                form = dict(urllib.parse.parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+                status, resp = simulator.handle(self.path.rstrip("/").rsplit("/", 1)[-1], form)
+                data = json.dumps(resp).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # Accept bursts of concurrent connections (default backlog is 5)
+            request_queue_size = 128
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # Client gave up waiting (timeout, deadline)
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self.server = Server((self.host, self.port), Handler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop HTTP server
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def set_payout_status(self, payout_id, status):
+        """
+        Change status of payout (e.g. to complete payouts created by payout_create)
+
+        :param payout_id: Payout ID
+        :param status: PaymentStatus or status code
+        """
+        with self.lock:
+            self.payout_index[int(payout_id)]["status"] = str(getattr(status, "value", status))
+
+    @staticmethod
+    def __error(code, text, http_status = 200):
+        return http_status, {"status": "error", "error_code": str(code), "text": text}
+
+    @staticmethod
+    def __page(items, offset):
+        resp = {"status": "success"}
+        for num, item in enumerate(items[offset:offset + PAGE_SIZE], 1):
+            resp[str(num)] = item
+        return resp
+
+    def handle(self, method, form):
+        """
+        Process API request without HTTP layer.
+
+        :param method: API method name
+        :param form: Dict of request form fields
+        :return: tuple (HTTP status code, response dict)
+        """
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+        if self.rate_limiter and self.rate_limiter.try_acquire():
+            return self.__error(429, "Too many requests", 429)
+        if (self.api_id is not None and form.get("API_ID") != str(self.api_id)) or \
+                (self.api_key is not None and form.get("API_KEY") != self.api_key):
+            return self.__error(1, "Invalid API key")
+        try:
+            offset = int(form.get("offset") or 0)
+        except ValueError:
+            return self.__error(3, "Invalid offset")
+
+        if method == "balance":
+            with self.lock:
+                return 200, {"balance": "{:.2f}".format(self.balance), "ref_balance": "0"}
+
+        if method == "transaction":
+            if form.get("shop") != self.shop:
+                return self.__error(4, "Shop not found")
+            items = self.transactions
+            if form.get("payment"):
+                items = [item for item in items if item["payment_id"] == form["payment"]]
+            resp = self.__page(items, offset)
+            if len(resp) == 1:
+                return self.__error(10, "No transactions")
+            return 200, resp
+
+        if method == "payout":
+            with self.lock:
+                if form.get("payout_id"):
+                    payout = self.payout_index.get(int(form["payout_id"]) if form["payout_id"].isdigit() else None)
+                    items = [dict(payout)] if payout else []
+                else:
+                    items = [dict(payout) for payout in self.payouts[offset:offset + PAGE_SIZE]]
+                    offset = 0
+            resp = self.__page(items, offset)
+            if len(resp) == 1:
+                return self.__error(7, "No payouts")
+            return 200, resp
+
+        if method == "payout_create":
+            try:
+                amount = float(form.get("amount", ""))
+            except ValueError:
+                amount = 0
+            if amount <= 0:
+                return self.__error(5, "Invalid amount")
+            if form.get("method") not in PayoutMethod.__members__ or not form.get("reciever"):
+                return self.__error(6, "Invalid payout method or reciever")
+            with self.lock:
+                total = amount if form.get("comission_type") == "payment" else amount * 1.02
+                if total > self.balance:
+                    return self.__error(8, "Not enough balance")
+                self.balance -= total
+                payout_id = (int(self.payouts[0]["payout_id"]) if self.payouts else 0) + 1
+                payout = self.__payout(payout_id, amount, form["method"], datetime.now().replace(microsecond=0), 0)
+                self.payouts.insert(0, payout)
+                self.payout_index[payout_id] = payout
+                resp = dict(payout)
+                resp["remain_balance"] = "{:.2f}".format(self.balance)
+            return 200, resp
+
+        return self.__error(2, "Unknown method", 404)
@@ -1,9 +1,59 @@
+import asyncio
+import csv
 import inspect
-from time import sleep
+import io
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, perf_counter
 try:
     from pyPayokAPI import pyPayokAPI, pyPayokAPIException, PayoutMethod, PaymentCommissionType, PaymentStatus, PaymentMethod
+    from pyPayokAPI.pagination import Pager
+    from pyPayokAPI.payok_types import Transaction, Transactions, Payouts
+    from pyPayokAPI import frame
+    from pyPayokAPI.frame import TransactionFrame, PayoutFrame
+    from pyPayokAPI.ttl_cache import TTLCache
+    from pyPayokAPI.webhook import parse_notification, notification_sign, WebhookReceiver
+    from pyPayokAPI.retry import RetryPolicy, CircuitBreaker
+    from pyPayokAPI.metrics import Metrics
+    from pyPayokAPI.simulator import PayokSimulator
+    from pyPayokAPI.export import export_transactions
+    from pyPayokAPI.reconcile import Reconciler, reconcile
+    from pyPayokAPI.transport import FakeTransport
+    from pyPayokAPI.aggregate import StreamingAggregator
+    from pyPayokAPI.deadline import Deadline, HedgePolicy
+    from pyPayokAPI.bulk_payout import BulkPayoutExecutor
+    from pyPayokAPI.payout_watcher import PayoutWatcher
+    from pyPayokAPI.client_pool import PayokClientPool
+    from pyPayokAPI.cache import TransactionCache
+    from pyPayokAPI.async_api import AsyncPayokAPI, httpx
+    from pyPayokAPI import json_decoder
 except:
     from api import pyPayokAPI, pyPayokAPIException, PayoutMethod, PaymentCommissionType, PaymentStatus, PaymentMethod
+    from pagination import Pager
+    from payok_types import Transaction, Transactions, Payouts
+    import frame
+    from frame import TransactionFrame, PayoutFrame
+    from ttl_cache import TTLCache
+    from webhook import parse_notification, notification_sign, WebhookReceiver
+    from retry import RetryPolicy, CircuitBreaker
+    from metrics import Metrics
+    from simulator import PayokSimulator
+    from export import export_transactions
+    from reconcile import Reconciler, reconcile
+    from transport import FakeTransport
+    from aggregate import StreamingAggregator
+    from deadline import Deadline, HedgePolicy
+    from bulk_payout import BulkPayoutExecutor
+    from payout_watcher import PayoutWatcher
+    from client_pool import PayokClientPool
+    from cache import TransactionCache
+    from async_api import AsyncPayokAPI, httpx
+    import json_decoder
 
 try:
     from private_keys import *
@@ -44,4 +94,689 @@ def test_api_functions():
     run_and_print(lambda: client.payout_create(1, PayoutMethod.qiwi, "79111111111", PaymentCommissionType.payment))
     run_and_print(lambda: client.payment_link_create(10, "xxx 2", test_shop_id, "Test payment link", 'RUB'))
 
+def test_pager():
+    requested = []
+    def fetch_page(offset):
+        requested.append(offset)
+        return list(range(offset, min(offset + 100, 250)))
+    pages = list(Pager(fetch_page, max_pages=10, prefetch=2))
+    assert [len(page) for page in pages] == [100, 100, 50]
+    assert requested[:3] == [0, 100, 200]
+
+def test_transactions_de_json():
+    transactions = Transactions.de_json({"status": "success", "1": {
+        "transaction": "123", "email": "a@b.c", "amount": "10.5", "currency": "RUB", "currency_amount": "10.5",
+        "comission_percent": "3", "comission_fixed": "0", "amount_profit": "10.19", "method": "QIWI",
+        "payment_id": "order-1", "description": "Test", "date": "2024-03-01 12:05:09", "pay_date": "2024-03-01 12:06:00",
+        "transaction_status": "1", "custom_fields": "", "webhook_status": "1", "webhook_amount": "1"}})
+    transaction = transactions.items[0]
+    assert transaction.num == 1 and transaction.transaction == 123 and transaction.amount == 10.5
+    assert transaction.method == PayoutMethod.qiwi and transaction.transaction_status == PaymentStatus.success
+    assert transaction.date.minute == 5 and transaction.pay_date.second == 0
+
+def test_ttl_cache():
+    cache = TTLCache(maxsize=2)
+    loads = []
+    def loader():
+        loads.append(1)
+        return len(loads)
+    assert cache.get("a", loader, 60) == 1
+    assert cache.get("a", loader, 60) == 1
+    assert cache.get("b", loader, 0) == 2
+    assert cache.get("b", loader, 0) == 3
+    cache.invalidate(lambda key: key == "a")
+    assert cache.get("a", loader, 60) == 4
+    assert cache.stats()["hits"] == 1
+
+def test_notification():
+    form = {"payment_id": "order-1", "shop": "1", "amount": "10", "desc": "Test", "currency": "RUB",
+            "date": "2024-03-01 10:00:00", "custom[user]": "42"}
+    form["sign"] = notification_sign("secret", form)
+    notification = parse_notification(form, "secret")
+    assert notification.amount == 10.0 and notification.custom == {"user": "42"}
+    form["amount"] = "11"
+    try:
+        parse_notification(form, "secret")
+        assert False
+    except pyPayokAPIException as pe:
+        assert pe.code == -9
+
+    def handler(notification):
+        raise ValueError("Order not found")
+
+    errors = []
+    receiver = WebhookReceiver("secret", handler, queue_size=10,
+                               on_error=lambda notification, e: errors.append((notification.payment_id, str(e))))
+    form["amount"] = "10"
+    assert receiver.process(form) == (200, "OK")
+    receiver.close()
+    assert errors == [("order-1", "Order not found")]
+
+    # Request body size is limited in WSGI and ASGI applications
+    receiver = WebhookReceiver("secret", lambda notification: None, max_body=1024)
+    form["payment_id"] = "order-2"
+    form["sign"] = notification_sign("secret", form)
+    body = urllib.parse.urlencode(form).encode("utf-8")
+    statuses = []
+    for length in (len(body), 10 ** 9):
+        environ = {"REQUEST_METHOD": "POST", "CONTENT_LENGTH": str(length), "wsgi.input": io.BytesIO(body)}
+        receiver(environ, lambda status, headers: statuses.append(status))
+    assert statuses == ["200 OK", "413 Payload Too Large"]
+
+    async def asgi(chunks):
+        messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+        messages[-1]["more_body"] = False
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await receiver.asgi({"type": "http", "method": "POST"}, receive, send)
+        return sent[0]["status"], len(messages)
+
+    form["payment_id"] = "order-3"
+    form["sign"] = notification_sign("secret", form)
+    body = urllib.parse.urlencode(form).encode("utf-8")
+    assert asyncio.run(asgi([body[:10], body[10:]])) == (200, 0)
+    # Rest of too large body is not read
+    assert asyncio.run(asgi([b"a" * 1000, b"a" * 1000, b"a" * 1000])) == (413, 1)
+
+def start_fault_server(failures):
+    """
+    Local API stub: first "failures" requests get broken response, next ones get balance
+    """
+    class FaultHandler(BaseHTTPRequestHandler):
+        requests = 0
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            FaultHandler.requests += 1
+            if FaultHandler.requests <= failures:
+                body = b"<html>502 Bad Gateway</html>"
+                self.send_response(502)
+            else:
+                body = json.dumps({"balance": "1.5", "ref_balance": "0"}).encode("utf-8")
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FaultHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, FaultHandler, "http://127.0.0.1:{}/api/".format(server.server_port)
+
+def test_retry_and_circuit_breaker():
+    server, handler, api_url = start_fault_server(failures=2)
+    client = pyPayokAPI(1, "key", api_url=api_url, retry_policy=RetryPolicy(max_attempts=3, backoff=0))
+    assert client.balance().balance == 1.5
+    assert handler.requests == 3
+    server.shutdown()
+
+    server, handler, api_url = start_fault_server(failures=100)
+    client = pyPayokAPI(1, "key", api_url=api_url, circuit_breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=60))
+    for expected_code in [-2, -2, -10]:
+        try:
+            client.balance()
+            assert False
+        except pyPayokAPIException as pe:
+            assert pe.code == expected_code
+    assert handler.requests == 2
+    server.shutdown()
+
+    # Unexpected response (not a JSON object) fails the probe, next probe is still made
+    sim = PayokSimulator()
+    responses = [(200, b"[1]"), (200, b"[1]")]
+    transport = FakeTransport(lambda method, form: responses.pop(0) if responses else sim.handle(method, form))
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    client = pyPayokAPI(1, "key", transport=transport, circuit_breaker=breaker)
+    for _ in range(2):
+        try:
+            client.balance()
+            assert False
+        except pyPayokAPIException as pe:
+            assert pe.code == -2 and not pe.api_error
+    assert client.balance().balance == 100000.0 and breaker.state == "closed"
+
+def test_metrics():
+    server, handler, api_url = start_fault_server(failures=1)
+    metrics = Metrics()
+    client = pyPayokAPI(1, "key", api_url=api_url, instrumentation=metrics,
+                        retry_policy=RetryPolicy(max_attempts=2, backoff=0))
+    client.balance()
+    server.shutdown()
+    snapshot = metrics.snapshot()
+    assert snapshot["requests"] == {("balance", "-2"): 1, ("balance", "ok"): 1}
+    assert snapshot["retries"] == {("balance", "-2"): 1}
+    assert snapshot["durations"][("balance", "deserialize")]["count"] == 1
+    text = metrics.prometheus()
+    assert 'payok_requests_total{method="balance",code="ok"} 1' in text
+    assert 'payok_request_duration_seconds_count{method="balance",phase="wait"} 2' in text
+
+def test_simulator():
+    with PayokSimulator(transactions=250, payouts=0) as sim:
+        client = pyPayokAPI(1, "key", api_url=sim.api_url, rate_limit=None)
+        assert len(client.transactions(sim.shop, max_results=1000).items) == 250
+        assert client.transaction(sim.shop, payment="unknown").items == []
+        since, until = datetime(2024, 5, 31, 10), datetime(2024, 6, 1)
+        window = client.transactions(sim.shop, max_results=1000, since=since, until=until)
+        expected = [item for item in client.transactions(sim.shop, max_results=1000).items if since <= item.date < until]
+        assert [item.transaction for item in window.items] == [item.transaction for item in expected]
+        assert client.payout().items == []
+        payout = client.payout_create(100, PayoutMethod.card, "4111111111111111", PaymentCommissionType.payment)
+        assert client.balance().balance == 100000.0 - 100
+        sim.set_payout_status(payout.payout_id, PaymentStatus.success)
+        assert client.payout(payout_id=payout.payout_id).items[0].status == PaymentStatus.success
+
+def test_export_resume():
+    with PayokSimulator(transactions=450) as sim, tempfile.TemporaryDirectory() as directory:
+        client = pyPayokAPI(1, "key", api_url=sim.api_url, rate_limit=None)
+        path = os.path.join(directory, "transactions.csv")
+        transaction = client.transaction
+
+        def interrupted(shop, payment = None, offset = None):
+            if offset == 300:
+                raise pyPayokAPIException(-3, "Interrupted")
+            return transaction(shop, payment, offset)
+
+        client.transaction = interrupted
+        try:
+            export_transactions(client, sim.shop, path, chunk_size=100, prefetch=1)
+            assert False
+        except pyPayokAPIException:
+            pass
+        client.transaction = transaction
+        assert export_transactions(client, sim.shop, path, chunk_size=100) == 450
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert [row["transaction"] for row in rows] == [str(1000000 + i) for i in range(450, 0, -1)]
+        assert rows[0]["date"] == "2024-06-01 12:00:00"
+
+def test_reconcile():
+    with PayokSimulator(transactions=250) as sim:
+        client = pyPayokAPI(1, "key", api_url=sim.api_url, rate_limit=None)
+        transactions = list(client.iter_transactions(sim.shop))
+    orders = [(t.payment_id, t.amount, t.transaction_status) for t in transactions[1:]]
+    orders[0] = (orders[0][0], orders[0][1] + 1, orders[0][2])
+    orders[1] = (orders[1][0], orders[1][1], PaymentStatus.unknown)
+    orders.append(("order-x", 10))
+    for max_orders in (1000, 50):
+        report = Reconciler(max_orders=max_orders, partitions=4).run(iter(orders), iter(transactions))
+        assert (report.orders, report.transactions) == (250, 250)
+        assert report.counts == {"matched": 247, "missing": 1, "unknown": 1, "duplicate": 0,
+                                 "amount_mismatch": 1, "status_diverged": 1}
+        assert report.items["unknown"][0].transaction is not None
+        assert report.items["unknown"][0].key == transactions[0].payment_id
+        assert report.items["missing"][0].key == "order-x"
+        assert not report.ok
+
+
+def test_fake_transport():
+    sim = PayokSimulator(transactions=150)
+    transport = FakeTransport(sim.handle)
+    client = pyPayokAPI(1, "key", transport=transport, rate_limit=None, instrumentation=Metrics())
+    assert client.balance().balance == 100000.0
+    assert len(client.transactions(sim.shop, max_results=1000).items) == 150
+    assert [method for method, _ in transport.requests] == ["balance", "transaction", "transaction"]
+    assert transport.requests[2][1]["offset"] == "100"
+
+
+def test_streaming_aggregator():
+    sim = PayokSimulator(transactions=1000, payouts=0)
+    client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=None)
+    transactions = list(client.iter_transactions(sim.shop))
+    first = StreamingAggregator(bucket_seconds=3600, buckets=24)
+    second = StreamingAggregator(bucket_seconds=3600, buckets=24)
+    first.add_many(transactions[:500], shop=sim.shop)
+    second.add_many(transactions[500:], shop=sim.shop)
+    merged = StreamingAggregator.from_snapshot(json.loads(json.dumps(first.snapshot())))
+    merged.merge(second)
+    totals = merged.totals(shop=sim.shop)
+    assert totals["count"] == 1000
+    assert abs(totals["amount"] - sum(t.amount for t in transactions)) < 0.01
+    # 12:00 is the start of the last hour bucket
+    assert merged.totals(window=3600)["count"] == 1
+    assert merged.totals(window=7200)["count"] == 1 + 60 // 7
+    amounts = sorted(t.amount for t in transactions)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(merged.quantile(q) / amounts[int(q * 999)] - 1) < 0.03
+    success = sum(1 for t in transactions if t.transaction_status == PaymentStatus.success)
+    fail = sum(1 for t in transactions if t.transaction_status == PaymentStatus.fail)
+    assert merged.success_rate() == success / (success + fail)
+
+
+def test_deadline_and_hedging():
+    sim = PayokSimulator(transactions=1000)
+    calls = []
+
+    def slow_odd_calls(method, form):
+        calls.append(method)
+        sleep(0.3 if len(calls) % 2 else 0.01)
+        return sim.handle(method, form)
+
+    policy = HedgePolicy(initial_delay=0.05)
+    client = pyPayokAPI(1, "key", transport=FakeTransport(slow_odd_calls), rate_limit=None, hedge_policy=policy)
+    assert client.balance(deadline=Deadline(0.2)).balance == 100000.0
+    assert policy.stats()["hedged"] == 1 and policy.stats()["wins"] == 1
+    # payout_create is never hedged
+    calls.clear()
+    client.payout_create(10, PayoutMethod.card, "4111111111111111", PaymentCommissionType.balance)
+    assert calls == ["payout_create"]
+    client.close()
+    try:
+        client.balance()
+        assert False
+    except pyPayokAPIException as pe:
+        assert pe.code == -8
+
+    def slow(method, form):
+        sleep(1)
+        return sim.handle(method, form)
+
+    # Primary request waits for the only worker, busy with abandoned request
+    client = pyPayokAPI(1, "key", transport=FakeTransport(slow), rate_limit=None,
+                        hedge_policy=HedgePolicy(initial_delay=0.05, max_workers=1))
+    for _ in range(2):
+        start = perf_counter()
+        try:
+            client.balance(deadline=0.2)
+            assert False
+        except pyPayokAPIException as pe:
+            assert pe.code == -11 and perf_counter() - start < 0.5
+    client.close()
+
+    client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=1)
+    try:
+        # Waiting for the rate limit of the second page would exceed the deadline
+        client.transactions(sim.shop, max_results=1000, deadline=0.5)
+        assert False
+    except pyPayokAPIException as pe:
+        assert pe.code == -11
+
+
+def test_bulk_payout():
+    sim = PayokSimulator(transactions=0, payouts=10)
+    orders = [{"key": "a", "amount": 10, "method": PayoutMethod.card, "reciever": "4111111111111111",
+               "comission_type": PaymentCommissionType.payment},
+              {"key": "b", "amount": 10, "method": PayoutMethod.card, "reciever": "4222222222222222",
+               "comission_type": PaymentCommissionType.payment}]
+
+    class Crash(BaseException):
+        pass
+
+    def submit_all(handler, orders, max_workers = 1):
+        client = pyPayokAPI(1, "key", transport=FakeTransport(handler), rate_limit=None)
+        with BulkPayoutExecutor(client, journal, max_workers=max_workers, rate_limit=None, reconcile_delay=0) as executor:
+            return list(executor.submit(orders))
+
+    def submit(handler, orders, max_workers = 1):
+        return {result.key: result for result in submit_all(handler, orders, max_workers)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Process crashed after payout was created, resubmit finds it
+        journal = os.path.join(directory, "crash.sqlite3")
+
+        def crash_after_create(method, form):
+            resp = sim.handle(method, form)
+            if method == "payout_create":
+                raise Crash()
+            return resp
+
+        try:
+            submit(crash_after_create, orders[:1])
+            assert False
+        except Crash:
+            pass
+        results = submit(sim.handle, orders[:1])
+        assert results["a"].state == "created" and results["a"].duplicate
+        assert results["a"].payout_id == 11 and len(sim.payouts) == 11
+
+        # Created payout with broken response (HTTP 200) is found, not failed or paid again
+        journal = os.path.join(directory, "ambiguous.sqlite3")
+
+        def broken_response(method, form):
+            status, resp = sim.handle(method, form)
+            return (status, b"<html>") if method == "payout_create" else (status, resp)
+
+        results = submit(broken_response, orders[:1])
+        assert results["a"].state == "created" and results["a"].payout_id == 12 and len(sim.payouts) == 12
+
+        # Concurrent items with the same amount and method fail ambiguously, only one was created
+        journal = os.path.join(directory, "concurrent.sqlite3")
+        barrier = threading.Barrier(2)
+
+        def one_created(method, form):
+            if method != "payout_create":
+                return sim.handle(method, form)
+            barrier.wait()
+            if form["reciever"] == "4111111111111111":
+                sim.handle(method, form)
+            raise ConnectionError("Connection reset")
+
+        results = submit(one_created, orders, max_workers=2)
+        assert {key: result.state for key, result in results.items()} == {"a": "unknown", "b": "unknown"}
+        assert len(sim.payouts) == 13
+        # Resubmit does not pay again until items are checked
+        results = submit(sim.handle, orders, max_workers=2)
+        assert [result.state for result in results.values()] == ["unknown", "unknown"] and len(sim.payouts) == 13
+        client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=None)
+        with BulkPayoutExecutor(client, journal, rate_limit=None, reconcile_delay=0) as executor:
+            executor.resolve("a", 13)
+            executor.resolve("b")
+            assert executor.entry("a")["state"] == "created" and executor.entry("b")["state"] == "failed"
+
+        # Orders with the same key in one batch are paid once
+        journal = os.path.join(directory, "same_key.sqlite3")
+        count = len(sim.payouts)
+        results = list(submit_all(sim.handle, [dict(orders[0], key="same") for _ in range(3)], 4))
+        assert len(sim.payouts) == count + 1 and {result.payout_id for result in results} == {count + 1}
+        assert sorted(result.duplicate for result in results) == [False, True, True]
+
+        # Payout of interrupted item is beyond checked pages, it is not paid again
+        journal = os.path.join(directory, "deep.sqlite3")
+        try:
+            submit(crash_after_create, [dict(orders[0], key="deep", amount=3)])
+            assert False
+        except Crash:
+            pass
+        for _ in range(350):
+            sim.handle("payout_create", {"amount": "1", "method": "card", "reciever": "1", "comission_type": "payment"})
+        count = len(sim.payouts)
+        results = submit(sim.handle, [dict(orders[0], key="deep", amount=3)])
+        assert results["deep"].state == "unknown" and len(sim.payouts) == count
+
+
+def test_payout_watcher():
+    sim = PayokSimulator(transactions=0, payouts=10)
+    client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=None)
+    changes = []
+    watcher = PayoutWatcher(client, callback=changes.append, min_interval=0, max_queue=1)
+    payouts = [client.payout_create(10, PayoutMethod.card, "4111111111111111", PaymentCommissionType.payment)
+               for _ in range(4)]
+    watcher.watch(payout.payout_id for payout in payouts)
+    sim.set_payout_status(payouts[0].payout_id, PaymentStatus.success)
+    # Nothing is queued without consumer
+    assert [event.new_status for event in watcher.poll()] == [PaymentStatus.success]
+    assert len(watcher) == 3 and watcher.consumers == [] and watcher.dropped == 0
+
+    async def consume():
+        received = []
+
+        async def reader():
+            async for event in watcher.aevents():
+                received.append(event)
+
+        task = asyncio.ensure_future(reader())
+        await asyncio.sleep(0.01)
+        sim.set_payout_status(payouts[1].payout_id, PaymentStatus.fail)
+        sim.set_payout_status(payouts[2].payout_id, PaymentStatus.fail)
+        # Both events are delivered before the consumer runs, the older one is dropped
+        watcher.poll()
+        while not received:
+            await asyncio.sleep(0.01)
+        # Cancelled consumer does not leave a thread waiting for events
+        task.cancel()
+        return received
+
+    thread = threading.Thread(target=lambda: changes.extend(asyncio.run(consume())))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(changes) == 4 and changes[3].payout.payout_id == payouts[1].payout_id
+    assert watcher.consumers == [] and watcher.dropped == 1
+
+    def broken(method, form):
+        raise ConnectionError("Connection refused")
+
+    # Old payouts are looked up in turn, status of response with only payout_status_code is compared as PaymentStatus
+    sim = PayokSimulator(transactions=0, payouts=200)
+    for payout_id in range(1, 51):
+        sim.set_payout_status(payout_id, PaymentStatus.waiting)
+    sim.set_payout_status(1, PaymentStatus.success)
+
+    def status_code_only(method, form):
+        status, resp = sim.handle(method, form)
+        for value in resp.values():
+            if isinstance(value, dict):
+                value["payout_status_code"] = value.pop("status")
+        return status, resp
+
+    client = pyPayokAPI(1, "key", transport=FakeTransport(status_code_only), rate_limit=None)
+    watcher = PayoutWatcher(client, min_interval=0, max_pages=1, max_lookups=10)
+    watcher.watch(range(1, 51))
+    events = []
+    for _ in range(5):
+        events.extend(watcher.poll())
+    assert [(event.payout.payout_id, event.new_status) for event in events] == [(1, PaymentStatus.success)]
+    assert len(watcher) == 49
+
+    errors = []
+    watcher = PayoutWatcher(pyPayokAPI(1, "key", transport=FakeTransport(broken)), on_error=errors.append)
+    watcher.watch([1])
+    watcher.start()
+    sleep(0.1)
+    watcher.stop()
+    assert errors[0].code == -3
+
+
+def test_record_frame():
+    payout = {"method": "card", "amount": "10", "comission_percent": "2", "comission_fixed": "0",
+              "amount_profit": "9.8", "date_create": "2024-03-01 12:00:00", "date_pay": "2024-03-01 12:30:00"}
+    payouts = Payouts.de_json({"status": "success", "1": dict(payout, payout_id="2", payout_status_code="1"),
+                               "2": dict(payout, payout_id="1", amount="5", status="0")})
+    # Records built without API response may have missing values
+    transactions = [Transaction(), Transaction()]
+    for transaction, values in zip(transactions, (
+            {"transaction": 2, "amount": 7.5, "method": PayoutMethod.qiwi, "date": datetime(2024, 3, 1, 12),
+             "transaction_status": PaymentStatus.success, "webhook_status": 1},
+            {"transaction": 1, "amount": 2.5, "transaction_status": 2})):
+        for name, value in values.items():
+            setattr(transaction, name, value)
+    module_numpy = frame.numpy
+    for numpy in {module_numpy, None}:
+        frame.numpy = numpy
+        try:
+            payout_frame = PayoutFrame.from_records(payouts)
+            assert payout_frame.values("status") == [PaymentStatus.success, PaymentStatus.waiting]
+            assert payout_frame.group("status", "amount") == {PaymentStatus.success: 10.0, PaymentStatus.waiting: 5.0}
+            assert len(payout_frame.filter(status=PaymentStatus.success, until=datetime(2025, 1, 1))) == 1
+            assert payout_frame.to_records()[1].status == PaymentStatus.waiting
+
+            transaction_frame = TransactionFrame.from_records(transactions)
+            assert transaction_frame.values("webhook_status") == [1, None]
+            assert transaction_frame.values("date")[1] is None
+            assert transaction_frame.values("method") == [PayoutMethod.qiwi, None]
+            assert transaction_frame.group("method", func="count") == {PayoutMethod.qiwi: 1, None: 1}
+            # Transaction without date is not matched by date filter
+            assert len(transaction_frame.filter(until=datetime(2025, 1, 1))) == 1
+            assert len(transaction_frame.filter(status=[PaymentStatus.success, PaymentStatus.fail])) == 2
+
+            # Missing amounts are skipped by aggregates
+            transaction_frame.append(Transaction())
+            card = Transaction()
+            card.method = PayoutMethod.card
+            transaction_frame.append(card)
+            assert transaction_frame.sum("amount") == 10.0
+            assert transaction_frame.mean("amount") == 5.0
+            assert transaction_frame.mean("webhook_status") == 1.0
+            assert transaction_frame.group("method", "amount") == {PayoutMethod.qiwi: 7.5, None: 2.5, PayoutMethod.card: 0.0}
+            assert transaction_frame.group("method", "amount", func="mean") == \
+                {PayoutMethod.qiwi: 7.5, None: 2.5, PayoutMethod.card: None}
+            assert transaction_frame.group("method", func="count") == {PayoutMethod.qiwi: 1, None: 2, PayoutMethod.card: 1}
+            assert TransactionFrame().mean("amount") is None
+        finally:
+            frame.numpy = module_numpy
+
+
+def test_response_cache():
+    sim = PayokSimulator(transactions=0)
+    delay = [0]
+
+    def handler(method, form):
+        sleep(delay[0])
+        if method == "payout_create":
+            sim.handle(method, form)
+            raise ConnectionError("Connection reset")
+        return sim.handle(method, form)
+
+    client = pyPayokAPI(1, "key", transport=FakeTransport(handler), rate_limit=None, cache_ttl={"balance": 60})
+    assert client.balance().balance == 100000.0
+    # Failed payout may be created, cached balance is dropped anyway
+    try:
+        client.payout_create(100, PayoutMethod.card, "4111111111111111", PaymentCommissionType.payment)
+        assert False
+    except pyPayokAPIException as pe:
+        assert pe.code == -3
+    assert client.balance().balance == 100000.0 - 100
+
+    # Caller waiting for identical call in flight keeps its own deadline
+    client.invalidate_cache()
+    delay[0] = 0.5
+    leader = threading.Thread(target=client.balance)
+    leader.start()
+    sleep(0.05)
+    start = perf_counter()
+    try:
+        client.balance(deadline=0.1)
+        assert False
+    except pyPayokAPIException as pe:
+        assert pe.code == -11 and perf_counter() - start < 0.3
+    leader.join()
+    assert client.cache_stats()["coalesced"] == 1
+
+
+def test_client_pool():
+    sim = PayokSimulator(transactions=250)
+    with PayokClientPool(max_workers=4, rate_limit=1, rate_burst=3, transport=FakeTransport(sim.handle)) as pool:
+        pool.add("a", 1, "key")
+        pool.add("b", 2, "key")
+        # Three pages take three tokens of burst, scheduling does not charge one more
+        start = perf_counter()
+        assert len(pool.call("a", "transactions", sim.shop, max_results=1000).items) == 250
+        assert perf_counter() - start < 0.5
+        assert [balance.balance for balance in pool.balances().values()] == [100000.0, 100000.0]
+        # Function calls get their arguments
+        transactions = pool.call("b", lambda client, shop, payment = None: client.transaction(shop, payment=payment),
+                                 sim.shop, payment="order-1")
+        assert [transaction.payment_id for transaction in transactions.items] == ["order-1"]
+
+
+def test_transaction_cache():
+    sim = PayokSimulator(transactions=250)
+    transport = FakeTransport(sim.handle)
+    client = pyPayokAPI(1, "key", transport=transport, rate_limit=None)
+    with TransactionCache(client, ":memory:", recheck_limit=5, recheck_max_age=None) as cache:
+        assert cache.sync(sim.shop) == (250, 0)
+        waiting = len(cache.transactions(sim.shop, status=PaymentStatus.waiting).items)
+        assert waiting > 10
+        rechecked = []
+        for _ in range(3):
+            del transport.requests[:]
+            assert cache.sync(sim.shop) == (0, 5)
+            rechecked.append({form["payment"] for method, form in transport.requests if "payment" in form})
+        # Each sync re-checks the least recently checked waiting transactions
+        assert len(rechecked[0] | rechecked[1]) == 10 and len(rechecked[0] | rechecked[1] | rechecked[2]) == min(15, waiting)
+        assert cache.transaction(sim.shop, "order-250", refresh=False).transaction == 1000250
+        # Storing records again keeps their re-check time
+        query = "SELECT transaction_id, checked FROM transactions WHERE checked IS NOT NULL ORDER BY transaction_id"
+        checked = cache.db.execute(query).fetchall()
+        assert len(checked) == min(15, waiting)
+        cache.store(sim.shop, cache.transactions(sim.shop, status=PaymentStatus.waiting).items)
+        assert cache.db.execute(query).fetchall() == checked
+        # Waiting transactions older than recheck_max_age are not re-checked
+        cache.recheck_max_age = 86400
+        assert cache.sync(sim.shop) == (0, 0)
+
+
+def test_async_api():
+    if httpx is None:
+        return
+
+    async def calls(api_url, shop):
+        async with AsyncPayokAPI(1, "key", api_url=api_url, rate_limit=None,
+                                 retry_policy=RetryPolicy(backoff=0)) as client:
+            assert (await client.balance()).balance == 100000.0
+            assert len((await client.transactions(shop, max_results=1000)).items) == 250
+            assert (await client.transaction(shop, payment="order-7")).items[0].transaction == 1000007
+            payout = await client.payout_create(100, PayoutMethod.card, "4111111111111111", PaymentCommissionType.payment)
+            assert (await client.payout(payout_id=payout.payout_id)).items[0].amount == 100
+            results = await client.transaction_many([shop, "unknown"], return_exceptions=True)
+            assert len(results[0].items) == 100 and results[1].code == 4
+        try:
+            await client.balance()
+            assert False
+        except pyPayokAPIException as pe:
+            assert pe.code == -8
+
+    with PayokSimulator(transactions=250) as sim:
+        asyncio.run(calls(sim.api_url, sim.shop))
+
+
+def test_json_decoder():
+    sim = PayokSimulator(transactions=150)
+    page = json.dumps(sim.handle("transaction", {"shop": sim.shop})[1]).encode("utf-8")
+    payloads = [page, '{"text": "Ошибка \\u2713", "n": [1, -2.5, 1e3, null, true]}'.encode("utf-8"), b"[]"]
+    expected = [json.loads(payload) for payload in payloads]
+    for backend in json_decoder.available_backends():
+        loads = json_decoder.get_decoder(backend)
+        assert [loads(payload) for payload in payloads] == expected
+        for broken in (b"<html>", b'{"a": 1', b""):
+            try:
+                loads(broken)
+                assert False
+            except ValueError:
+                pass
+        client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=None, json_decoder=backend)
+        transactions = client.transactions(sim.shop, max_results=1000).items
+        assert [t.to_dict() for t in transactions] == [t.to_dict() for t in Transactions.de_json(expected[0]).items] + \
+            [t.to_dict() for t in client.transaction(sim.shop, offset=100).items]
+
+    # Optional backends are not installed
+    installed = json_decoder.orjson, json_decoder.msgspec
+    json_decoder.orjson = json_decoder.msgspec = None
+    try:
+        assert json_decoder.available_backends() == ["json"]
+        assert json_decoder.get_decoder() is json.loads
+        for backend in ("orjson", "msgspec"):
+            try:
+                json_decoder.get_decoder(backend)
+                assert False
+            except ImportError:
+                pass
+        client = pyPayokAPI(1, "key", transport=FakeTransport(sim.handle), rate_limit=None)
+        assert client.balance().balance == 100000.0
+    finally:
+        json_decoder.orjson, json_decoder.msgspec = installed
+
+
+
+def test_payment_links_many():
+    client = pyPayokAPI(1, "key", secret_key="secret", rate_limit=None)
+    orders = [
+        {"amount": 10, "payment": "order 1", "shop": 1, "desc": "Test payment link", "currency": "RUB"},
+        (15.5, "order/2", 2, "Оплата заказа #2 & 50%", "USD", "a@b.c", "https://example.com/ok?x=1", PaymentMethod.cd, "EN", "c1"),
+        {"amount": 20, "payment": "order 3", "shop": 1, "desc": None, "currency": "RUB", "method": "qw"},
+        (5, "order 4", 1, "Test payment link", "RUB"),
+    ] * 3
+    expected = [client.payment_link_create(**order) if isinstance(order, dict) else client.payment_link_create(*order)
+                for order in orders]
+    assert "&desc=%D0%9E%D0%BF%D0%BB%D0%B0%D1%82%D0%B0%20%D0%B7%D0%B0%D0%BA%D0%B0%D0%B7%D0%B0%20%232%20%26%2050%25&" \
+        in expected[1]
+    assert "&desc=&" in expected[2]
+    assert "&method=cd&" in expected[1] and expected[2].endswith("&method=qw")
+    for processes in (None, 2):
+        assert list(client.iter_payment_links(orders, processes=processes, chunk_size=5)) == expected
+        assert client.payment_links_create_many(iter(orders), processes=processes, chunk_size=5) == expected
+    assert client.payment_links_create_many([], processes=2) == []
+    try:
+        pyPayokAPI(1, "key").payment_links_create_many(orders)
+        assert False
+    except pyPayokAPIException as e:
+        assert e.code == -7
+
 test_api_functions()
@@ -0,0 +1,263 @@
+import json
+import threading
+import urllib.parse
+from time import perf_counter
+
+# HTTP libraries are imported when transport is created, so importing the package stays fast
+
+
+class Response:
+    """
+    HTTP response returned by transports
+    """
+    __slots__ = ("status_code", "content", "wait")
+
+    def __init__(self, status_code, content, wait = None):
+        """
+        :param status_code: HTTP status code
+        :param content: (Bytes) Response body
+        :param wait: (Float, Optional) Seconds until response headers were received (for timed requests)
+        """
+        self.status_code = status_code
+        self.content = content
+        self.wait = wait
+
+    def __bool__(self):
+        # As requests.Response: False for error status (its code is not used as error code)
+        return self.status_code < 400
+
+
+def _create_session(pool_connections = 10, pool_maxsize = 10, pool_block = False, keep_alive = True):
+    """
+    Create pooled requests session
+
+    :param pool_connections: Number of host pools to cache
+    :param pool_maxsize: Max connections kept per host
+    :param pool_block: Wait for a free connection instead of opening an extra one
+    :param keep_alive: Reuse connections between requests
+    """
+    import requests
+    import requests.adapters
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+class RequestsTransport:
+    """
+    Transport based on requests (HTTP/1.1, one connection per concurrent request)
+    """
+
+    def __init__(self, pool_connections = 10, pool_maxsize = 10, pool_block = False, keep_alive = True,
+                 session = None):
+        """
+        :param pool_connections: (Int, Optional, default=10) Number of host pools to cache
+        :param pool_maxsize: (Int, Optional, default=10) Max connections kept per host
+        :param pool_block: (Bool, Optional, default=False) Wait for a free connection instead of opening an extra one
+        :param keep_alive: (Bool, Optional, default=True) Reuse connections between requests
+        :param session: (Optional) External requests.Session to use (it is not closed by close())
+        """
+        self.own_session = session is None
+        self.session = session or _create_session(pool_connections, pool_maxsize, pool_block, keep_alive)
+
+    def post(self, url, data, timeout = None, timed = False):
+        """
+        Send POST request with form data
+
+        :param url: Request URL
+        :param data: Dict of form fields
+        :param timeout: (Optional) Request timeout (seconds or (connect, read) tuple)
+        :param timed: (Bool, Optional, default=False) Measure time until response headers
+        :return: Response
+        """
+        if not timed:
+            base_resp = self.session.post(url, data=data, timeout=timeout)
+            return Response(base_resp.status_code, base_resp.content)
+        start = perf_counter()
+        # Body is read separately to split waiting and transfer time
+        base_resp = self.session.post(url, data=data, timeout=timeout, stream=True)
+        wait = perf_counter() - start
+        return Response(base_resp.status_code, base_resp.content, wait)
+
+    def close(self):
+        if self.own_session:
+            self.session.close()
+
+
+class Urllib3Transport:
+    """
+    Transport based on urllib3 connection pool (HTTP/1.1, less overhead per request than requests)
+    """
+
+    def __init__(self, pool_maxsize = 10, pool_block = False, keep_alive = True):
+        """
+        :param pool_maxsize: (Int, Optional, default=10) Max connections kept per host
+        :param pool_block: (Bool, Optional, default=False) Wait for a free connection instead of opening an extra one
+        :param keep_alive: (Bool, Optional, default=True) Reuse connections between requests
+        """
+        import urllib3
+
+        self.urllib3 = urllib3
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if not keep_alive:
+            headers["Connection"] = "close"
+        self.pool = urllib3.PoolManager(maxsize=pool_maxsize, block=pool_block, headers=headers)
+
+    def post(self, url, data, timeout = None, timed = False):
+        """
+        Send POST request with form data
+
+        :param url: Request URL
+        :param data: Dict of form fields
+        :param timeout: (Optional) Request timeout (seconds or (connect, read) tuple)
+        :param timed: (Bool, Optional, default=False) Measure time until response headers
+        :return: Response
+        """
+        body = urllib.parse.urlencode(data)
+        if timeout is None:
+            timeout = self.urllib3.Timeout.DEFAULT_TIMEOUT
+        elif isinstance(timeout, tuple):
+            timeout = self.urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        if not timed:
+            base_resp = self.pool.request("POST", url, body=body, timeout=timeout, retries=False)
+            return Response(base_resp.status, base_resp.data)
+        start = perf_counter()
+        base_resp = self.pool.request("POST", url, body=body, timeout=timeout, retries=False, preload_content=False)
+        wait = perf_counter() - start
+        content = base_resp.read()
+        base_resp.release_conn()
+        return Response(base_resp.status, content, wait)
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxTransport:
+    """
+    Transport based on httpx async client running in a background event loop thread.
+    With HTTP/2 concurrent requests from many threads are multiplexed over one connection per host.
+    Requires httpx with HTTP/2 support (pip install httpx[http2])
+    """
+
+    def __init__(self, http2 = True, http1 = True, pool_maxsize = 10, keep_alive = True):
+        """
+        :param http2: (Bool, Optional, default=True) Use HTTP/2 when server supports it (negotiated over TLS)
+        :param http1: (Bool, Optional, default=True) Allow HTTP/1.1 (False - HTTP/2 by prior knowledge, also without TLS)
+        :param pool_maxsize: (Int, Optional, default=10) Max connections kept per host
+        :param keep_alive: (Bool, Optional, default=True) Reuse connections between requests
+        """
+        import asyncio
+        import httpx
+
+        self.httpx = httpx
+        self.asyncio = asyncio
+        limits = httpx.Limits(max_connections=pool_maxsize,
+                              max_keepalive_connections=pool_maxsize if keep_alive else 0)
+        # Sync httpx client does not keep HTTP/2 stream order when used from many threads,
+        # so requests are made by one async client in its own loop
+        self.client = httpx.AsyncClient(http1=http1, http2=http2, limits=limits)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def __run(self, coro):
+        return self.asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def __post(self, url, data, timeout, timed):
+        if isinstance(timeout, tuple):
+            timeout = self.httpx.Timeout(timeout[1], connect=timeout[0])
+        if not timed:
+            base_resp = await self.client.post(url, data=data, timeout=timeout)
+            return Response(base_resp.status_code, base_resp.content)
+        start = perf_counter()
+        request = self.client.build_request("POST", url, data=data, timeout=timeout)
+        base_resp = await self.client.send(request, stream=True)
+        wait = perf_counter() - start
+        try:
+            content = await base_resp.aread()
+        finally:
+            await base_resp.aclose()
+        return Response(base_resp.status_code, content, wait)
+
+    def post(self, url, data, timeout = None, timed = False):
+        """
+        Send POST request with form data
+
+        :param url: Request URL
+        :param data: Dict of form fields
+        :param timeout: (Optional) Request timeout (seconds or (connect, read) tuple)
+        :param timed: (Bool, Optional, default=False) Measure time until response headers
+        :return: Response
+        """
+        return self.__run(self.__post(url, data, timeout, timed))
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.__run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class FakeTransport:
+    """
+    In-memory transport for tests: requests are passed to handler without network,
+    e.g. FakeTransport(PayokSimulator(...).handle)
+    """
+
+    def __init__(self, handler):
+        """
+        :param handler: Function(method, form) returning tuple (HTTP status code, response dict or bytes)
+        """
+        self.handler = handler
+        self.requests = []
+
+    def post(self, url, data, timeout = None, timed = False):
+        """
+        Pass request to handler
+
+        :param url: Request URL (API method is its last part)
+        :param data: Dict of form fields
+        :param timeout: (Optional) Ignored
+        :param timed: (Bool, Optional, default=False) Measure time until response
+        :return: Response
+        """
+        method = url.rstrip("/").rsplit("/", 1)[-1]
+        # Same form values as received by a server
+        form = {key: str(value) for key, value in data.items()}
+        self.requests.append((method, form))
+        start = perf_counter()
+        status_code, resp = self.handler(method, form)
+        wait = perf_counter() - start if timed else None
+        content = resp if isinstance(resp, bytes) else json.dumps(resp).encode("utf-8")
+        return Response(status_code, content, wait)
+
+    def close(self):
+        pass
+
+
+def create_transport(name = "requests", pool_connections = 10, pool_maxsize = 10, pool_block = False,
+                     keep_alive = True):
+    """
+    Create transport by name with common connection pool settings
+
+    :param name: (Optional, default="requests") "requests", "urllib3" or "httpx" (HTTP/2)
+    :param pool_connections: (Int, Optional, default=10) Number of host pools to cache (requests only)
+    :param pool_maxsize: (Int, Optional, default=10) Max connections kept per host
+    :param pool_block: (Bool, Optional, default=False) Wait for a free connection (requests and urllib3)
+    :param keep_alive: (Bool, Optional, default=True) Reuse connections between requests
+    """
+    if name == "requests":
+        return RequestsTransport(pool_connections, pool_maxsize, pool_block, keep_alive)
+    if name == "urllib3":
+        return Urllib3Transport(pool_maxsize, pool_block, keep_alive)
+    if name == "httpx":
+        return HttpxTransport(pool_maxsize=pool_maxsize, keep_alive=keep_alive)
+    raise ValueError("Unknown transport: {}".format(name))
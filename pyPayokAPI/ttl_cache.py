@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class TTLCache:
+    """
+    Thread-safe bounded LRU cache with per-entry TTL and single-flight loading:
+    concurrent requests for the same missing key wait for one loader call.
+    """
+
+    def __init__(self, maxsize = 1024):
+        """
+        :param maxsize: (Int, Optional, default=1024) Max number of cached entries
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.flights = {}
+        self.generation = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, loader, ttl, timeout = None):
+        """
+        Returns cached value or loads it with loader (once for all concurrent callers).
+
+        :param key: Cache key (hashable)
+        :param loader: Function() returning value to cache
+        :param ttl: (Float) Time to live of loaded value (seconds)
+        :param timeout: (Float, Optional) Max time to wait for load started by another caller
+            (concurrent.futures.TimeoutError is raised), None - no limit
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self.flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                # Imported on first miss: concurrent.futures is slow to import
+                from concurrent.futures import Future
+                flight = self.flights[key] = Future()
+                generation = self.generation
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            return flight.result(timeout)
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self.lock:
+                del self.flights[key]
+            flight.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.flights[key]
+            if generation == self.generation:
+                # Not invalidated while loading
+                self.entries[key] = (monotonic() + ttl, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        flight.set_result(value)
+        return value
+
+    def invalidate(self, match = None):
+        """
+        Drop cached entries
+
+        :param match: (Optional) Function(key) returning True for keys to drop (None - drop all)
+        """
+        with self.lock:
+            self.generation += 1
+            if match is None:
+                self.entries.clear()
+            else:
+                for key in [key for key in self.entries if match(key)]:
+                    del self.entries[key]
+
+    def stats(self):
+        """
+        Returns dict with hits, misses, coalesced (requests served by in-flight load) and size counters
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self.entries),
+            }
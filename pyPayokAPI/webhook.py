@@ -0,0 +1,292 @@
+import hashlib
+import hmac
+import queue
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+from .api import pyPayokAPIException
+from .payok_types import Record, parse_datetime
+
+
+class Notification(Record):
+    """
+    Payment notification sent by PayOK to shop notification URL
+    """
+    __slots__ = (
+        "num", "payment_id", "shop", "amount", "profit", "desc", "currency", "currency_amount",
+        "sign", "email", "date", "method", "custom", "extra")
+
+    def __init__(self):
+        self.num = None
+        self.payment_id = None
+        self.shop = None
+        self.amount = None
+        self.profit = None
+        self.desc = None
+        self.currency = None
+        self.currency_amount = None
+        self.sign = None
+        self.email = None
+        self.date = None
+        self.method = None
+        self.custom = None
+        self.extra = {}
+
+
+Notification.schema = (
+    ("payment_id", None),
+    ("shop", None),
+    ("amount", float),
+    ("profit", lambda value: float(value) if value not in (None, "") else None),
+    ("desc", None),
+    ("currency", None),
+    ("currency_amount", lambda value: float(value) if value not in (None, "") else None),
+    ("sign", None),
+    ("email", None),
+    ("date", lambda value: parse_datetime(value) if value else None),
+    ("method", None),
+    ("custom", None),
+)
+Notification.field_names = frozenset(name for name, _ in Notification.schema)
+
+
+def normalize_form(form):
+    """
+    Convert notification form to flat dict: list values (parse_qs) are reduced to the first item,
+    "custom[key]" fields are collected to "custom" dict.
+
+    :param form: Dict of form fields or list of (key, value) pairs
+    """
+    items = form.items() if isinstance(form, dict) else form
+    data = {}
+    custom = {}
+    for key, value in items:
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else ""
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        if key.startswith("custom[") and key.endswith("]"):
+            custom[key[7:-1]] = value
+        else:
+            data[key] = value
+    if custom:
+        data["custom"] = custom
+    return data
+
+
+def notification_sign(secret_key, data):
+    """
+    Calculate notification signature: MD5 of "secret_key|desc|currency|shop|payment_id|amount"
+
+    :param secret_key: Shop secret key
+    :param data: Normalized notification form
+    """
+    sign_data = [
+        secret_key,
+        data.get("desc", ""),
+        data.get("currency", ""),
+        data.get("shop", ""),
+        data.get("payment_id", ""),
+        data.get("amount", ""),
+    ]
+    return hashlib.md5("|".join(map(str, sign_data)).encode("utf-8")).hexdigest()
+
+
+def verify_notification(form, secret_key):
+    """
+    Check notification signature (constant-time comparison)
+
+    :param form: Notification form
+    :param secret_key: Shop secret key
+    :return: True if signature is valid
+    """
+    data = normalize_form(form)
+    sign = str(data.get("sign", ""))
+    return hmac.compare_digest(notification_sign(secret_key, data).encode("ascii"), sign.encode("utf-8"))
+
+
+def parse_notification(form, secret_key):
+    """
+    Verify notification form and convert it to Notification.
+
+    :param form: Notification form (dict or list of pairs, as parsed by any web framework)
+    :param secret_key: Shop secret key
+    :return: Notification
+    """
+    data = normalize_form(form)
+    if not secret_key:
+        raise pyPayokAPIException(-7, "No secret key provided for notification check")
+    if not verify_notification(data, secret_key):
+        raise pyPayokAPIException(-9, "Notification signature mismatch")
+    return Notification.de_json(data, 1)
+
+
+class WebhookReceiver:
+    """
+    Framework-agnostic notification receiver.
+    Can be used directly as WSGI application, "receiver.asgi" is ASGI application.
+    Verified notifications are deduplicated by payment ID and passed to handler
+    (in request thread or, if queue_size is set, in worker threads).
+    """
+
+    def __init__(self, secret_key, handler, queue_size = 0, workers = 1, dedupe_size = 10000,
+                 on_error = None, print_errors = False, max_body = 65536):
+        """
+        :param secret_key: Shop secret key
+        :param handler: Function(Notification) called for each new verified notification
+        :param queue_size: (Int, Optional, default=0) Size of bounded queue for worker threads (0 - call handler inline)
+        :param workers: (Int, Optional, default=1) Number of worker threads (used with queue_size)
+        :param dedupe_size: (Int, Optional, default=10000) Number of recent payment IDs remembered for deduplication
+        :param on_error: (Optional) Function(Notification, Exception) called when handler fails in worker thread
+        :param print_errors: (Bool, Optional, default=False) Print handler errors of worker threads (without on_error)
+        :param max_body: (Int, Optional, default=65536) Max request body size in bytes, larger requests are
+            rejected with 413 (WSGI and ASGI applications)
+        """
+        self.secret_key = secret_key
+        self.handler = handler
+        self.on_error = on_error
+        self.print_errors = print_errors
+        self.max_body = max_body
+        self.dedupe_size = dedupe_size
+        self.seen = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(queue_size) if queue_size else None
+        self.threads = []
+        if self.queue is not None:
+            for _ in range(max(1, workers)):
+                thread = threading.Thread(target=self.__worker, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def close(self, timeout = None):
+        """
+        Stop worker threads after queued notifications are handled
+
+        :param timeout: (Optional) Max time to wait for each worker
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def __worker(self):
+        while True:
+            notification = self.queue.get()
+            if notification is None:
+                return
+            try:
+                self.handler(notification)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(notification, e)
+                elif self.print_errors:
+                    print("Notification handler failed: {}".format(e))
+
+    def __remember(self, key):
+        # Returns False if payment was already seen
+        with self.lock:
+            if key in self.seen:
+                self.seen.move_to_end(key)
+                return False
+            self.seen[key] = True
+            if len(self.seen) > self.dedupe_size:
+                self.seen.popitem(last=False)
+            return True
+
+    def __forget(self, key):
+        with self.lock:
+            self.seen.pop(key, None)
+
+    def process(self, form):
+        """
+        Process notification form.
+
+        :param form: Notification form
+        :return: tuple (HTTP status code, response body)
+        """
+        try:
+            notification = parse_notification(form, self.secret_key)
+        except pyPayokAPIException as pe:
+            return 403, pe.message
+        except (TypeError, ValueError) as e:
+            return 400, "Bad notification: {}".format(e)
+        key = (notification.shop, notification.payment_id)
+        if not self.__remember(key):
+            # Duplicate notification
+            return 200, "OK"
+        if self.queue is None:
+            try:
+                self.handler(notification)
+            except Exception:
+                self.__forget(key)
+                raise
+        else:
+            try:
+                self.queue.put_nowait(notification)
+            except queue.Full:
+                self.__forget(key)
+                return 503, "Busy"
+        return 200, "OK"
+
+    @staticmethod
+    def __status_line(status):
+        return {200: "200 OK", 400: "400 Bad Request", 403: "403 Forbidden", 405: "405 Method Not Allowed",
+                413: "413 Payload Too Large", 503: "503 Service Unavailable"}[status]
+
+    def __call__(self, environ, start_response):
+        """
+        WSGI application
+        """
+        if environ.get("REQUEST_METHOD") == "POST":
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                length = 0
+            if length > self.max_body:
+                status, message = 413, "Request body too large"
+            else:
+                body = environ["wsgi.input"].read(length) if length else b""
+                status, message = self.process(urllib.parse.parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+        else:
+            status, message = 405, "Method not allowed"
+        body = message.encode("utf-8")
+        start_response(self.__status_line(status), [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+        ])
+        return [body]
+
+    async def asgi(self, scope, receive, send):
+        """
+        ASGI application (HTTP only)
+        """
+        if scope["type"] != "http":
+            return
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                # Rest of the body is not read
+                break
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        if scope.get("method") != "POST":
+            status, message = 405, "Method not allowed"
+        elif size > self.max_body:
+            status, message = 413, "Request body too large"
+        else:
+            body = b"".join(chunks)
+            status, message = self.process(urllib.parse.parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+        body = message.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
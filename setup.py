@@ -20,6 +20,13 @@ setup(name='pyPayokAPI',
       url='https://github.com/Badiboy/pyPayokAPI',
       packages=['pyPayokAPI'],
       requires=['requests', 'hashlib', 'urllib'],
+      extras_require={
+          'async': ['httpx'],
+          'numpy': ['numpy'],
+          'fast': ['orjson'],
+          'parquet': ['pyarrow'],
+          'http2': ['httpx[http2]'],
+      },
       license='MIT license',
       keywords="Payok Pay API",
       classifiers=[